@@ -134,9 +134,12 @@ if (mskClusterArn) {
     mtlsSecretArn: authStack.secretArn,
     firehoseStreamName: deliveryStack.deliveryStream.deliveryStreamName || 'lm-datapublisher-delivery',
     firehoseStreamArn: deliveryStack.deliveryStream.attrArn,
+    spillBucket: storageStack.bucket,
+    spillKmsKey: storageStack.kmsKey,
   });
   pipeStack.addDependency(authStack);
   pipeStack.addDependency(deliveryStack);
+  pipeStack.addDependency(storageStack);
 
   // Operational alarms
   new AlarmsStack(app, 'LMDataPublisherAlarmsStack', {
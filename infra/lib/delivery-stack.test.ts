@@ -84,6 +84,23 @@ describe('DeliveryStack', () => {
     });
   });
 
+  test('De-aggregates multi-row JSON records before loading', () => {
+    template.hasResourceProperties('AWS::KinesisFirehose::DeliveryStream', {
+      SnowflakeDestinationConfiguration: Match.objectLike({
+        ProcessingConfiguration: {
+          Enabled: true,
+          Processors: [{
+            Type: 'RecordDeAggregation',
+            Parameters: [{
+              ParameterName: 'SubRecordType',
+              ParameterValue: 'JSON',
+            }],
+          }],
+        },
+      }),
+    });
+  });
+
   test('Configures Secrets Manager for Snowflake auth', () => {
     template.hasResourceProperties('AWS::KinesisFirehose::DeliveryStream', {
       SnowflakeDestinationConfiguration: Match.objectLike({
@@ -75,6 +75,20 @@ export class DeliveryStack extends cdk.Stack {
         dataLoadingOption: 'JSON_MAPPING',
         roleArn: firehoseRole.roleArn,
 
+        // Split aggregated records back into rows: the fan-out Lambda may pack
+        // many newline-delimited JSON rows into one record (AGGREGATE_BYTES).
+        // A single-row record de-aggregates to itself, so this is always safe.
+        processingConfiguration: {
+          enabled: true,
+          processors: [{
+            type: 'RecordDeAggregation',
+            parameters: [{
+              parameterName: 'SubRecordType',
+              parameterValue: 'JSON',
+            }],
+          }],
+        },
+
         // Snowflake auth via Secrets Manager (key-pair)
         secretsManagerConfiguration: {
           enabled: true,
@@ -3,8 +3,10 @@
 
 import * as path from 'path';
 import * as cdk from 'aws-cdk-lib';
+import * as ssm from 'aws-cdk-lib/aws-ssm';
 import { Template, Match } from 'aws-cdk-lib/assertions';
 import { PipeStack } from './pipe-stack';
+import { StorageStack } from './storage-stack';
 import { applyNagChecks, assertNoHighFindings } from './nag-test-helper';
 
 describe('PipeStack', () => {
@@ -103,6 +105,23 @@ describe('PipeStack', () => {
     });
   });
 
+  test('Lambda reports partial batch failures to the Pipe', () => {
+    template.hasResourceProperties('AWS::Lambda::Function', {
+      Environment: Match.objectLike({
+        Variables: Match.objectLike({
+          REPORT_BATCH_ITEM_FAILURES: 'true',
+        }),
+      }),
+    });
+    template.hasResourceProperties('AWS::Pipes::Pipe', {
+      TargetParameters: {
+        LambdaFunctionParameters: {
+          InvocationType: 'REQUEST_RESPONSE',
+        },
+      },
+    });
+  });
+
   test('Lambda has firehose:PutRecordBatch permission', () => {
     template.hasResourceProperties('AWS::IAM::Policy', {
       PolicyDocument: Match.objectLike({
@@ -166,3 +185,103 @@ describe('PipeStack', () => {
     assertNoHighFindings(stack);
   });
 });
+
+// Key patterns (bucket ARN stripped) the stack's IAM policies allow s3:PutObject on
+function putObjectKeyPatterns(template: Template): string[] {
+  const patterns: string[] = [];
+  for (const policy of Object.values(template.findResources('AWS::IAM::Policy'))) {
+    for (const statement of policy.Properties.PolicyDocument.Statement) {
+      if (![statement.Action].flat().includes('s3:PutObject')) {
+        continue;
+      }
+      for (const resource of [statement.Resource].flat()) {
+        const parts: unknown[] = resource['Fn::Join'] ? resource['Fn::Join'][1] : [resource];
+        patterns.push(parts.filter((part) => typeof part === 'string').join(''));
+      }
+    }
+  }
+  return patterns;
+}
+
+describe('PipeStack with S3 spill', () => {
+  test('Lambda gets the spill bucket and may only put under its prefixes', () => {
+    const app = new cdk.App();
+    const env = { account: '123456789012', region: 'us-east-1' };
+    const storageStack = new StorageStack(app, 'TestStorageStack', { env });
+    const stack = new PipeStack(app, 'TestSpillPipeStack', {
+      env,
+      mskClusterArn: 'arn:aws:kafka:us-east-1:123456789012:cluster/test-cluster/abc-123',
+      mskTopic: 'lm.metrics.otlp',
+      mtlsSecretArn: 'arn:aws:secretsmanager:us-east-1:123456789012:secret:test-mtls-abc123',
+      firehoseStreamName: 'lm-datapublisher-delivery',
+      firehoseStreamArn: 'arn:aws:firehose:us-east-1:123456789012:deliverystream/lm-datapublisher-delivery',
+      spillBucket: storageStack.bucket,
+      spillKmsKey: storageStack.kmsKey,
+    });
+    const template = Template.fromStack(stack);
+
+    template.hasResourceProperties('AWS::Lambda::Function', {
+      Environment: Match.objectLike({
+        Variables: Match.objectLike({
+          SPILL_BUCKET: Match.anyValue(),
+          SPILL_PREFIX: 'spill/',
+          UNDECODABLE_PREFIX: 'undecodable/',
+          VALIDATION_PREFIX: 'invalid/',
+        }),
+      }),
+    });
+    template.hasResourceProperties('AWS::IAM::Policy', {
+      PolicyDocument: Match.objectLike({
+        Statement: Match.arrayWith([
+          Match.objectLike({
+            Action: Match.arrayWith(['s3:PutObject']),
+            Effect: 'Allow',
+          }),
+          Match.objectLike({
+            Action: Match.arrayWith(['kms:GenerateDataKey']),
+            Effect: 'Allow',
+          }),
+        ]),
+      }),
+    });
+    // Every prefix the Lambda writes to (spill, undecodable records, validation sidecar) is granted
+    expect(putObjectKeyPatterns(template).sort()).toEqual(['/invalid/*', '/spill/*', '/undecodable/*']);
+  });
+});
+
+describe('PipeStack with a remote spec', () => {
+  test('Lambda reads the spec parameter on a TTL', () => {
+    const app = new cdk.App();
+    const env = { account: '123456789012', region: 'us-east-1' };
+    const sharedStack = new cdk.Stack(app, 'TestSharedStack', { env });
+    const stack = new PipeStack(app, 'TestSpecPipeStack', {
+      env,
+      mskClusterArn: 'arn:aws:kafka:us-east-1:123456789012:cluster/test-cluster/abc-123',
+      mskTopic: 'lm.metrics.otlp',
+      mtlsSecretArn: 'arn:aws:secretsmanager:us-east-1:123456789012:secret:test-mtls-abc123',
+      firehoseStreamName: 'lm-datapublisher-delivery',
+      firehoseStreamArn: 'arn:aws:firehose:us-east-1:123456789012:deliverystream/lm-datapublisher-delivery',
+      specParameter: ssm.StringParameter.fromStringParameterName(sharedStack, 'Spec', '/lmdp/spec'),
+    });
+    const template = Template.fromStack(stack);
+
+    template.hasResourceProperties('AWS::Lambda::Function', {
+      Environment: Match.objectLike({
+        Variables: Match.objectLike({
+          SPEC_SOURCE: 'ssm:/lmdp/spec',
+          SPEC_TTL_SECONDS: '60',
+        }),
+      }),
+    });
+    template.hasResourceProperties('AWS::IAM::Policy', {
+      PolicyDocument: Match.objectLike({
+        Statement: Match.arrayWith([
+          Match.objectLike({
+            Action: Match.arrayWith(['ssm:GetParameter']),
+            Effect: 'Allow',
+          }),
+        ]),
+      }),
+    });
+  });
+});
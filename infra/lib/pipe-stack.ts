@@ -5,7 +5,10 @@ import * as path from 'path';
 import * as cdk from 'aws-cdk-lib';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as iam from 'aws-cdk-lib/aws-iam';
+import * as kms from 'aws-cdk-lib/aws-kms';
+import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as sqs from 'aws-cdk-lib/aws-sqs';
+import * as ssm from 'aws-cdk-lib/aws-ssm';
 import * as logs from 'aws-cdk-lib/aws-logs';
 import * as pipes from 'aws-cdk-lib/aws-pipes';
 import { Construct } from 'constructs';
@@ -16,6 +19,13 @@ export interface PipeStackProps extends cdk.StackProps {
   readonly mtlsSecretArn: string;
   readonly firehoseStreamName: string;
   readonly firehoseStreamArn: string;
+  // Optional S3 spill target for rows Firehose never accepts (the error/backup bucket)
+  readonly spillBucket?: s3.IBucket;
+  readonly spillKmsKey?: kms.IKey;
+  // Optional hot-reloadable spec: an S3 object or SSM parameter holding the spec artifact
+  readonly specBucket?: s3.IBucket;
+  readonly specObjectKey?: string;
+  readonly specParameter?: ssm.IStringParameter;
 }
 
 export class PipeStack extends cdk.Stack {
@@ -25,6 +35,14 @@ export class PipeStack extends cdk.Stack {
   constructor(scope: Construct, id: string, props: PipeStackProps) {
     super(scope, id, props);
 
+    const specObjectKey = props.specObjectKey ?? 'spec/spec_artifact.json';
+    let specSource: string | undefined;
+    if (props.specBucket) {
+      specSource = `s3://${props.specBucket.bucketName}/${specObjectKey}`;
+    } else if (props.specParameter) {
+      specSource = `ssm:${props.specParameter.parameterName}`;
+    }
+
     // SQS dead-letter queue for failed pipe source invocations
     const dlq = new sqs.Queue(this, 'PipeDLQ', {
       queueName: 'lm-datapublisher-pipe-dlq',
@@ -50,9 +68,40 @@ export class PipeStack extends cdk.Stack {
       environment: {
         FIREHOSE_STREAM_NAME: props.firehoseStreamName,
         BATCH_SIZE: '500',
+        // Return batchItemFailures so the Pipe retries only records with undelivered rows
+        REPORT_BATCH_ITEM_FAILURES: 'true',
+        ...(props.spillBucket ? {
+          SPILL_BUCKET: props.spillBucket.bucketName,
+          SPILL_PREFIX: 'spill/',
+          UNDECODABLE_PREFIX: 'undecodable/',
+          VALIDATION_PREFIX: 'invalid/',
+        } : {}),
+        // Re-read the spec on a TTL so promotions change without a redeploy
+        ...(specSource ? {
+          SPEC_SOURCE: specSource,
+          SPEC_TTL_SECONDS: '60',
+        } : {}),
       },
     });
 
+    // Grant Lambda permission to spill undelivered rows, undecodable records and
+    // rows failing validation (the sidecar) to the error bucket
+    if (props.spillBucket) {
+      props.spillBucket.grantPut(this.fanoutLambda, 'spill/*');
+      props.spillBucket.grantPut(this.fanoutLambda, 'undecodable/*');
+      props.spillBucket.grantPut(this.fanoutLambda, 'invalid/*');
+    }
+    if (props.spillKmsKey) {
+      props.spillKmsKey.grant(this.fanoutLambda, 'kms:GenerateDataKey', 'kms:Encrypt');
+    }
+
+    // Grant Lambda permission to read the hot-reloadable spec
+    if (props.specBucket) {
+      props.specBucket.grantRead(this.fanoutLambda, specObjectKey);
+    } else if (props.specParameter) {
+      props.specParameter.grantRead(this.fanoutLambda);
+    }
+
     // Grant Lambda permission to write to Firehose
     this.fanoutLambda.addToRolePolicy(new iam.PolicyStatement({
       effect: iam.Effect.ALLOW,
@@ -124,6 +173,7 @@ export class PipeStack extends cdk.Stack {
       },
       target: this.fanoutLambda.functionArn,
       targetParameters: {
+        // Synchronous invocation: the Pipe reads the batchItemFailures partial response
         lambdaFunctionParameters: {
           invocationType: 'REQUEST_RESPONSE',
         },
@@ -0,0 +1,69 @@
+# ABOUTME: JSON codec backends for decoding Kafka values and encoding row events
+# ABOUTME: stdlib json, or orjson for parsing when installed; JSON_CODEC selects one at import
+
+import json
+import os
+from typing import Any
+
+
+class StdlibCodec:
+    """JSON through the standard library's C-accelerated json module."""
+
+    name = "stdlib"
+
+    def __init__(self):
+        # Bound as attributes so hot loops pay no method dispatch
+        self.loads = json.loads
+        self.dumps = json.dumps
+
+
+class OrjsonCodec:
+    """
+    JSON parsing through orjson, which reads UTF-8 bytes without a str copy.
+
+    Encoding stays on the stdlib encoder: orjson writes compact separators,
+    raw UTF-8 instead of \\u escapes and a different float exponent style
+    (1e-5 rather than 1e-05), so its rows would not be byte-identical to
+    what Snowflake has been loading.
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        """
+        Raises:
+            ImportError: If orjson is not installed
+        """
+        import orjson
+
+        self.loads = orjson.loads
+        self.dumps = json.dumps
+
+
+def get_codec(name: str = "auto") -> Any:
+    """
+    Build the JSON codec backend for a JSON_CODEC setting.
+
+    Args:
+        name: "stdlib", "orjson", or "auto" (orjson when installed, else stdlib)
+
+    Returns:
+        Codec with loads(bytes | str) and dumps(obj) -> str
+
+    Raises:
+        ValueError: If name is not a known backend
+    """
+    if name == "stdlib":
+        return StdlibCodec()
+    if name not in ("auto", "orjson"):
+        raise ValueError(f"Unknown JSON_CODEC {name!r}; use auto, stdlib or orjson")
+    try:
+        return OrjsonCodec()
+    except ImportError:
+        if name == "orjson":
+            print("Warning: JSON_CODEC=orjson but orjson is not installed; using stdlib json")
+        return StdlibCodec()
+
+
+# Selected once at import for the life of the container
+CODEC = get_codec(os.environ.get("JSON_CODEC", "auto").lower())
@@ -1,54 +1,345 @@
 # ABOUTME: OTLP bundle to row events flattener (1-to-N transformation)
 # ABOUTME: Pure function with no AWS dependencies for transforming OTLP bundles into row events
 
-from typing import Dict, List, Any, Optional
+import json
+from collections import OrderedDict
+from collections.abc import Mapping
+from operator import attrgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple, Union
 from datetime import datetime, timezone
 
+from codec import CODEC
+from attribute_shapes import DEFAULT_MAX_SHAPES, AttributeShapes
+from interning import StringInterner
+from resource_cache import ResourceCache
+from timestamps import RFC3339, nanos_to_ms
 
-def flatten_otlp(otlp_bundle: Dict[str, Any], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+_INF = float("inf")
+
+# Default LMDP layout: row field <- resource attribute, and the datapoint
+# attributes tried (in order) for the instance name
+DEFAULT_RESOURCE_PROMOTIONS = (("orgId", "orgId"), ("deviceId", "hostId"), ("deviceName", "hostName"))
+DEFAULT_INSTANCE_ATTRIBUTES = ("dataSourceInstanceName", "wildValue")
+
+# Row fields with a fixed source; resource promotions may not target them
+_STRUCTURAL_FIELDS = frozenset({
+    "metric", "type", "value", "ts", "tsUnixMs", "datasource", "instance", "unit",
+    "attributes", "resource", "scope",
+})
+
+
+def _coerce_string(value: Any) -> str:
+    """Coerce a promoted attribute value to the spec's string type."""
+    if type(value) is str:
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+# Spec field type -> coercion applied to promoted values of that type
+_COERCIONS: Dict[str, Callable[[Any], Any]] = {"string": _coerce_string}
+
+
+class FlattenPlan:
+    """
+    Compiled row-event layout, built once from the spec and executed per datapoint.
+
+    resource_promotions maps row fields to the resource attributes they are
+    promoted from; those attributes (plus resource_exclusions) are left out of
+    the row's "resource" object. The first of instance_attributes present on a
+    datapoint becomes "instance"; all of them (plus attribute_exclusions) are
+    left out of "attributes". coercions maps promoted row fields to the
+    function converting their values to the spec type. field_order is the key
+    order of an emitted row. attribute_shapes holds the datapoint attribute
+    extractors generated for this layout.
+    """
+
+    def __init__(
+        self,
+        resource_promotions: Iterable[Tuple[str, str]] = DEFAULT_RESOURCE_PROMOTIONS,
+        instance_attributes: Iterable[str] = DEFAULT_INSTANCE_ATTRIBUTES,
+        resource_exclusions: Iterable[str] = (),
+        attribute_exclusions: Iterable[str] = (),
+        field_types: Optional[Dict[str, str]] = None,
+        max_attribute_shapes: int = DEFAULT_MAX_SHAPES,
+    ):
+        """
+        Args:
+            resource_promotions: (row field, resource attribute) pairs, in row order
+            instance_attributes: Datapoint attributes tried in order for "instance"
+            resource_exclusions: Extra resource attributes dropped from "resource"
+            attribute_exclusions: Extra datapoint attributes dropped from "attributes"
+            field_types: Spec type of each row field, used to pick coercions
+            max_attribute_shapes: Most attribute extractors generated (0 disables them)
+
+        Raises:
+            ValueError: If a promotion targets a structural row field
+        """
+        self.resource_promotions = tuple((field, source) for field, source in resource_promotions)
+        for field, _ in self.resource_promotions:
+            if field in _STRUCTURAL_FIELDS:
+                raise ValueError(f"Cannot promote a resource attribute to row field {field!r}")
+
+        self.instance_attributes = tuple(instance_attributes)
+        self.resource_exclusions = frozenset(
+            source for _, source in self.resource_promotions
+        ) | frozenset(resource_exclusions)
+        self.attribute_exclusions = frozenset(self.instance_attributes) | frozenset(
+            attribute_exclusions
+        )
+
+        promoted_fields = [field for field, _ in self.resource_promotions]
+        promoted_fields += ["datasource", "instance"]
+        self.coercions = {
+            field: _COERCIONS[field_type]
+            for field, field_type in (field_types or {}).items()
+            if field in promoted_fields and field_type in _COERCIONS
+        }
+
+        self.field_order = (
+            ("metric", "type", "value", "ts", "tsUnixMs")
+            + tuple(promoted_fields)
+            + ("unit", "attributes", "resource", "scope")
+        )
+
+        self.attribute_shapes = AttributeShapes(
+            self.instance_attributes,
+            self.attribute_exclusions,
+            self.coercions.get("instance"),
+            max_shapes=max_attribute_shapes,
+        )
+
+
+def compile_flatten_plan(schema: Dict[str, Any]) -> FlattenPlan:
+    """
+    Compile a row-event schema into a FlattenPlan.
+
+    The optional "flatten" section of the schema overrides the default LMDP
+    layout:
+
+        flatten:
+          resource_promotions: {orgId: orgId, deviceId: hostId, deviceName: hostName}
+          instance_attributes: [dataSourceInstanceName, wildValue]
+          resource_exclusions: []
+          attribute_exclusions: []
+
+    Args:
+        schema: Row Event schema specification (as returned by SpecLoader)
+
+    Returns:
+        FlattenPlan for the schema
+    """
+    layout = schema.get("flatten") or {}
+    promotions = layout.get("resource_promotions")
+    field_types = {
+        field["name"]: field["type"]
+        for field in schema.get("fields", [])
+        if "name" in field and "type" in field
+    }
+    return FlattenPlan(
+        resource_promotions=(
+            tuple(promotions.items()) if promotions else DEFAULT_RESOURCE_PROMOTIONS
+        ),
+        instance_attributes=layout.get("instance_attributes") or DEFAULT_INSTANCE_ATTRIBUTES,
+        resource_exclusions=layout.get("resource_exclusions") or (),
+        attribute_exclusions=layout.get("attribute_exclusions") or (),
+        field_types=field_types,
+    )
+
+
+# Plans compiled from spec dicts, keyed by id (the spec is kept to pin the id).
+# Bounded so specs swapped in over a warm container's life are released.
+_MAX_COMPILED_PLANS = 8
+_compiled_plans: "OrderedDict[int, Tuple[Dict[str, Any], FlattenPlan]]" = OrderedDict()
+
+
+def _plan_for(spec: Union[Dict[str, Any], FlattenPlan]) -> FlattenPlan:
+    """Return spec if it is already a plan, else its compiled plan (compiled once per spec)."""
+    if isinstance(spec, FlattenPlan):
+        return spec
+    cached = _compiled_plans.get(id(spec))
+    if cached is None or cached[0] is not spec:
+        cached = _compiled_plans[id(spec)] = (spec, compile_flatten_plan(spec))
+        while len(_compiled_plans) > _MAX_COMPILED_PLANS:
+            _compiled_plans.popitem(last=False)
+    _compiled_plans.move_to_end(id(spec))
+    return cached[1]
+
+
+class RowEvent(Mapping):
+    """
+    One row event, stored in slots and read through a mapping view.
+
+    The promoted resource fields, "resource" and "scope" come from resource
+    and scope table entries (see _resource_entry and _scope_entry) shared by
+    every row of that resource or scope, with their JSON pre-rendered. A row
+    costs one small object plus its attributes dict, instead of a 10-14 key
+    dict per datapoint.
+
+    The mapping view has the keys, order and values of the row dict, so
+    RowEvent == dict comparisons, row["metric"], dict(row) and
+    SpecLoader.validate_row_event work unchanged. Nested objects are shared:
+    treat them as read-only, or take to_dict() for a private copy.
+    """
+
+    __slots__ = (
+        "metric", "type", "value", "ts", "ts_unix_ms", "instance", "unit", "attributes",
+        "resource_entry", "scope_entry",
+    )
+
+    def __init__(
+        self,
+        metric: Optional[str],
+        type: Optional[str],
+        value: Any,
+        ts: str,
+        ts_unix_ms: int,
+        instance: Any,
+        unit: Optional[str],
+        attributes: Dict[str, Any],
+        resource_entry: Dict[str, Any],
+        scope_entry: Dict[str, Any],
+    ):
+        self.metric = metric
+        self.type = type
+        self.value = value
+        self.ts = ts
+        self.ts_unix_ms = ts_unix_ms
+        self.instance = instance
+        self.unit = unit
+        self.attributes = attributes
+        self.resource_entry = resource_entry
+        self.scope_entry = scope_entry
+
+    def _members(self) -> Iterator[Tuple[str, Any]]:
+        """Yield the row's (key, value) pairs in row order."""
+        yield "metric", self.metric
+        yield "type", self.type
+        yield "value", self.value
+        yield "ts", self.ts
+        yield "tsUnixMs", self.ts_unix_ms
+        for field, value in self.resource_entry["promoted"]:
+            if value:
+                yield field, value
+        if self.scope_entry["datasource"]:
+            yield "datasource", self.scope_entry["datasource"]
+        if self.instance:
+            yield "instance", self.instance
+        if self.unit:
+            yield "unit", self.unit
+        yield "attributes", self.attributes
+        yield "resource", self.resource_entry["resource"]
+        yield "scope", self.scope_entry["scope"]
+
+    def __getitem__(self, key: str) -> Any:
+        getter = _ROW_EVENT_GETTERS.get(key)
+        if getter is not None:
+            value = getter(self)
+            if value or key not in _OMITTED_WHEN_EMPTY:
+                return value
+            raise KeyError(key)
+        # Promotions cannot reuse a fixed row field name, so only they remain
+        for field, value in self.resource_entry["promoted"]:
+            if field == key and value:
+                return value
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return (field for field, _ in self._members())
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._members())
+
+    def __repr__(self) -> str:
+        return f"RowEvent({dict(self._members())!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Copy the row into a plain dict, with its own nested objects."""
+        row = dict(self._members())
+        row["attributes"] = dict(row["attributes"])
+        row["resource"] = dict(row["resource"])
+        row["scope"] = dict(row["scope"])
+        return row
+
+    def to_json(self) -> bytes:
+        """
+        Serialize the row as a newline-terminated JSON line, ready for Firehose.
+
+        Resource and scope JSON is spliced in from the shared entries; the
+        output is byte-identical to json.dumps(self.to_dict()) + "\n".
+        """
+        dumps = CODEC.dumps
+        return b"".join((
+            (
+                f'{{"metric": {dumps(self.metric)}, "type": {dumps(self.type)}, '
+                f'"value": {_encode_value(self.value)}, "ts": {dumps(self.ts)}, '
+                f'"tsUnixMs": {self.ts_unix_ms}, '
+            ).encode("utf-8"),
+            self.resource_entry["promoted_json"],
+            self.scope_entry["datasource_json"],
+            _render_members([("instance", self.instance), ("unit", self.unit)]),
+            b'"attributes": ',
+            dumps(self.attributes).encode("utf-8"),
+            b', "resource": ',
+            self.resource_entry["resource_json"],
+            b', "scope": ',
+            self.scope_entry["scope_json"],
+            b"}\n",
+        ))
+
+
+# RowEvent lookups by row key, and the keys a row leaves out when their value is empty
+_ROW_EVENT_GETTERS: Dict[str, Callable[[RowEvent], Any]] = {
+    "metric": attrgetter("metric"),
+    "type": attrgetter("type"),
+    "value": attrgetter("value"),
+    "ts": attrgetter("ts"),
+    "tsUnixMs": attrgetter("ts_unix_ms"),
+    "datasource": lambda row: row.scope_entry["datasource"],
+    "instance": attrgetter("instance"),
+    "unit": attrgetter("unit"),
+    "attributes": attrgetter("attributes"),
+    "resource": lambda row: row.resource_entry["resource"],
+    "scope": lambda row: row.scope_entry["scope"],
+}
+_OMITTED_WHEN_EMPTY = frozenset({"datasource", "instance", "unit"})
+
+
+def flatten_otlp(
+    otlp_bundle: Dict[str, Any], spec: Union[Dict[str, Any], FlattenPlan]
+) -> List[RowEvent]:
     """
     Transform an OTLP bundle into a list of row events (1-to-N fan-out).
 
     Args:
         otlp_bundle: OTLP metrics bundle from LogicMonitor Data Publisher
-        spec: Row Event schema specification
+        spec: Compiled FlattenPlan, or the Row Event schema to compile one from
 
     Returns:
-        List of row event dictionaries, one per datapoint
+        List of row events, one per datapoint
 
     The function walks:
         resourceMetrics → scopeMetrics → metrics → dataPoints
     and produces one row event per datapoint with promoted fields.
     """
+    plan = _plan_for(spec)
     rows = []
 
     resource_metrics = otlp_bundle.get("resourceMetrics", [])
 
     for resource_metric in resource_metrics:
-        # Extract and flatten resource attributes
-        resource_attrs = _flatten_attributes(
-            resource_metric.get("resource", {}).get("attributes", [])
+        # Flatten, promote and render the resource once; its rows share the entry
+        resource_entry = _resource_entry(
+            _flatten_attributes(resource_metric.get("resource", {}).get("attributes", [])), plan
         )
 
-        # Promote key resource fields
-        org_id = resource_attrs.get("orgId")
-        device_id = resource_attrs.get("hostId")
-        device_name = resource_attrs.get("hostName")
-
         scope_metrics = resource_metric.get("scopeMetrics", [])
 
         for scope_metric in scope_metrics:
             scope = scope_metric.get("scope", {})
-            scope_name = scope.get("name")
-            scope_version = scope.get("version")
             scope_epoch = scope.get("epoch")
-
-            # Build scope info object
-            scope_info = {}
-            if scope_name:
-                scope_info["name"] = scope_name
-            if scope_version:
-                scope_info["version"] = scope_version
+            scope_entry = _scope_entry(scope, plan)
 
             metrics = scope_metric.get("metrics", [])
 
@@ -74,32 +365,397 @@ def flatten_otlp(otlp_bundle: Dict[str, Any], spec: Dict[str, Any]) -> List[Dict
                         metric_name=metric_name,
                         metric_unit=metric_unit,
                         metric_type=metric_type,
-                        resource_attrs=resource_attrs,
-                        scope_info=scope_info,
+                        resource_entry=resource_entry,
+                        scope_entry=scope_entry,
                         scope_epoch=scope_epoch,
-                        org_id=org_id,
-                        device_id=device_id,
-                        device_name=device_name,
-                        datasource=scope_name,
+                        plan=plan,
                     )
                     rows.append(row)
 
     return rows
 
 
+class ColumnarBatch:
+    """
+    Struct-of-arrays result of flattening many OTLP bundles at once.
+
+    Per-row values live in parallel lists (one entry per datapoint). Resource
+    and scope content is stored once per resourceMetric / scopeMetric in shared
+    tables, and each row points at its entries through resource_index and
+    scope_index. bundle_index maps every row back to its source bundle.
+
+    Resource table entries hold the promoted (row field, value) pairs under
+    "promoted" and the remaining "resource" object. Scope table entries hold
+    "datasource" and the "scope" object.
+    """
+
+    def __init__(self):
+        self.metric: List[Optional[str]] = []
+        self.type: List[Optional[str]] = []
+        self.value: List[Any] = []
+        self.ts: List[str] = []
+        self.ts_unix_ms: List[int] = []
+        self.unit: List[Optional[str]] = []
+        self.instance: List[Any] = []
+        self.attributes: List[Dict[str, Any]] = []
+        self.resource_index: List[int] = []
+        self.scope_index: List[int] = []
+        self.bundle_index: List[int] = []
+
+        self.resources: List[Dict[str, Any]] = []
+        self.scopes: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.metric)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """
+        Materialize row i as a dict, equal to the RowEvent flatten_otlp produces.
+
+        Args:
+            i: Row position in the batch
+
+        Returns:
+            Row event dictionary
+        """
+        resource = self.resources[self.resource_index[i]]
+        scope = self.scopes[self.scope_index[i]]
+
+        row = {
+            "metric": self.metric[i],
+            "type": self.type[i],
+            "value": self.value[i],
+            "ts": self.ts[i],
+            "tsUnixMs": self.ts_unix_ms[i],
+        }
+
+        for field, value in resource["promoted"]:
+            if value:
+                row[field] = value
+        if scope["datasource"]:
+            row["datasource"] = scope["datasource"]
+        if self.instance[i]:
+            row["instance"] = self.instance[i]
+        if self.unit[i]:
+            row["unit"] = self.unit[i]
+
+        # Copies keep materialized rows independent of the shared tables
+        row["attributes"] = dict(self.attributes[i])
+        row["resource"] = dict(resource["resource"])
+        row["scope"] = dict(scope["scope"])
+
+        return row
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Materialize every row as a row event dictionary."""
+        return [self.row(i) for i in range(len(self))]
+
+    def encode(self) -> Iterator[bytes]:
+        """
+        Serialize rows to newline-terminated JSON, ready for Firehose.
+
+        Resource and scope content is spliced in from the fragments rendered
+        once per table entry; metric, unit and instance fragments are rendered
+        once per distinct value. The output is byte-identical to
+        json.dumps(self.row(i)) + "\\n".
+
+        Yields:
+            One UTF-8 encoded JSON document per row
+        """
+        dumps = CODEC.dumps
+        heads: Dict[tuple, bytes] = {}
+        units: Dict[Any, bytes] = {None: b""}
+        instances: Dict[Any, bytes] = {None: b""}
+
+        resources = self.resources
+        scopes = self.scopes
+        columns = zip(
+            self.metric, self.type, self.value, self.ts, self.ts_unix_ms, self.unit,
+            self.instance, self.attributes, self.resource_index, self.scope_index,
+        )
+        for (metric, metric_type, value, ts, ts_unix_ms, unit, instance, attributes,
+             resource_index, scope_index) in columns:
+            head = heads.get((metric, metric_type))
+            if head is None:
+                head = heads[(metric, metric_type)] = (
+                    f'{{"metric": {dumps(metric)}, "type": {dumps(metric_type)}, "value": '
+                ).encode("utf-8")
+
+            unit_json = units.get(unit)
+            if unit_json is None:
+                unit_json = units[unit] = _render_members([("unit", unit)])
+
+            instance_json = instances.get(instance)
+            if instance_json is None:
+                instance_json = instances[instance] = _render_members([("instance", instance)])
+
+            resource = resources[resource_index]
+            scope = scopes[scope_index]
+
+            yield b"".join((
+                head,
+                f'{_encode_value(value)}, "ts": {dumps(ts)}, "tsUnixMs": {ts_unix_ms}, '.encode(
+                    "utf-8"
+                ),
+                resource["promoted_json"],
+                scope["datasource_json"],
+                instance_json,
+                unit_json,
+                b'"attributes": ',
+                dumps(attributes).encode("utf-8"),
+                b', "resource": ',
+                resource["resource_json"],
+                b', "scope": ',
+                scope["scope_json"],
+                b"}\n",
+            ))
+
+
+def flatten_otlp_batch(
+    bundles: Iterable[Dict[str, Any]],
+    spec: Union[Dict[str, Any], FlattenPlan],
+    resource_cache: Optional[ResourceCache] = None,
+    interner: Optional[StringInterner] = None,
+) -> ColumnarBatch:
+    """
+    Flatten many OTLP bundles into a single columnar batch.
+
+    Args:
+        bundles: OTLP metrics bundles from LogicMonitor Data Publisher
+        spec: Compiled FlattenPlan, or the Row Event schema to compile one from
+        resource_cache: Reuses resource table entries for repeated resource
+            attribute lists (entries are then shared between batches)
+        interner: Interns the metric, unit, ts, instance and attribute strings
+            the batch keeps, so it holds no duplicates of them
+
+    Returns:
+        ColumnarBatch with one row per datapoint across all bundles
+
+    Produces the same rows as calling flatten_otlp on each bundle in turn, but
+    without building a dict per datapoint or copying resource/scope content.
+    Datapoint attributes go through the plan's attribute_shapes extractors,
+    falling back to the generic path for shapes they do not cover.
+    """
+    plan = _plan_for(spec)
+    instance_attributes = plan.instance_attributes
+    attribute_exclusions = plan.attribute_exclusions
+    coerce_instance = plan.coercions.get("instance")
+    batch = ColumnarBatch()
+
+    # Bind column appends once; the datapoint loop is the hot path
+    add_metric = batch.metric.append
+    add_type = batch.type.append
+    add_value = batch.value.append
+    add_ts_unix_ms = batch.ts_unix_ms.append
+    add_unit = batch.unit.append
+    add_instance = batch.instance.append
+    add_attributes = batch.attributes.append
+    add_resource_index = batch.resource_index.append
+    add_scope_index = batch.scope_index.append
+    add_bundle_index = batch.bundle_index.append
+    intern = interner.table.setdefault if interner is not None else None
+    attribute_shapes = plan.attribute_shapes
+    extract = None
+    shape_hits = 0
+
+    def build_resource_entry(attributes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return _resource_entry(_flatten_attributes(attributes), plan)
+
+    for bundle_index, otlp_bundle in enumerate(bundles):
+        for resource_metric in otlp_bundle.get("resourceMetrics", []):
+            resource_attributes = resource_metric.get("resource", {}).get("attributes", [])
+            resource_index = len(batch.resources)
+            if resource_cache is None:
+                batch.resources.append(build_resource_entry(resource_attributes))
+            else:
+                batch.resources.append(
+                    resource_cache.get(resource_attributes, plan, build_resource_entry)
+                )
+
+            for scope_metric in resource_metric.get("scopeMetrics", []):
+                scope = scope_metric.get("scope", {})
+                scope_epoch = scope.get("epoch")
+
+                scope_index = len(batch.scopes)
+                batch.scopes.append(_scope_entry(scope, plan))
+
+                for metric in scope_metric.get("metrics", []):
+                    metric_name = metric.get("name")
+                    metric_unit = metric.get("unit")
+
+                    if "gauge" in metric:
+                        metric_type = "gauge"
+                        datapoints = metric["gauge"].get("dataPoints", [])
+                    elif "sum" in metric:
+                        metric_type = "sum"
+                        datapoints = metric["sum"].get("dataPoints", [])
+                    else:
+                        continue
+
+                    if intern is not None:
+                        metric_name = interner.intern(metric_name)
+                        metric_unit = interner.intern(metric_unit)
+
+                    for datapoint in datapoints:
+                        ts_unix_ms = _datapoint_ts_unix_ms(datapoint, scope_epoch)
+                        raw_attributes = datapoint.get("attributes", [])
+
+                        # Speculate that the datapoint has the previous one's shape
+                        extracted = extract(raw_attributes, intern) if extract is not None else None
+                        if extracted is None:
+                            # Shape change; a generic-path datapoint keeps the previous extractor
+                            found = attribute_shapes.lookup(raw_attributes)
+                            if found is not None:
+                                extract = found
+                                extracted = extract(raw_attributes, intern)
+                        else:
+                            shape_hits += 1
+
+                        if extracted is not None:
+                            instance, attributes = extracted
+                        else:
+                            dp_attrs = _flatten_attributes(raw_attributes)
+                            instance = None
+                            for name in instance_attributes:
+                                if name in dp_attrs:
+                                    instance = dp_attrs[name]
+                                    if coerce_instance is not None and instance:
+                                        instance = coerce_instance(instance)
+                                    break
+                            if intern is None:
+                                attributes = {
+                                    k: v for k, v in dp_attrs.items() if k not in attribute_exclusions
+                                }
+                            else:
+                                attributes = {
+                                    intern(k, k): intern(v, v) if type(v) is str else v
+                                    for k, v in dp_attrs.items() if k not in attribute_exclusions
+                                }
+
+                        if intern is not None and type(instance) is str:
+                            instance = intern(instance, instance)
+
+                        add_metric(metric_name)
+                        add_type(metric_type)
+                        add_value(datapoint.get("asDouble", datapoint.get("asInt")))
+                        add_ts_unix_ms(ts_unix_ms)
+                        add_unit(metric_unit)
+                        add_instance(instance)
+                        add_attributes(attributes)
+                        add_resource_index(resource_index)
+                        add_scope_index(scope_index)
+                        add_bundle_index(bundle_index)
+
+    attribute_shapes.hits += shape_hits
+    # Datapoints share a few collection timestamps; format each distinct one once
+    batch.ts = RFC3339.format_many(batch.ts_unix_ms)
+    if intern is not None:
+        batch.ts = [intern(ts, ts) for ts in batch.ts]
+    return batch
+
+
+def _coerce(plan: FlattenPlan, field: str, value: Any) -> Any:
+    """Apply the plan's coercion for a promoted field (falsy values, which are omitted, pass through)."""
+    coerce = plan.coercions.get(field)
+    if coerce is None or not value:
+        return value
+    return coerce(value)
+
+
+def _promote_resource(resource_attrs: Dict[str, Any], plan: FlattenPlan) -> List[tuple]:
+    """Pick the plan's promoted resource values as (row field, value) pairs, in row order."""
+    return [
+        (field, _coerce(plan, field, resource_attrs.get(source)))
+        for field, source in plan.resource_promotions
+    ]
+
+
+def _resource_object(resource_attrs: Dict[str, Any], plan: FlattenPlan) -> Dict[str, Any]:
+    """Build the row resource object (flattened attributes minus promoted fields)."""
+    exclusions = plan.resource_exclusions
+    return {k: v for k, v in resource_attrs.items() if k not in exclusions}
+
+
+def _resource_entry(resource_attrs: Dict[str, Any], plan: FlattenPlan) -> Dict[str, Any]:
+    """
+    Build a ColumnarBatch resource table entry with pre-rendered JSON fragments.
+
+    Args:
+        resource_attrs: Flattened resource attributes
+        plan: Compiled flatten plan
+
+    Returns:
+        Entry with the promoted (field, value) pairs, the resource object, and
+        their JSON encodings: "promoted_json" is the '"orgId": ..., ' run
+        spliced after tsUnixMs and "resource_json" is the encoded resource object.
+    """
+    promoted = _promote_resource(resource_attrs, plan)
+    resource = _resource_object(resource_attrs, plan)
+
+    return {
+        "promoted": promoted,
+        "resource": resource,
+        "promoted_json": _render_members(promoted),
+        "resource_json": json.dumps(resource).encode("utf-8"),
+    }
+
+
+def _scope_entry(scope: Dict[str, Any], plan: FlattenPlan) -> Dict[str, Any]:
+    """
+    Build a ColumnarBatch scope table entry with pre-rendered JSON fragments.
+
+    Args:
+        scope: OTLP scope object
+        plan: Compiled flatten plan
+
+    Returns:
+        Entry with the promoted datasource, the scope object, and their JSON
+        encodings ("datasource_json" member run and "scope_json" object)
+    """
+    scope_name = _coerce(plan, "datasource", scope.get("name"))
+    scope_version = scope.get("version")
+
+    scope_info = {}
+    if scope_name:
+        scope_info["name"] = scope_name
+    if scope_version:
+        scope_info["version"] = scope_version
+
+    return {
+        "datasource": scope_name,
+        "scope": scope_info,
+        "datasource_json": _render_members([("datasource", scope_name)]),
+        "scope_json": json.dumps(scope_info).encode("utf-8"),
+    }
+
+
+def _render_members(members: List[tuple]) -> bytes:
+    """Render truthy (key, value) pairs as a run of JSON object members, each followed by ', '."""
+    return "".join(
+        f"{json.dumps(key)}: {json.dumps(value)}, " for key, value in members if value
+    ).encode("utf-8")
+
+
+def _encode_value(value: Any) -> str:
+    """Encode a datapoint value exactly as json.dumps would, skipping it for finite numbers."""
+    value_type = type(value)
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float and value == value and value not in (_INF, -_INF):
+        return float.__repr__(value)
+    return json.dumps(value)
+
+
 def _process_datapoint(
     datapoint: Dict[str, Any],
     metric_name: str,
     metric_unit: Optional[str],
     metric_type: str,
-    resource_attrs: Dict[str, Any],
-    scope_info: Dict[str, Any],
+    resource_entry: Dict[str, Any],
+    scope_entry: Dict[str, Any],
     scope_epoch: Optional[str],
-    org_id: Optional[str],
-    device_id: Optional[str],
-    device_name: Optional[str],
-    datasource: Optional[str],
-) -> Dict[str, Any]:
+    plan: FlattenPlan,
+) -> RowEvent:
     """
     Process a single datapoint into a row event.
 
@@ -108,84 +764,64 @@ def _process_datapoint(
         metric_name: Metric name
         metric_unit: Metric unit (optional)
         metric_type: Metric type (gauge or sum)
-        resource_attrs: Flattened resource attributes
-        scope_info: Scope information
+        resource_entry: Shared resource entry (promoted fields and resource object)
+        scope_entry: Shared scope entry (datasource and scope object)
         scope_epoch: Scope epoch for timestamp fallback
-        org_id: Organization ID (promoted)
-        device_id: Device ID (promoted)
-        device_name: Device name (promoted)
-        datasource: Datasource name (promoted)
+        plan: Compiled flatten plan
 
     Returns:
-        Row event dictionary
+        Row event
     """
-    # Extract value
-    value = datapoint.get("asDouble", datapoint.get("asInt"))
-
     # Extract timestamp
-    time_unix_nano = datapoint.get("timeUnixNano")
-    if time_unix_nano:
-        ts_unix_ms = int(int(time_unix_nano) / 1_000_000)
-    elif scope_epoch:
-        # Fallback to scope epoch (in seconds)
-        ts_unix_ms = int(scope_epoch) * 1000
-    else:
-        # Default to current time if no timestamp available
-        ts_unix_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
-
-    # Convert to RFC3339
-    ts_rfc3339 = _unix_ms_to_rfc3339(ts_unix_ms)
+    ts_unix_ms = _datapoint_ts_unix_ms(datapoint, scope_epoch)
 
     # Flatten datapoint attributes
     dp_attrs = _flatten_attributes(datapoint.get("attributes", []))
 
     # Promote instance field
-    instance = dp_attrs.get("dataSourceInstanceName", dp_attrs.get("wildValue"))
+    instance = None
+    for name in plan.instance_attributes:
+        if name in dp_attrs:
+            instance = _coerce(plan, "instance", dp_attrs[name])
+            break
 
     # Build attributes object (exclude promoted fields)
-    attributes = {
-        k: v
-        for k, v in dp_attrs.items()
-        if k not in ["dataSourceInstanceName", "wildValue"]
-    }
-
-    # Build resource object (exclude promoted fields)
-    resource = {
-        k: v
-        for k, v in resource_attrs.items()
-        if k not in ["orgId", "hostId", "hostName"]
-    }
+    exclusions = plan.attribute_exclusions
+    attributes = {k: v for k, v in dp_attrs.items() if k not in exclusions}
+
+    return RowEvent(
+        metric=metric_name,
+        type=metric_type,
+        value=datapoint.get("asDouble", datapoint.get("asInt")),
+        ts=_unix_ms_to_rfc3339(ts_unix_ms),
+        ts_unix_ms=ts_unix_ms,
+        instance=instance,
+        unit=metric_unit,
+        attributes=attributes,
+        resource_entry=resource_entry,
+        scope_entry=scope_entry,
+    )
+
+
+def _datapoint_ts_unix_ms(datapoint: Dict[str, Any], scope_epoch: Optional[str]) -> int:
+    """
+    Resolve a datapoint timestamp in Unix milliseconds.
 
-    # Build row event
-    row = {
-        "metric": metric_name,
-        "type": metric_type,
-        "value": value,
-        "ts": ts_rfc3339,
-        "tsUnixMs": ts_unix_ms,
-    }
+    Args:
+        datapoint: OTLP datapoint
+        scope_epoch: Scope epoch (seconds) used when timeUnixNano is absent
 
-    # Add promoted fields if present
-    if org_id:
-        row["orgId"] = org_id
-    if device_id:
-        row["deviceId"] = device_id
-    if device_name:
-        row["deviceName"] = device_name
-    if datasource:
-        row["datasource"] = datasource
-    if instance:
-        row["instance"] = instance
-    if metric_unit:
-        row["unit"] = metric_unit
-
-    # Add nested objects
-    # Always include these objects to signal structure presence
-    row["attributes"] = attributes if attributes else {}
-    row["resource"] = resource if resource else {}
-    row["scope"] = scope_info if scope_info else {}
-
-    return row
+    Returns:
+        Unix timestamp in milliseconds
+    """
+    time_unix_nano = datapoint.get("timeUnixNano")
+    if time_unix_nano:
+        return nanos_to_ms(time_unix_nano)
+    if scope_epoch:
+        # Fallback to scope epoch (in seconds)
+        return int(scope_epoch) * 1000
+    # Default to current time if no timestamp available
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
 
 
 def _flatten_attributes(attributes: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -231,5 +867,4 @@ def _unix_ms_to_rfc3339(ts_unix_ms: int) -> str:
     Returns:
         RFC3339 formatted timestamp string
     """
-    dt = datetime.fromtimestamp(ts_unix_ms / 1000, tz=timezone.utc)
-    return dt.isoformat().replace("+00:00", "Z")
+    return RFC3339.format(ts_unix_ms)
@@ -3,31 +3,150 @@
 
 import os
 import json
-import base64
+import random
+import resource
 import time
-from typing import Dict, List, Any, Optional
-import boto3
+from bisect import bisect_right
+from collections import Counter, deque
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple, Union
+from botocore.exceptions import BotoCoreError, ClientError
 
-from flatten import flatten_otlp
-from spec_loader import SpecLoader
+# boto3 (and the s3transfer, multiprocessing and concurrent.futures modules it
+# pulls in), worker processes and thread pools are imported where they are used,
+# so the init phase only pays for what every invocation needs.
+from codec import CODEC
+from flatten import FlattenPlan, RowEvent, flatten_otlp_batch
+from interning import StringInterner
+from kafka_decode import DecodeStats, decode_kafka_value
+from resource_cache import DEFAULT_MAX_BYTES, ResourceCache
+from spec_loader import RemoteSpec, RowValidator, SpecLoader
+from rate_control import AimdController, metric_record
+from retry import RetryScheduler, is_throttling
+from spill import DEFAULT_SPILL_CHUNK_BYTES, S3Spill
+from stages import BackgroundStage
 
 
-# Load spec once at module level for reuse across invocations
+# Load spec and compile its flatten plan once at module level for reuse across invocations
 SPEC_LOADER = SpecLoader()
 SPEC = SPEC_LOADER.get_row_event_schema()
+PLAN = SPEC_LOADER.get_flatten_plan()
+
+# PutRecordBatch service limits
+FIREHOSE_MAX_BATCH_RECORDS = 500
+FIREHOSE_MAX_BATCH_BYTES = 4 * 1024 * 1024
+FIREHOSE_MAX_RECORD_BYTES = 1000 * 1024
+
+# Firehose client settings: connections are kept alive across warm invocations,
+# and a hung call fails fast instead of eating into the retry deadline
+FIREHOSE_POOL_CONNECTIONS = 10
+FIREHOSE_CONNECT_TIMEOUT = 2
+FIREHOSE_READ_TIMEOUT = 10
 
 # Firehose client (lazy initialization)
 _firehose_client = None
 
+# S3 client for spilling undelivered rows (lazy initialization)
+_s3_client = None
+
+# Send-rate controller, kept across warm invocations (lazy initialization)
+_rate_controller = None
+
+# Remote spec source, kept across warm invocations (lazy initialization)
+_spec_source = None
+
+# Resource fragment cache, kept across warm invocations (lazy initialization)
+_resource_cache = None
+
+# Warm-scope string interning table (lazy initialization)
+_interner = None
+
+
+def _create_client(service_name: str, **config: Any):
+    """Create a botocore client directly, without importing boto3."""
+    import botocore.session
+    from botocore.config import Config
+
+    return botocore.session.get_session().create_client(service_name, config=Config(**config))
+
 
 def get_firehose_client():
-    """Get or create Firehose client."""
+    """
+    Get or create Firehose client.
+
+    SDK retries are disabled: _put_batch_with_retry already retries failed
+    records with its own jitter, budget and deadline, and SDK retries nested
+    inside it would multiply attempts and hide throttling from the rate
+    controller. The pool is sized for MAX_IN_FLIGHT_BATCHES concurrent calls.
+    """
     global _firehose_client
     if _firehose_client is None:
-        _firehose_client = boto3.client("firehose")
+        max_in_flight = int(os.environ.get("MAX_IN_FLIGHT_BATCHES", "1"))
+        _firehose_client = _create_client(
+            "firehose",
+            retries={"mode": "standard", "total_max_attempts": 1},
+            max_pool_connections=max(FIREHOSE_POOL_CONNECTIONS, max_in_flight),
+            tcp_keepalive=True,
+            connect_timeout=FIREHOSE_CONNECT_TIMEOUT,
+            read_timeout=FIREHOSE_READ_TIMEOUT,
+        )
     return _firehose_client
 
 
+def get_s3_client():
+    """Get or create S3 client."""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = _create_client("s3", retries={"mode": "standard"}, tcp_keepalive=True)
+    return _s3_client
+
+
+def get_rate_controller(max_rate: float, min_rate: float, max_batch_size: int) -> AimdController:
+    """Get or create the send-rate controller (settings apply on creation only)."""
+    global _rate_controller
+    if _rate_controller is None:
+        _rate_controller = AimdController(
+            max_rate=max_rate, min_rate=min_rate, max_batch_size=max_batch_size
+        )
+    return _rate_controller
+
+
+def get_spec_source(uri: str, ttl_seconds: float) -> RemoteSpec:
+    """Get or create the remote spec source (settings apply on creation only)."""
+    global _spec_source
+    if _spec_source is None:
+        _spec_source = RemoteSpec(
+            uri,
+            SPEC_LOADER,
+            ttl_seconds=ttl_seconds,
+            s3_client=get_s3_client() if uri.startswith("s3://") else None,
+            ssm_client=_create_client("ssm") if uri.startswith("ssm:") else None,
+        )
+    return _spec_source
+
+
+def get_resource_cache(max_entries: int, max_bytes: int) -> ResourceCache:
+    """Get or create the resource fragment cache (settings apply on creation only)."""
+    global _resource_cache
+    if _resource_cache is None:
+        _resource_cache = ResourceCache(max_entries=max_entries, max_bytes=max_bytes)
+    return _resource_cache
+
+
+def get_interner(max_entries: int) -> StringInterner:
+    """Get or create the warm-scope string interner (settings apply on creation only)."""
+    global _interner
+    if _interner is None:
+        _interner = StringInterner(max_entries=max_entries)
+    return _interner
+
+
+# In Lambda, build the Firehose client during the init phase, which runs
+# before the first event (and at full CPU), instead of on the first batch
+if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    get_firehose_client()
+
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Lambda handler for EventBridge Pipes with Kafka (MSK) source.
@@ -44,44 +163,370 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     # Get configuration from environment
     firehose_stream = os.environ.get("FIREHOSE_STREAM_NAME", "lm-datapublisher-delivery")
     batch_size = int(os.environ.get("BATCH_SIZE", "500"))
+    max_batch_bytes = int(os.environ.get("MAX_BATCH_BYTES", str(FIREHOSE_MAX_BATCH_BYTES)))
+    max_record_bytes = int(os.environ.get("MAX_RECORD_BYTES", str(FIREHOSE_MAX_RECORD_BYTES)))
+    aggregate_bytes = int(os.environ.get("AGGREGATE_BYTES", "0"))
+    max_in_flight = int(os.environ.get("MAX_IN_FLIGHT_BATCHES", "1"))
+    pipeline_depth = int(os.environ.get("PIPELINE_DEPTH", "0"))
+    flatten_workers = int(os.environ.get("FLATTEN_WORKERS", "0"))
+    process_min_records = int(os.environ.get("FLATTEN_PROCESS_MIN_RECORDS", "8"))
 
-    # Process Kafka records
-    kafka_records = process_kafka_records(event)
-    total_kafka_records = len(kafka_records)
+    report_item_failures = os.environ.get("REPORT_BATCH_ITEM_FAILURES", "false").lower() == "true"
+    retry_scheduler = RetryScheduler.from_context(
+        context,
+        reserve_ms=int(os.environ.get("RETRY_RESERVE_MS", "5000")),
+        base_delay=int(os.environ.get("RETRY_BASE_DELAY_MS", "100")) / 1000.0,
+        max_delay=int(os.environ.get("RETRY_MAX_DELAY_MS", "5000")) / 1000.0,
+        budget=int(os.environ.get("RETRY_BUDGET", "50")),
+    )
+    rate_controller = None
+    if os.environ.get("RATE_CONTROL", "false").lower() == "true":
+        rate_controller = get_rate_controller(
+            max_rate=float(os.environ.get("RATE_CONTROL_MAX_RECORDS_PER_SEC", "100000")),
+            min_rate=float(os.environ.get("RATE_CONTROL_MIN_RECORDS_PER_SEC", "100")),
+            max_batch_size=batch_size,
+        )
 
-    # Flatten OTLP bundles to row events
-    all_rows = []
-    for otlp_bundle in kafka_records:
-        rows = flatten_otlp(otlp_bundle, SPEC)
-        all_rows.extend(rows)
+    spill_bucket = os.environ.get("SPILL_BUCKET", "")
+    spill_chunk_bytes = int(os.environ.get("SPILL_CHUNK_BYTES", str(DEFAULT_SPILL_CHUNK_BYTES)))
 
-    total_row_events = len(all_rows)
+    # A spec published to S3/SSM replaces the bundled one without a redeploy.
+    # The plan is resolved once here, so a reload never changes it mid-invocation.
+    spec_loader = SPEC_LOADER
+    spec_source = None
+    spec_source_uri = os.environ.get("SPEC_SOURCE", "")
+    if spec_source_uri:
+        spec_source = get_spec_source(
+            spec_source_uri, float(os.environ.get("SPEC_TTL_SECONDS", "60"))
+        )
+        spec_loader = spec_source.current()
+    plan = spec_loader.get_flatten_plan()
+    # The plan's attribute extractors stay warm with it; count this invocation's use
+    plan.attribute_shapes.reset_stats()
 
-    # Write to Firehose
-    if all_rows:
-        firehose_result = batch_to_firehose(
-            all_rows,
-            firehose_stream,
-            batch_size=batch_size
+    # Device resource blocks repeat every collection interval; warm containers
+    # can reuse their flattened and serialized fragments (off unless
+    # RESOURCE_CACHE_ENTRIES is set: benchmarks show no consistent win yet)
+    resource_cache = None
+    resource_cache_entries = int(os.environ.get("RESOURCE_CACHE_ENTRIES", "0"))
+    if resource_cache_entries > 0:
+        resource_cache = get_resource_cache(
+            resource_cache_entries,
+            int(os.environ.get("RESOURCE_CACHE_BYTES", str(DEFAULT_MAX_BYTES))),
         )
+        resource_cache.reset_stats()
+
+    # Repeated strings the flattener keeps are interned: per invocation, or in
+    # a warm-container table emptied once it passes INTERN_MAX_ENTRIES
+    intern_scope = os.environ.get("INTERN_SCOPE", "invocation").lower()
+    if intern_scope == "invocation":
+        interner = StringInterner()
+    elif intern_scope == "warm":
+        interner = get_interner(int(os.environ.get("INTERN_MAX_ENTRIES", "100000")))
+        interner.trim()
+    elif intern_scope == "off":
+        interner = None
     else:
-        firehose_result = {
-            "total_records": 0,
-            "failed_records": 0,
-            "batches": 0
+        raise ValueError(f"Unknown INTERN_SCOPE {intern_scope!r}; use invocation, warm or off")
+
+    # Rows failing the schema go to a sidecar sink instead of being rejected by Snowflake
+    validation_mode = os.environ.get("VALIDATION_MODE", "off").lower()
+    validator = None
+    sample_rate = 1.0
+    if validation_mode == "sample":
+        sample_rate = float(os.environ.get("VALIDATION_SAMPLE_RATE", "0.01"))
+    elif validation_mode not in ("all", "off"):
+        raise ValueError(f"Unknown VALIDATION_MODE {validation_mode!r}; use off, all or sample")
+    if validation_mode != "off":
+        if not spill_bucket:
+            # Rejected rows are kept only in the sidecar; without one they would be lost
+            raise ValueError(f"VALIDATION_MODE={validation_mode} needs a SPILL_BUCKET for rejected rows")
+        validator = spec_loader.get_row_validator()
+
+    # Streaming pipeline: decode one bundle, flatten/encode it, and flush each
+    # Firehose batch as soon as it fills. Peak memory is one batch plus one bundle.
+    sources = RowSources()
+    kafka_entries = _kafka_entries(event)
+    if flatten_workers > 1 and len(kafka_entries) >= process_min_records:
+        # Large events on multi-vCPU tiers: decode/flatten/encode in worker processes,
+        # forked here before batch_to_firehose starts the pipeline stage or send pool
+        print(
+            f"Flatten mode: {flatten_workers} forked workers for {len(kafka_entries)} records, "
+            f"forked before {'the pipeline stage' if pipeline_depth > 0 else 'sending'} starts"
+        )
+        encoded_rows = flatten_in_processes(
+            kafka_entries, flatten_workers, sources, plan, validator, sample_rate, resource_cache,
+            interner, stop=retry_scheduler.expired,
+        )
+    else:
+        # Past the deadline nothing more is sent, so nothing more is decoded either
+        encoded_rows = _iter_encoded_rows(
+            kafka_entries, sources, plan, validator, sample_rate, resource_cache, interner,
+            stop=retry_scheduler.expired,
+        )
+
+    # Rows Firehose never accepts go to S3 for replay instead of being dropped
+    spill = None
+    on_undelivered = None
+    if spill_bucket:
+        spill = S3Spill(
+            spill_bucket,
+            get_s3_client(),
+            prefix=os.environ.get("SPILL_PREFIX", "spill/"),
+            max_chunk_bytes=spill_chunk_bytes,
+        )
+
+        def on_undelivered(first_row: int, record: bytes) -> None:
+            for offset, row in enumerate(record.splitlines(keepends=True)):
+                spill.add(sources.record_id(first_row + offset), row)
+
+    firehose_result = batch_to_firehose(
+        encoded_rows,
+        firehose_stream,
+        batch_size=batch_size,
+        max_batch_bytes=max_batch_bytes,
+        max_record_bytes=max_record_bytes,
+        aggregate_bytes=aggregate_bytes,
+        max_in_flight=max_in_flight,
+        pipeline_depth=pipeline_depth,
+        retry_scheduler=retry_scheduler,
+        rate_controller=rate_controller,
+        on_undelivered=on_undelivered,
+    )
+    failed_kafka_records = sources.lookup(firehose_result["failed_rows"])
+    if spill is not None:
+        # Spilled rows are recoverable from S3; only unsaved ones need redelivery
+        spill.flush()
+        failed_kafka_records = [
+            record_id for record_id in failed_kafka_records if record_id in spill.unsaved
+        ]
+    # Records never read before the deadline are redelivered whole
+    unread_kafka_records = [record_id for record_id, _, _ in kafka_entries[sources.records:]]
+    failed_kafka_records += unread_kafka_records
+    validation = None
+    if validator is not None:
+        validation = {
+            "mode": validation_mode,
+            "checked_rows": sources.checked,
+            "rejected_rows": len(sources.rejected),
+            "errors": dict(Counter(code for _, code, _ in sources.rejected)),
+            "sidecar": None,
         }
+        if sources.rejected:
+            sidecar = _save_rejected(sources, spill_bucket, spill_chunk_bytes)
+            validation["sidecar"] = sidecar.report()
+            # Rejected rows that could not be saved are redelivered rather than lost
+            failed_kafka_records = _merge_failed(kafka_entries, failed_kafka_records, sidecar.unsaved)
+    undecodable = None
+    if sources.invalid:
+        undecodable, unsaved = _keep_undecodable(sources, kafka_entries, spill_bucket, spill_chunk_bytes)
+        # Records that could not be kept are redelivered rather than lost
+        failed_kafka_records = _merge_failed(kafka_entries, failed_kafka_records, unsaved)
+    if rate_controller is not None:
+        print(json.dumps(metric_record(firehose_stream, firehose_result["rate_control"])))
 
     # Build response
-    return {
+    response = {
         "statusCode": 200,
         "body": {
-            "total_kafka_records": total_kafka_records,
-            "total_row_events": total_row_events,
+            "total_kafka_records": len(kafka_entries),
+            "total_row_events": sources.rows,
+            "invalid_records": len(sources.invalid),
             "total_firehose_records": firehose_result["total_records"],
+            "firehose_put_records": firehose_result["put_records"],
             "failed_records": firehose_result["failed_records"],
-            "batches": firehose_result["batches"]
+            "failed_kafka_records": len(failed_kafka_records),
+            "unread_kafka_records": len(unread_kafka_records),
+            "oversized_records": firehose_result["oversized_records"],
+            "batches": firehose_result["batches"],
+            "batch_fill": firehose_result["batch_fill"],
+            "pipeline": firehose_result["pipeline"],
+            "retry": firehose_result["retry"],
+            "rate_control": firehose_result["rate_control"],
+            "spill": spill.report() if spill is not None else None,
+            "undecodable": undecodable.report() if undecodable is not None else None,
+            "spec": spec_source.report() if spec_source is not None else None,
+            "resource_cache": resource_cache.report() if resource_cache is not None else None,
+            "attribute_shapes": plan.attribute_shapes.report(),
+            "interning": dict(interner.report(), scope=intern_scope) if interner is not None else None,
+            "validation": validation,
+            "decode": dict(
+                sources.decode.report(),
+                codec=CODEC.name,
+                # Linux reports ru_maxrss in KiB
+                max_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            ),
         }
     }
+    if report_item_failures:
+        # Pipes partial batch response: only these Kafka records are retried
+        if failed_kafka_records:
+            print(f"Warning: Redelivering {len(failed_kafka_records)} Kafka records")
+        response["batchItemFailures"] = [
+            {"itemIdentifier": record_id} for record_id in failed_kafka_records
+        ]
+    elif failed_kafka_records:
+        # Without a partial batch response a 200 would drop these records;
+        # failing the invocation makes Pipes retry the whole batch instead
+        raise RuntimeError(
+            f"{len(failed_kafka_records)} of {len(kafka_entries)} Kafka records were neither "
+            f"delivered nor kept; failing the batch for redelivery "
+            f"(REPORT_BATCH_ITEM_FAILURES=true retries only those records)"
+        )
+    return response
+
+
+def _merge_failed(
+    kafka_entries: List[Tuple[str, str, Optional[str]]],
+    failed_kafka_records: List[str],
+    extra: Iterable[str],
+) -> List[str]:
+    """
+    Add record ids to the failed Kafka records, keeping event order.
+
+    Args:
+        kafka_entries: (record_id, value_b64, content_type) of the event, in order
+        failed_kafka_records: Record ids already marked for redelivery
+        extra: More record ids to redeliver
+
+    Returns:
+        The union of both, each id once, in the order of kafka_entries
+    """
+    failed = set(failed_kafka_records)
+    failed.update(extra)
+    if len(failed) == len(failed_kafka_records):
+        return failed_kafka_records
+    return [record_id for record_id, _, _ in kafka_entries if record_id in failed]
+
+
+def _save_rejected(sources: "RowSources", spill_bucket: str, spill_chunk_bytes: int) -> S3Spill:
+    """
+    Write the rows that failed validation, with their error codes, to the sidecar.
+
+    Args:
+        sources: Row sources holding the (record_id, code, row) of rejected rows
+        spill_bucket: Bucket the sidecar writes to, under VALIDATION_PREFIX
+        spill_chunk_bytes: Most bytes per S3 object
+
+    Returns:
+        The flushed sidecar; its unsaved record ids need redelivery
+    """
+    sidecar = S3Spill(
+        spill_bucket,
+        get_s3_client(),
+        prefix=os.environ.get("VALIDATION_PREFIX", "invalid/"),
+        max_chunk_bytes=spill_chunk_bytes,
+    )
+    for record_id, code, row in sources.rejected:
+        sidecar.add(record_id, _rejection_record(code, row))
+    sidecar.flush()
+    return sidecar
+
+
+def _keep_undecodable(
+    sources: "RowSources",
+    kafka_entries: List[Tuple[str, str, Optional[str]]],
+    spill_bucket: str,
+    spill_chunk_bytes: int,
+) -> Tuple[Optional[S3Spill], Set[str]]:
+    """
+    Emit the undecodable-record metric and keep the raw records in S3.
+
+    Raw values go under UNDECODABLE_PREFIX, apart from spill/, which replay
+    sends to Firehose as rows.
+
+    Args:
+        sources: Row sources holding the (record_id, error) of undecodable records
+        kafka_entries: (record_id, value_b64, content_type) of the event
+        spill_bucket: Bucket to keep them in ("" if none is configured)
+        spill_chunk_bytes: Most bytes per S3 object
+
+    Returns:
+        The spill written (None without a bucket) and the record ids it could not keep
+    """
+    print(json.dumps(undecodable_metric_record(len(sources.invalid))))
+    if not spill_bucket:
+        print(f"Warning: No SPILL_BUCKET to keep {len(sources.invalid)} undecodable records in")
+        return None, {record_id for record_id, _ in sources.invalid}
+
+    values = {
+        record_id: (value_b64, content_type)
+        for record_id, value_b64, content_type in kafka_entries
+    }
+    undecodable = S3Spill(
+        spill_bucket,
+        get_s3_client(),
+        prefix=os.environ.get("UNDECODABLE_PREFIX", "undecodable/"),
+        max_chunk_bytes=spill_chunk_bytes,
+    )
+    for record_id, error in sources.invalid:
+        undecodable.add(record_id, _undecodable_record(record_id, error, *values[record_id]))
+    undecodable.flush()
+    return undecodable, undecodable.unsaved
+
+
+class RowSources:
+    """
+    Map row positions in the encoded stream back to the Kafka records that produced them.
+
+    Records are registered in stream order, before any of their rows are
+    emitted, so a row's position (its index among all rows handed to
+    batch_to_firehose) identifies its Kafka record by binary search.
+    """
+
+    def __init__(self):
+        self.records = 0
+        self.rows = 0
+        self.invalid: List[Tuple[str, str]] = []
+        self.checked = 0
+        self.rejected: List[Tuple[str, str, bytes]] = []
+        self.decode = DecodeStats()
+        self._starts: List[int] = []
+        self._record_ids: List[str] = []
+
+    def add(self, record_id: str, row_count: int) -> None:
+        """Register a decoded record whose row_count rows come next in the stream."""
+        self.records += 1
+        if row_count:
+            self._starts.append(self.rows)
+            self._record_ids.append(record_id)
+            self.rows += row_count
+
+    def add_invalid(self, record_id: str, error: str) -> None:
+        """Register a record that could not be decoded or flattened (it yields no rows)."""
+        self.records += 1
+        self.invalid.append((record_id, error))
+        print(f"Warning: Undecodable Kafka record {record_id}: {error}")
+
+    def add_checked(
+        self, record_id: str, row_count: int, rejected: List[Tuple[str, bytes]]
+    ) -> None:
+        """Register a validated record's row_count valid rows and its (code, row) rejections."""
+        self.checked += row_count + len(rejected)
+        self.rejected.extend((record_id, code, row) for code, row in rejected)
+
+    def record_id(self, row: int) -> str:
+        """Return the id of the Kafka record that produced the row at this position."""
+        return self._record_ids[bisect_right(self._starts, row) - 1]
+
+    def lookup(self, row_ranges: Iterable[Iterable[int]]) -> List[str]:
+        """
+        Find the Kafka records owning any row in the given ranges.
+
+        Args:
+            row_ranges: (first_row, row_count) pairs of row positions
+
+        Returns:
+            Record ids, each once, in event order
+        """
+        found = set()
+        for first_row, row_count in row_ranges:
+            i = max(bisect_right(self._starts, first_row) - 1, 0)
+            end = first_row + row_count
+            while i < len(self._starts) and self._starts[i] < end:
+                found.add(i)
+                i += 1
+        return [self._record_ids[i] for i in sorted(found)]
 
 
 def process_kafka_records(event: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -94,128 +539,764 @@ def process_kafka_records(event: Dict[str, Any]) -> List[Dict[str, Any]]:
     Returns:
         List of decoded OTLP bundle dictionaries
     """
-    records = []
+    return [
+        decode_kafka_value(value_b64, content_type=content_type)
+        for _, value_b64, content_type in _kafka_entries(event)
+    ]
+
+
+def _kafka_entries(event: Dict[str, Any]) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    Collect the non-empty base64 record values of a Pipes Kafka event, in event order.
 
+    Returns:
+        (record_id, value_b64, content_type) entries, where record_id is
+        "<topic-partition>:<offset>" and content_type is the record's
+        content-type header (None without one)
+    """
     # EventBridge Pipes with Kafka source structure:
-    # event["records"]["topic-partition"] = [{"value": "base64-encoded-json"}]
+    # event["records"]["topic-partition"] = [{"offset": 123, "value": "base64-encoded-json",
+    #                                        "headers": [{"content-type": [97, 112, ...]}]}]
     kafka_records = event.get("records", {})
 
+    entries = []
     for topic_partition, partition_records in kafka_records.items():
         for record in partition_records:
-            # Decode base64 value
             value_b64 = record.get("value", "")
             if value_b64:
-                value_bytes = base64.b64decode(value_b64)
-                value_str = value_bytes.decode("utf-8")
-                otlp_bundle = json.loads(value_str)
-                records.append(otlp_bundle)
+                entries.append((
+                    f"{topic_partition}:{record.get('offset')}",
+                    value_b64,
+                    _content_type(record.get("headers")),
+                ))
+    return entries
+
+
+def _content_type(headers: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+    """
+    Read the content-type header of a Pipes Kafka record.
+
+    Pipes delivers header values as lists of byte values; parameters such as
+    "; charset=utf-8" are dropped.
+
+    Returns:
+        Lower-cased media type, or None if the record has no content-type header
+    """
+    for header in headers or ():
+        for key, value in header.items():
+            if key.lower() != "content-type":
+                continue
+            if isinstance(value, list):
+                value = bytes(value).decode("utf-8", errors="replace")
+            return value.split(";", 1)[0].strip().lower()
+    return None
+
+
+def _encode_kafka_value(
+    value_b64: str,
+    plan: Optional[FlattenPlan] = None,
+    validator: Optional[RowValidator] = None,
+    sample_rate: float = 1.0,
+    decode_stats: Optional[DecodeStats] = None,
+    content_type: Optional[str] = None,
+    resource_cache: Optional[ResourceCache] = None,
+    interner: Optional[StringInterner] = None,
+) -> Tuple[List[bytes], Optional[List[Tuple[str, bytes]]]]:
+    """
+    Decode, flatten and encode one Kafka record value (with plan, default PLAN).
 
-    return records
+    Decoding is recorded in decode_stats; content_type is the record's
+    content-type header (JSON or protobuf is sniffed without one).
+    resource_cache reuses the fragments of resources seen before, and
+    interner dedupes the strings the flattened batch keeps.
+
+    With a validator, a sample_rate share of records is checked column by
+    column before encoding, and rows failing a check are split off.
+
+    Returns:
+        Valid rows, and the (error code, row) pairs rejected by validation
+        (None if the record was not validated)
+
+    Raises:
+        ValueError: Bad base64, compression, UTF-8, JSON or protobuf (retrying the record cannot fix these)
+    """
+    bundles = [decode_kafka_value(value_b64, decode_stats, content_type=content_type)]
+    try:
+        batch = flatten_otlp_batch(bundles, plan or PLAN, resource_cache, interner)
+        # The batch holds everything encoding needs; free the decoded bundle
+        # first instead of keeping it alive next to the encoded rows
+        bundles.clear()
+        rows = list(batch.encode())
+    except (AttributeError, KeyError, TypeError, OverflowError) as e:
+        # OverflowError: a timestamp outside datetime's range
+        raise ValueError(f"Malformed OTLP bundle: {e!r}") from e
+
+    if validator is None or (sample_rate < 1.0 and random.random() >= sample_rate):
+        return rows, None
+    codes = validator.check_columnar(batch)
+    if not any(codes):
+        return rows, []
+    valid = [row for row, code in zip(rows, codes) if code is None]
+    rejected = [(code, row) for row, code in zip(rows, codes) if code is not None]
+    return valid, rejected
+
+
+def _rejection_record(code: str, row: bytes) -> bytes:
+    """Wrap a row that failed validation with its error code for the sidecar sink."""
+    return b"".join((b'{"error": ', json.dumps(code).encode("utf-8"), b', "row": ', row[:-1], b"}\n"))
+
+
+def _undecodable_record(record_id: str, error: str, value_b64: str, content_type: Optional[str]) -> bytes:
+    """Wrap the raw value of a record that could not be decoded for the undecodable sink."""
+    partition, _, offset = record_id.rpartition(":")
+    return (json.dumps({
+        "record": record_id,
+        "partition": partition,
+        "offset": offset,
+        "error": error,
+        "content_type": content_type,
+        "value": value_b64,
+    }) + "\n").encode("utf-8")
+
+
+def undecodable_metric_record(count: int) -> Dict[str, Any]:
+    """
+    Build a CloudWatch Embedded Metric Format record of the undecodable records seen.
+
+    Args:
+        count: Kafka records in this invocation that could not be decoded
+
+    Returns:
+        EMF log record for the UndecodableRecords metric
+    """
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": "LMDataPublisher/Fanout",
+                "Dimensions": [[]],
+                "Metrics": [{"Name": "UndecodableRecords", "Unit": "Count"}],
+            }],
+        },
+        "UndecodableRecords": count,
+    }
+
+
+def _iter_encoded_rows(
+    kafka_entries: List[Tuple[str, str, Optional[str]]],
+    sources: "RowSources",
+    plan: Optional[FlattenPlan] = None,
+    validator: Optional[RowValidator] = None,
+    sample_rate: float = 1.0,
+    resource_cache: Optional[ResourceCache] = None,
+    interner: Optional[StringInterner] = None,
+    stop: Optional[Callable[[], bool]] = None,
+) -> Iterator[bytes]:
+    """
+    Decode, flatten and encode Kafka records one at a time, registering each with sources.
+
+    A record that cannot be decoded is registered as invalid and yields no
+    rows, so one bad payload never fails the rest of the batch; the handler
+    spills or redelivers it. Once stop() returns True (e.g. the retry
+    deadline passed) no further record is decoded and the stream ends; the
+    records left are the ones sources never registered.
+
+    Yields:
+        Newline-terminated JSON row events, in record order
+    """
+    for record_id, value_b64, content_type in kafka_entries:
+        if stop is not None and stop():
+            return
+        try:
+            rows, rejected = _encode_kafka_value(
+                value_b64, plan, validator, sample_rate, sources.decode, content_type,
+                resource_cache, interner,
+            )
+        except ValueError as e:
+            sources.add_invalid(record_id, str(e))
+            continue
+        if rejected is not None:
+            sources.add_checked(record_id, len(rows), rejected)
+        sources.add(record_id, len(rows))
+        yield from rows
+
+
+def flatten_in_processes(
+    kafka_entries: List[Tuple[str, str, Optional[str]]],
+    workers: int,
+    sources: Optional["RowSources"] = None,
+    plan: Optional[FlattenPlan] = None,
+    validator: Optional[RowValidator] = None,
+    sample_rate: float = 1.0,
+    resource_cache: Optional[ResourceCache] = None,
+    interner: Optional[StringInterner] = None,
+    stop: Optional[Callable[[], bool]] = None,
+) -> Iterator[bytes]:
+    """
+    Decode, flatten and encode Kafka record values across forked worker processes.
+
+    Entries are split into contiguous chunks, one per worker. Each worker
+    returns a JSON header line (per-record row counts, or the decode error,
+    and its decode, resource cache and attribute shape stats) followed by its
+    rows as one newline-delimited blob, which the parent
+    splits back into rows in the original order. A validated record's header
+    entry is [valid row count, rejection codes], and its rejected rows follow
+    its valid ones.
+
+    Args:
+        kafka_entries: (record_id, value_b64, content_type) entries of base64-encoded OTLP bundles
+        workers: Number of worker processes
+        sources: Receives each record's row count (or decode error) before its rows
+        plan: Flatten plan (default PLAN), inherited by the workers through fork;
+            their attribute shape counts are added to its attribute_shapes
+        validator: Row validator run in the workers (None skips validation)
+        sample_rate: Share of records validated
+        resource_cache: Resource fragment cache; workers read their fork-time
+            copy and only their hit/miss counts come back to it
+        interner: String interner; workers intern into their fork-time copy
+        stop: Checked before each chunk's rows are handed on; once it returns
+            True the stream ends and the remaining records stay unregistered
+
+    Returns:
+        Iterator over newline-terminated JSON row events, in record order. The
+        workers are forked before this returns, so call it from the thread
+        that starts the pipeline stage, before starting it.
+    """
+    from process_pool import run_forked, split_evenly
+
+    sources = sources if sources is not None else RowSources()
+    if stop is not None and stop():
+        return iter(())
+    chunks = split_evenly(kafka_entries, workers)
+    work = partial(
+        _encode_kafka_chunk,
+        plan=plan,
+        validator=validator,
+        sample_rate=sample_rate,
+        resource_cache=resource_cache,
+        interner=interner,
+    )
+    # Fork now, in the calling thread, not when the rows are first read
+    # (from the pipeline stage thread, alongside the send pool)
+    results = run_forked(chunks, work)
+    return _iter_forked_rows(chunks, results, sources, plan, resource_cache, stop)
+
+
+def _iter_forked_rows(
+    chunks: List[List[Tuple[str, str, Optional[str]]]],
+    results: Iterator[bytes],
+    sources: "RowSources",
+    plan: Optional[FlattenPlan],
+    resource_cache: Optional[ResourceCache],
+    stop: Optional[Callable[[], bool]],
+) -> Iterator[bytes]:
+    """Split each worker's reply into rows, registering records and merging stats (see flatten_in_processes)."""
+    attribute_shapes = (plan or PLAN).attribute_shapes
+    for chunk, blob in zip(chunks, results):
+        if stop is not None and stop():
+            return
+        lines = blob.splitlines(keepends=True)
+        header = json.loads(lines[0])
+        sources.decode.merge(header["decode"])
+        attribute_shapes.merge(header["attribute_shapes"])
+        if resource_cache is not None:
+            resource_cache.merge(header["resource_cache"])
+        position = 1
+        for (record_id, _, _), outcome in zip(chunk, header["records"]):
+            if isinstance(outcome, str):
+                sources.add_invalid(record_id, outcome)
+                continue
+            codes = []
+            if isinstance(outcome, list):
+                # Validated record: [valid row count, error codes of the rejected rows after them]
+                outcome, codes = outcome
+                rejected = lines[position + outcome:position + outcome + len(codes)]
+                sources.add_checked(record_id, outcome, list(zip(codes, rejected)))
+            sources.add(record_id, outcome)
+            yield from lines[position:position + outcome]
+            position += outcome + len(codes)
+
+
+def _encode_kafka_chunk(
+    kafka_entries: List[Tuple[str, str, Optional[str]]],
+    plan: Optional[FlattenPlan] = None,
+    validator: Optional[RowValidator] = None,
+    sample_rate: float = 1.0,
+    resource_cache: Optional[ResourceCache] = None,
+    interner: Optional[StringInterner] = None,
+) -> bytes:
+    """Worker body: decode, flatten and encode a chunk of records into one blob."""
+    outcomes = []
+    parts = []
+    decode_stats = DecodeStats()
+    # The forked cache starts with the parent's counters; report only this chunk's
+    cache_before = resource_cache.report() if resource_cache is not None else None
+    attribute_shapes = (plan or PLAN).attribute_shapes
+    attribute_shapes.reset_stats()
+    for _, value_b64, content_type in kafka_entries:
+        try:
+            rows, rejected = _encode_kafka_value(
+                value_b64, plan, validator, sample_rate, decode_stats, content_type,
+                resource_cache, interner,
+            )
+        except ValueError as e:
+            outcomes.append(str(e))
+            continue
+        if rejected is None:
+            outcomes.append(len(rows))
+        else:
+            outcomes.append([len(rows), [code for code, _ in rejected]])
+        parts.extend(rows)
+        parts.extend(row for _, row in rejected or ())
+    header = {
+        "records": outcomes,
+        "decode": decode_stats.report(),
+        "attribute_shapes": attribute_shapes.report(),
+    }
+    if resource_cache is not None:
+        cache_after = resource_cache.report()
+        header["resource_cache"] = {
+            counter: cache_after[counter] - cache_before[counter]
+            for counter in ("hits", "misses", "evictions")
+        }
+    return (json.dumps(header) + "\n").encode("utf-8") + b"".join(parts)
 
 
 def batch_to_firehose(
-    rows: List[Dict[str, Any]],
+    rows: Iterable[Union[Dict[str, Any], RowEvent, bytes]],
     stream_name: str,
     batch_size: int = 500,
     max_retries: int = 3,
-    firehose_client=None
+    firehose_client=None,
+    max_batch_bytes: int = FIREHOSE_MAX_BATCH_BYTES,
+    max_record_bytes: int = FIREHOSE_MAX_RECORD_BYTES,
+    aggregate_bytes: int = 0,
+    max_in_flight: int = 1,
+    pipeline_depth: int = 0,
+    retry_scheduler: Optional[RetryScheduler] = None,
+    rate_controller: Optional[AimdController] = None,
+    on_undelivered: Optional[Callable[[int, bytes], None]] = None,
 ) -> Dict[str, Any]:
     """
     Write row events to Firehose in batches with retry logic.
 
+    Rows are consumed lazily: each batch is sent as soon as it fills, so a
+    generator input is never fully materialized. A batch closes at whichever
+    limit is reached first: batch_size records or max_batch_bytes encoded
+    bytes. Rows larger than max_record_bytes can never be accepted by
+    Firehose; they are split off and reported as oversized instead of failing
+    the whole PutRecordBatch call.
+
+    With aggregate_bytes > 0, consecutive newline-terminated rows are packed
+    into one Firehose record of up to aggregate_bytes (capped at
+    max_record_bytes), and the Snowflake destination de-aggregates them. A
+    failed aggregate is retried as a unit, so only its own rows are re-sent,
+    and row counts in the summary stay per row.
+
+    With max_in_flight > 1, batches are dispatched on a thread pool sharing
+    one Firehose client, with at most max_in_flight PutRecordBatch calls
+    (each with its own retries) outstanding. Results are collected in batch
+    order, so the summary is the same as a sequential run.
+
+    With pipeline_depth > 0, pulling rows (and therefore the decode, flatten
+    and encode work of a generator input) and batching them runs on a
+    background stage that stays up to pipeline_depth batches ahead of the send
+    stage, so CPU work overlaps in-flight PutRecordBatch calls. The stage
+    layout, queue depth and per-stage busy/idle time are reported.
+
+    Rows are numbered by their position in the input; failed_rows lists the
+    (first_row, row_count) ranges that still failed after retries, so callers
+    can map them back to their sources.
+
+    Retries are paced by retry_scheduler, shared by all batches: throttled
+    records back off with decorrelated jitter, all retries draw from one
+    budget, and once its deadline passes nothing more is retried or sent.
+    Rows left unsent at the deadline are reported as failed.
+
+    With a rate_controller, every PutRecordBatch attempt is paced to its
+    current send rate and batches close at its current batch size (never
+    above batch_size); each attempt's failures, throttling and latency feed
+    back into both.
+
+    on_undelivered, if given, is called with (first_row, record) for every
+    record that was not delivered: failed after retries, left unsent at the
+    deadline, or oversized.
+
     Args:
-        rows: List of row event dictionaries
+        rows: Iterable of row event dictionaries, RowEvents, or
+            pre-encoded, newline-terminated JSON lines
         stream_name: Firehose delivery stream name
         batch_size: Maximum records per batch (default 500, AWS limit)
         max_retries: Maximum retry attempts for failed records
+        max_batch_bytes: Maximum encoded bytes per batch (default 4 MiB, AWS limit)
+        max_record_bytes: Maximum encoded bytes per record (default 1000 KiB, AWS limit)
+        aggregate_bytes: Target bytes per aggregated record (0 disables aggregation)
+        max_in_flight: Maximum concurrent PutRecordBatch calls (1 sends sequentially)
+        pipeline_depth: Batches buffered between the encode and send stages (0 disables)
+        retry_scheduler: Retry pacing, budget and deadline (default: no budget or deadline)
+        rate_controller: AIMD send-rate controller (None sends unpaced)
+        on_undelivered: Receives (first_row, record) for undelivered records
 
     Returns:
-        Summary dict with total_records, failed_records, batches
+        Summary dict with total_records, failed_records and oversized_records
+        (all counted in rows), put_records (Firehose records sent), batches,
+        batch_fill (per-batch record/byte counts and fill ratios), failed_rows
+        (row position ranges), pipeline (stage report, or None when
+        pipeline_depth is 0), retry (retries spent, budget and deadline state)
+        and rate_control (controller state, or None without a rate_controller)
     """
-    total_records = len(rows)
+    total_records = 0
     total_failed = 0
+    put_records = 0
     batch_count = 0
+    batch_fill = []
+    failed_rows = []
+    oversized = []
+    aggregated = aggregate_bytes > 0
+    if retry_scheduler is None:
+        retry_scheduler = RetryScheduler()
 
-    # Get Firehose client
-    if firehose_client is None:
-        firehose_client = get_firehose_client()
+    records = map(_encode_record, rows)
+    if aggregated:
+        records = _iter_aggregates(records, min(aggregate_bytes, max_record_bytes))
 
-    # Split into batches
-    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+    batches = _iter_batches(
+        records, batch_size, max_batch_bytes, max_record_bytes, oversized, aggregated,
+        rate_controller,
+    )
+    stage = None
+    if pipeline_depth > 0:
+        stage = BackgroundStage(
+            batches,
+            pipeline_depth,
+            producer_name="decode_flatten_encode",
+            consumer_name="send",
+            consumer_threads=max_in_flight,
+        )
+        batches = stage
+
+    executor = None
+    if max_in_flight > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    in_flight = deque()
+
+    try:
+        for batch, batch_bytes, first_rows in batches:
+            # Get Firehose client on first use (empty inputs never need one)
+            if firehose_client is None:
+                firehose_client = get_firehose_client()
+
+            batch_rows = _count_rows(batch) if aggregated else len(batch)
+            total_records += batch_rows
+            put_records += len(batch)
+            batch_count += 1
+            batch_fill.append({
+                "rows": batch_rows,
+                "records": len(batch),
+                "bytes": batch_bytes,
+                "record_fill": round(len(batch) / batch_size, 3),
+                "byte_fill": round(batch_bytes / max_batch_bytes, 3),
+            })
+
+            if executor is None:
+                failed_positions = _put_batch_with_retry(
+                    batch,
+                    stream_name,
+                    max_retries,
+                    firehose_client,
+                    retry_scheduler,
+                    rate_controller,
+                )
+                total_failed += _collect_failed_rows(
+                    failed_positions, batch, first_rows, aggregated, failed_rows, on_undelivered
+                )
+                continue
+
+            in_flight.append((executor.submit(
+                _put_batch_with_retry,
+                batch,
+                stream_name,
+                max_retries,
+                firehose_client,
+                retry_scheduler,
+                rate_controller,
+            ), batch, first_rows))
+            # Backpressure: wait for the oldest batch before filling another
+            if len(in_flight) >= max_in_flight:
+                future, sent, sent_first_rows = in_flight.popleft()
+                total_failed += _collect_failed_rows(
+                    future.result(), sent, sent_first_rows, aggregated, failed_rows,
+                    on_undelivered,
+                )
 
-    for batch in batches:
-        batch_count += 1
-        failed_records = _put_batch_with_retry(
-            batch,
-            stream_name,
-            max_retries,
-            firehose_client
+        while in_flight:
+            future, sent, sent_first_rows = in_flight.popleft()
+            total_failed += _collect_failed_rows(
+                future.result(), sent, sent_first_rows, aggregated, failed_rows, on_undelivered
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if stage is not None:
+            stage.close()
+
+    for first_row, record in oversized:
+        action = "Dropping" if on_undelivered is None else "Spilling"
+        print(
+            f"Warning: {action} {len(record)}-byte row over the {max_record_bytes}-byte "
+            f"Firehose record limit: {record[:200]!r}"
         )
-        total_failed += len(failed_records)
+        if on_undelivered is not None:
+            on_undelivered(first_row, record)
 
     return {
         "total_records": total_records,
         "failed_records": total_failed,
-        "batches": batch_count
+        "oversized_records": len(oversized),
+        "put_records": put_records,
+        "batches": batch_count,
+        "batch_fill": batch_fill,
+        "failed_rows": failed_rows,
+        "pipeline": stage.report() if stage is not None else None,
+        "retry": retry_scheduler.report(),
+        "rate_control": rate_controller.report() if rate_controller is not None else None,
     }
 
 
+def _iter_aggregates(records: Iterable[bytes], target_bytes: int) -> Iterator[bytes]:
+    """
+    Pack consecutive newline-terminated rows into records of up to target_bytes.
+
+    A row that alone exceeds target_bytes is emitted on its own.
+
+    Args:
+        records: Encoded, newline-terminated rows
+        target_bytes: Target size of each aggregated record
+
+    Yields:
+        Aggregated records (newline-delimited JSON)
+    """
+    parts = []
+    size = 0
+    for record in records:
+        if parts and size + len(record) > target_bytes:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+        parts.append(record)
+        size += len(record)
+    if parts:
+        yield b"".join(parts)
+
+
+def _count_rows(records: List[bytes]) -> int:
+    """Count the row events in encoded records (every row ends with one newline)."""
+    return sum(record.count(b"\n") for record in records)
+
+
+def _collect_failed_rows(
+    failed_positions: List[int],
+    batch: List[bytes],
+    first_rows: List[int],
+    aggregated: bool,
+    failed_rows: List[List[int]],
+    on_undelivered: Optional[Callable[[int, bytes], None]] = None,
+) -> int:
+    """
+    Append the row ranges of a batch's failed records to failed_rows.
+
+    Args:
+        failed_positions: Batch positions of records that failed after retries
+        batch: Encoded records of the batch
+        first_rows: Row position of each record's first row
+        aggregated: Whether records hold several newline-terminated rows
+        failed_rows: Receives [first_row, row_count] ranges
+        on_undelivered: Receives (first_row, record) for each failed record
+
+    Returns:
+        Number of failed rows
+    """
+    total = 0
+    for position in failed_positions:
+        row_count = batch[position].count(b"\n") if aggregated else 1
+        failed_rows.append([first_rows[position], row_count])
+        if on_undelivered is not None:
+            on_undelivered(first_rows[position], batch[position])
+        total += row_count
+    return total
+
+
+def _iter_batches(
+    records: Iterable[bytes],
+    batch_size: int,
+    max_batch_bytes: int,
+    max_record_bytes: int,
+    oversized: List[tuple],
+    aggregated: bool = False,
+    rate_controller: Optional[AimdController] = None,
+) -> Iterator[tuple]:
+    """
+    Group encoded records into PutRecordBatch-sized batches.
+
+    A batch is yielded as soon as adding the next record would exceed
+    max_batch_bytes, or once it holds batch_size records (or the rate
+    controller's current batch size, if smaller).
+
+    Args:
+        records: Iterable of encoded Firehose records
+        batch_size: Maximum records per batch
+        max_batch_bytes: Maximum total encoded bytes per batch
+        max_record_bytes: Maximum encoded bytes for a single record
+        oversized: Receives (first_row, record) for records larger than max_record_bytes
+        aggregated: Whether records hold several newline-terminated rows
+        rate_controller: Supplies the current batch size limit
+
+    Yields:
+        (records, total_bytes, first_rows) tuples of encoded records, where
+        first_rows holds the input row position of each record's first row
+    """
+    batch = []
+    first_rows = []
+    batch_bytes = 0
+    row_position = 0
+    for record in records:
+        size = len(record)
+        first_row = row_position
+        row_position += record.count(b"\n") if aggregated else 1
+
+        if size > max_record_bytes:
+            oversized.append((first_row, record))
+            continue
+
+        if batch and batch_bytes + size > max_batch_bytes:
+            yield batch, batch_bytes, first_rows
+            batch = []
+            first_rows = []
+            batch_bytes = 0
+
+        batch.append(record)
+        first_rows.append(first_row)
+        batch_bytes += size
+
+        limit = batch_size
+        if rate_controller is not None:
+            limit = min(batch_size, rate_controller.batch_size)
+        if len(batch) >= limit:
+            yield batch, batch_bytes, first_rows
+            batch = []
+            first_rows = []
+            batch_bytes = 0
+
+    if batch:
+        yield batch, batch_bytes, first_rows
+
+
+def _encode_record(row: Union[Dict[str, Any], RowEvent, bytes]) -> bytes:
+    """Serialize a row event as a newline-terminated JSON line (pre-encoded rows pass through)."""
+    if isinstance(row, bytes):
+        return row
+    if isinstance(row, RowEvent):
+        return row.to_json()
+    return (CODEC.dumps(row) + "\n").encode("utf-8")
+
+
 def _put_batch_with_retry(
-    rows: List[Dict[str, Any]],
+    rows: List[bytes],
     stream_name: str,
     max_retries: int,
-    firehose_client
-) -> List[Dict[str, Any]]:
+    firehose_client,
+    retry_scheduler: Optional[RetryScheduler] = None,
+    rate_controller: Optional[AimdController] = None,
+) -> List[int]:
     """
-    Put a batch to Firehose with exponential backoff retry for failed records.
+    Put a batch to Firehose, retrying failed records as the scheduler allows.
+
+    A call that raises (throttling, network errors) counts as every pending
+    record failing, so it is retried like a partial failure rather than
+    failing the invocation. Retrying stops after max_retries, or earlier when
+    the scheduler's budget or deadline runs out; past the deadline the batch
+    is not sent at all. With a rate_controller, each attempt waits for its
+    send slot and reports its outcome back to the controller; an attempt
+    whose slot would start past the deadline is given up without waiting or
+    reserving the slot.
 
     Args:
-        rows: Batch of row events
+        rows: Batch of encoded row events
         stream_name: Firehose delivery stream name
-        max_retries: Maximum retry attempts
+        max_retries: Maximum retry attempts for this batch
+        retry_scheduler: Retry pacing, budget and deadline (default: no budget or deadline)
+        rate_controller: AIMD send-rate controller (None sends unpaced)
 
     Returns:
-        List of rows that failed after all retries
+        Batch positions of the rows that were not delivered
     """
-    records_to_send = rows
+    if retry_scheduler is None:
+        retry_scheduler = RetryScheduler()
+
+    pending = list(range(len(rows)))
     retry_count = 0
+    delay = 0.0
+
+    while pending:
+        if retry_scheduler.expired():
+            break
+
+        if rate_controller is not None:
+            # Pacing never waits past the deadline; a slot beyond it is not reserved
+            wait = rate_controller.acquire(len(pending), retry_scheduler.remaining())
+            if wait is None:
+                retry_scheduler.mark_deadline()
+                break
+            if wait > 0:
+                time.sleep(wait)
 
-    while records_to_send and retry_count <= max_retries:
         # Format records for Firehose
-        firehose_records = [
-            {"Data": (json.dumps(row) + "\n").encode("utf-8")}
-            for row in records_to_send
-        ]
+        firehose_records = [{"Data": rows[position]} for position in pending]
+        sent = len(pending)
+        started = time.perf_counter()
 
         # Send to Firehose
-        response = firehose_client.put_record_batch(
-            DeliveryStreamName=stream_name,
-            Records=firehose_records
-        )
-
-        # Check for failures
-        failed_count = response.get("FailedPutCount", 0)
+        try:
+            response = firehose_client.put_record_batch(
+                DeliveryStreamName=stream_name,
+                Records=firehose_records
+            )
+        except ClientError as e:
+            print(f"Warning: PutRecordBatch of {len(pending)} records failed: {e}")
+            error_codes = [e.response.get("Error", {}).get("Code", "")]
+        except BotoCoreError as e:
+            print(f"Warning: PutRecordBatch of {len(pending)} records failed: {e}")
+            error_codes = []
+        else:
+            if response.get("FailedPutCount", 0) == 0:
+                # All succeeded
+                if rate_controller is not None:
+                    rate_controller.observe(sent, 0, False, time.perf_counter() - started)
+                return []
 
-        if failed_count == 0:
-            # All succeeded
-            return []
+            # Collect failed records for retry
+            failed = [
+                (pending[i], resp["ErrorCode"])
+                for i, resp in enumerate(response.get("RequestResponses", []))
+                if "ErrorCode" in resp
+            ]
+            pending = [position for position, _ in failed]
+            error_codes = [code for _, code in failed]
 
-        # Collect failed records for retry
-        failed_records = []
-        response_list = response.get("RequestResponses", [])
+        throttled = is_throttling(error_codes)
+        if rate_controller is not None:
+            rate_controller.observe(sent, len(pending), throttled, time.perf_counter() - started)
 
-        for i, resp in enumerate(response_list):
-            if "ErrorCode" in resp:
-                # This record failed
-                failed_records.append(records_to_send[i])
+        if not pending or retry_count >= max_retries:
+            break
 
-        # Prepare for retry
-        records_to_send = failed_records
+        delay = retry_scheduler.next_delay(delay, throttled)
+        if delay is None:
+            break
         retry_count += 1
+        time.sleep(delay)
 
-        if records_to_send and retry_count <= max_retries:
-            # Exponential backoff
-            time.sleep(2 ** retry_count * 0.1)
-
-    # Return records that failed after all retries
-    return records_to_send
+    # Return records that were not delivered
+    return pending
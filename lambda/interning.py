@@ -0,0 +1,47 @@
+# ABOUTME: String interning table shared by the flatten path
+# ABOUTME: Makes repeated metric names, timestamps, instances and attribute keys/values one object each
+
+from typing import Any, Dict, Optional
+
+
+class StringInterner:
+    """
+    Table mapping each distinct string to one shared instance.
+
+    json.loads allocates every occurrence of a value separately, and a
+    bundle repeats the same instance names, attribute values and timestamps
+    on thousands of datapoints. Interning what the flattener keeps lets the
+    bundle's duplicates be freed once it is flattened.
+
+    Unlike sys.intern the table is owned by its scope: per invocation it is
+    dropped with the invocation, and a warm-container table is emptied by
+    trim() once it passes max_entries.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Args:
+            max_entries: Entries trim() allows before emptying the table (None: unbounded)
+        """
+        self.max_entries = max_entries
+        self.table: Dict[str, str] = {}
+        self.resets = 0
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def intern(self, value: Any) -> Any:
+        """Return the shared instance of a string; other values pass through."""
+        if type(value) is str:
+            return self.table.setdefault(value, value)
+        return value
+
+    def trim(self) -> None:
+        """Empty the table if it has grown past max_entries (call between invocations)."""
+        if self.max_entries is not None and len(self.table) > self.max_entries:
+            self.table.clear()
+            self.resets += 1
+
+    def report(self) -> Dict[str, Any]:
+        """Describe the table."""
+        return {"entries": len(self.table), "resets": self.resets}
@@ -0,0 +1,545 @@
+# ABOUTME: Pure-Python codec for binary OTLP ExportMetricsServiceRequest payloads
+# ABOUTME: Decodes to (and encodes from) the OTLP/JSON bundle shape the flattener consumes
+
+import base64
+import struct
+from typing import Any, Dict, List, Tuple
+
+# Kafka content-type header values meaning a binary protobuf payload
+PROTOBUF_CONTENT_TYPES = frozenset({
+    "application/x-protobuf",
+    "application/protobuf",
+    "application/vnd.google.protobuf",
+})
+
+# Protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LEN = 2
+_FIXED32 = 5
+
+_DOUBLE = struct.Struct("<d")
+_UINT64 = struct.Struct("<Q")
+_INT64 = struct.Struct("<q")
+
+_TWO_63 = 1 << 63
+_TWO_64 = 1 << 64
+
+# Metric data fields the flattener reads; histograms and summaries decode to
+# a metric with only its name, description and unit, which flattens to no rows
+_NUMBER_METRICS = {5: "gauge", 7: "sum"}
+
+# Bytes RFC 8259 allows before a JSON value
+_JSON_WHITESPACE = b" \t\n\r"
+
+
+def is_protobuf(document: bytes) -> bool:
+    """
+    Sniff whether a (decompressed) payload is a protobuf ExportMetricsServiceRequest.
+
+    An OTLP/JSON bundle is an object, so its first byte after any JSON
+    whitespace is "{"; any other payload is taken for protobuf. A request
+    starts with field 1 (resource_metrics), tag byte 0x0A, which is also LF,
+    and the length after it may be "{" (123) or another whitespace byte. A
+    payload starting with 0x0A whose first non-whitespace byte is "{" is
+    therefore protobuf only if its top-level fields frame it exactly. Empty
+    and all-whitespace payloads are left to the JSON parser to reject.
+    """
+    end = len(document)
+    pos = 0
+    while pos < end and document[pos] in _JSON_WHITESPACE:
+        pos += 1
+    if pos == end:
+        return False
+    if document[pos] != 0x7B:
+        return True
+    return document[0] == 0x0A and _frames_export_request(document)
+
+
+def _frames_export_request(buf: bytes) -> bool:
+    """Check buf is a sequence of resource_metrics fields ending exactly at its end."""
+    end = len(buf)
+    pos = 0
+    try:
+        while pos < end:
+            if buf[pos] != 0x0A:
+                return False
+            length, pos = _varint(buf, pos + 1)
+            pos += length
+    except (IndexError, ValueError):
+        return False
+    return pos == end
+
+
+def decode_export_request(data: bytes) -> Dict[str, Any]:
+    """
+    Decode a binary ExportMetricsServiceRequest into an OTLP/JSON-shaped bundle.
+
+    Field names and value spellings follow the OTLP/JSON mapping, so the
+    result flattens to the same rows as the equivalent JSON payload:
+    timestamps become decimal strings, bytes become base64 and enums stay
+    integers. asInt and intValue become Python ints, as numeric JSON writes
+    them, so a row value passes the schema's number check. Exemplars and
+    metric types other than gauge and sum are skipped.
+
+    Args:
+        data: Serialized request
+
+    Returns:
+        Bundle with "resourceMetrics"
+
+    Raises:
+        ValueError: Truncated or malformed protobuf
+    """
+    # Datapoint attributes repeat across a bundle (the same instance and
+    # datasource keys on every point), so each distinct encoded KeyValue is
+    # decoded once and its dict shared; the flattener only reads them
+    attribute_memo: Dict[bytes, Dict[str, Any]] = {}
+    try:
+        resource_metrics = []
+        pos, end = 0, len(data)
+        while pos < end:
+            tag, pos = _tag(data, pos)
+            if tag == _TAG_1_LEN:
+                length, pos = _length(data, pos)
+                resource_metrics.append(_resource_metrics(data, pos, pos + length, attribute_memo))
+                pos += length
+            else:
+                pos = _skip(data, pos, tag)
+        _check_end(pos, end)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Malformed OTLP protobuf: {e!r}") from e
+    return {"resourceMetrics": resource_metrics}
+
+
+# Field tags, (field number << 3) | wire type, as they appear on the wire
+_TAG_1_LEN = 0x0A
+_TAG_2_VARINT = 0x10
+_TAG_2_LEN = 0x12
+_TAG_2_FIXED64 = 0x11
+_TAG_3_VARINT = 0x18
+_TAG_3_FIXED64 = 0x19
+_TAG_3_LEN = 0x1A
+_TAG_4_VARINT = 0x20
+_TAG_4_FIXED64 = 0x21
+_TAG_5_LEN = 0x2A
+_TAG_6_FIXED64 = 0x31
+_TAG_6_LEN = 0x32
+_TAG_7_LEN = 0x3A
+_TAG_8_VARINT = 0x40
+
+
+def _varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 70:
+            raise ValueError("Varint longer than 10 bytes")
+
+
+def _tag(buf: bytes, pos: int) -> Tuple[int, int]:
+    # Every tag this decoder reads fits in one byte; longer ones are skipped
+    byte = buf[pos]
+    if byte < 0x80:
+        return byte, pos + 1
+    return _varint(buf, pos)
+
+
+_length = _tag
+
+
+def _skip(buf: bytes, pos: int, tag: int) -> int:
+    """Step over the value of a field this decoder does not read."""
+    wire = tag & 7
+    if wire == _VARINT:
+        return _varint(buf, pos)[1]
+    if wire == _FIXED64:
+        return pos + 8
+    if wire == _LEN:
+        length, pos = _length(buf, pos)
+        return pos + length
+    if wire == _FIXED32:
+        return pos + 4
+    raise ValueError(f"Unsupported protobuf wire type {wire}")
+
+
+def _check_end(pos: int, end: int) -> None:
+    if pos != end:
+        raise ValueError("Field runs past the end of its message")
+
+
+def _resource_metrics(buf: bytes, pos: int, end: int, memo: Dict[bytes, Any]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    scope_metrics = []
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == _TAG_1_LEN:
+            length, pos = _length(buf, pos)
+            result["resource"] = {"attributes": _attributes(buf, pos, pos + length, _TAG_1_LEN)}
+            pos += length
+        elif tag == _TAG_2_LEN:
+            length, pos = _length(buf, pos)
+            scope_metrics.append(_scope_metrics(buf, pos, pos + length, memo))
+            pos += length
+        elif tag == _TAG_3_LEN:
+            length, pos = _length(buf, pos)
+            result["schemaUrl"] = buf[pos:pos + length].decode("utf-8")
+            pos += length
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    result["scopeMetrics"] = scope_metrics
+    return result
+
+
+def _attributes(buf: bytes, pos: int, end: int, attribute_tag: int) -> List[Dict[str, Any]]:
+    """Decode the repeated KeyValue field (attribute_tag) of a Resource or InstrumentationScope."""
+    attributes = []
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == attribute_tag:
+            length, pos = _length(buf, pos)
+            attributes.append(_key_value(buf, pos, pos + length))
+            pos += length
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    return attributes
+
+
+def _scope_metrics(buf: bytes, pos: int, end: int, memo: Dict[bytes, Any]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    metrics = []
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == _TAG_2_LEN:
+            length, pos = _length(buf, pos)
+            metrics.append(_metric(buf, pos, pos + length, memo))
+            pos += length
+        elif tag == _TAG_1_LEN:
+            length, pos = _length(buf, pos)
+            result["scope"] = _scope(buf, pos, pos + length)
+            pos += length
+        elif tag == _TAG_3_LEN:
+            length, pos = _length(buf, pos)
+            result["schemaUrl"] = buf[pos:pos + length].decode("utf-8")
+            pos += length
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    result["metrics"] = metrics
+    return result
+
+
+def _scope(buf: bytes, pos: int, end: int) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == _TAG_1_LEN or tag == _TAG_2_LEN:
+            length, pos = _length(buf, pos)
+            result["name" if tag == _TAG_1_LEN else "version"] = buf[pos:pos + length].decode("utf-8")
+            pos += length
+        elif tag == _TAG_3_LEN:
+            length, pos = _length(buf, pos)
+            result.setdefault("attributes", []).append(_key_value(buf, pos, pos + length))
+            pos += length
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    return result
+
+
+def _metric(buf: bytes, pos: int, end: int, memo: Dict[bytes, Any]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag & 7 != _LEN:
+            pos = _skip(buf, pos, tag)
+            continue
+        length, pos = _length(buf, pos)
+        field = tag >> 3
+        if field in _NUMBER_METRICS:
+            result[_NUMBER_METRICS[field]] = _number_metric(buf, pos, pos + length, memo)
+        elif field == 1:
+            result["name"] = buf[pos:pos + length].decode("utf-8")
+        elif field == 2:
+            result["description"] = buf[pos:pos + length].decode("utf-8")
+        elif field == 3:
+            result["unit"] = buf[pos:pos + length].decode("utf-8")
+        pos += length
+    _check_end(pos, end)
+    return result
+
+
+def _number_metric(buf: bytes, pos: int, end: int, memo: Dict[bytes, Any]) -> Dict[str, Any]:
+    """Decode a Gauge or Sum (they share field 1; Sum adds fields 2 and 3)."""
+    result: Dict[str, Any] = {}
+    data_points = []
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == _TAG_1_LEN:
+            length, pos = _length(buf, pos)
+            data_points.append(_number_data_point(buf, pos, pos + length, memo))
+            pos += length
+        elif tag == _TAG_2_VARINT:
+            result["aggregationTemporality"], pos = _varint(buf, pos)
+        elif tag == _TAG_3_VARINT:
+            value, pos = _varint(buf, pos)
+            result["isMonotonic"] = bool(value)
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    result["dataPoints"] = data_points
+    return result
+
+
+def _number_data_point(buf: bytes, pos: int, end: int, memo: Dict[bytes, Any]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    attributes = []
+    while pos < end:
+        # Hot loop: one-byte tags and lengths are read inline
+        tag = buf[pos]
+        pos += 1
+        if tag >= 0x80:
+            tag, pos = _varint(buf, pos - 1)
+        if tag == _TAG_7_LEN:
+            length = buf[pos]
+            pos += 1
+            if length >= 0x80:
+                length, pos = _varint(buf, pos - 1)
+            raw = buf[pos:pos + length]
+            attribute = memo.get(raw)
+            if attribute is None:
+                attribute = memo[raw] = _key_value(buf, pos, pos + length)
+            attributes.append(attribute)
+            pos += length
+        elif tag == _TAG_3_FIXED64:
+            result["timeUnixNano"] = str(_UINT64.unpack_from(buf, pos)[0])
+            pos += 8
+        elif tag == _TAG_4_FIXED64:
+            result["asDouble"] = _DOUBLE.unpack_from(buf, pos)[0]
+            pos += 8
+        elif tag == _TAG_6_FIXED64:
+            result["asInt"] = _INT64.unpack_from(buf, pos)[0]
+            pos += 8
+        elif tag == _TAG_2_FIXED64:
+            result["startTimeUnixNano"] = str(_UINT64.unpack_from(buf, pos)[0])
+            pos += 8
+        elif tag == _TAG_8_VARINT:
+            flags, pos = _varint(buf, pos)
+            if flags:
+                result["flags"] = flags
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    if attributes:
+        result["attributes"] = attributes
+    return result
+
+
+def _key_value(buf: bytes, pos: int, end: int) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == _TAG_1_LEN:
+            length, pos = _length(buf, pos)
+            result["key"] = buf[pos:pos + length].decode("utf-8")
+            pos += length
+        elif tag == _TAG_2_LEN:
+            length, pos = _length(buf, pos)
+            result["value"] = _any_value(buf, pos, pos + length)
+            pos += length
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    return result
+
+
+def _any_value(buf: bytes, pos: int, end: int) -> Dict[str, Any]:
+    # A oneof: the last value on the wire wins
+    result: Dict[str, Any] = {}
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == _TAG_1_LEN:
+            length, pos = _length(buf, pos)
+            result = {"stringValue": buf[pos:pos + length].decode("utf-8")}
+            pos += length
+        elif tag == _TAG_3_VARINT:
+            value, pos = _varint(buf, pos)
+            result = {"intValue": value - _TWO_64 if value >= _TWO_63 else value}
+        elif tag == _TAG_4_FIXED64:
+            result = {"doubleValue": _DOUBLE.unpack_from(buf, pos)[0]}
+            pos += 8
+        elif tag == _TAG_2_VARINT:
+            value, pos = _varint(buf, pos)
+            result = {"boolValue": bool(value)}
+        elif tag == _TAG_5_LEN or tag == _TAG_6_LEN:
+            length, pos = _length(buf, pos)
+            result = _any_list(buf, pos, pos + length, tag == _TAG_6_LEN)
+            pos += length
+        elif tag == _TAG_7_LEN:
+            length, pos = _length(buf, pos)
+            result = {"bytesValue": base64.b64encode(buf[pos:pos + length]).decode("ascii")}
+            pos += length
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    return result
+
+
+def _any_list(buf: bytes, pos: int, end: int, kvlist: bool) -> Dict[str, Any]:
+    """Decode an ArrayValue (of AnyValue) or KeyValueList (of KeyValue)."""
+    item = _key_value if kvlist else _any_value
+    values = []
+    while pos < end:
+        tag, pos = _tag(buf, pos)
+        if tag == _TAG_1_LEN:
+            length, pos = _length(buf, pos)
+            values.append(item(buf, pos, pos + length))
+            pos += length
+        else:
+            pos = _skip(buf, pos, tag)
+    _check_end(pos, end)
+    return {"kvlistValue" if kvlist else "arrayValue": {"values": values}}
+
+
+def encode_export_request(bundle: Dict[str, Any]) -> bytes:
+    """
+    Encode an OTLP/JSON-shaped bundle as a binary ExportMetricsServiceRequest.
+
+    Used to publish protobuf fixtures; non-OTLP keys (such as LMDP's scope
+    "epoch") have no protobuf field and are dropped.
+
+    Args:
+        bundle: Bundle with "resourceMetrics"
+
+    Returns:
+        Serialized request
+    """
+    return b"".join(
+        _len_field(1, _encode_resource_metrics(resource_metrics))
+        for resource_metrics in bundle.get("resourceMetrics", [])
+    )
+
+
+def _encode_varint(value: int) -> bytes:
+    if value < 0:
+        value += _TWO_64
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _len_field(field: int, payload: bytes) -> bytes:
+    return _encode_varint(field << 3 | _LEN) + _encode_varint(len(payload)) + payload
+
+
+def _varint_field(field: int, value: int) -> bytes:
+    return _encode_varint(field << 3 | _VARINT) + _encode_varint(value)
+
+
+def _fixed64_field(field: int, packer: struct.Struct, value: Any) -> bytes:
+    return _encode_varint(field << 3 | _FIXED64) + packer.pack(value)
+
+
+def _text_field(field: int, value: str) -> bytes:
+    return _len_field(field, value.encode("utf-8")) if value else b""
+
+
+def _encode_resource_metrics(resource_metrics: Dict[str, Any]) -> bytes:
+    parts = []
+    if "resource" in resource_metrics:
+        parts.append(_len_field(1, _encode_attributes(1, resource_metrics["resource"].get("attributes", []))))
+    for scope_metrics in resource_metrics.get("scopeMetrics", []):
+        parts.append(_len_field(2, _encode_scope_metrics(scope_metrics)))
+    parts.append(_text_field(3, resource_metrics.get("schemaUrl", "")))
+    return b"".join(parts)
+
+
+def _encode_scope_metrics(scope_metrics: Dict[str, Any]) -> bytes:
+    parts = []
+    if "scope" in scope_metrics:
+        scope = scope_metrics["scope"]
+        parts.append(_len_field(1, b"".join((
+            _text_field(1, scope.get("name", "")),
+            _text_field(2, scope.get("version", "")),
+            _encode_attributes(3, scope.get("attributes", [])),
+        ))))
+    for metric in scope_metrics.get("metrics", []):
+        parts.append(_len_field(2, _encode_metric(metric)))
+    parts.append(_text_field(3, scope_metrics.get("schemaUrl", "")))
+    return b"".join(parts)
+
+
+def _encode_metric(metric: Dict[str, Any]) -> bytes:
+    parts = [
+        _text_field(1, metric.get("name", "")),
+        _text_field(2, metric.get("description", "")),
+        _text_field(3, metric.get("unit", "")),
+    ]
+    for field, name in _NUMBER_METRICS.items():
+        if name in metric:
+            body = metric[name]
+            inner = [_len_field(1, _encode_data_point(dp)) for dp in body.get("dataPoints", [])]
+            if body.get("aggregationTemporality"):
+                inner.append(_varint_field(2, int(body["aggregationTemporality"])))
+            if body.get("isMonotonic"):
+                inner.append(_varint_field(3, 1))
+            parts.append(_len_field(field, b"".join(inner)))
+    return b"".join(parts)
+
+
+def _encode_data_point(data_point: Dict[str, Any]) -> bytes:
+    parts: List[bytes] = []
+    if data_point.get("startTimeUnixNano"):
+        parts.append(_fixed64_field(2, _UINT64, int(data_point["startTimeUnixNano"])))
+    if data_point.get("timeUnixNano"):
+        parts.append(_fixed64_field(3, _UINT64, int(data_point["timeUnixNano"])))
+    if "asDouble" in data_point:
+        parts.append(_fixed64_field(4, _DOUBLE, float(data_point["asDouble"])))
+    elif "asInt" in data_point:
+        parts.append(_fixed64_field(6, _INT64, int(data_point["asInt"])))
+    parts.append(_encode_attributes(7, data_point.get("attributes", [])))
+    if data_point.get("flags"):
+        parts.append(_varint_field(8, int(data_point["flags"])))
+    return b"".join(parts)
+
+
+def _encode_attributes(field: int, attributes: List[Dict[str, Any]]) -> bytes:
+    return b"".join(_len_field(field, _encode_key_value(attr)) for attr in attributes)
+
+
+def _encode_key_value(attr: Dict[str, Any]) -> bytes:
+    parts = [_text_field(1, attr.get("key", ""))]
+    if "value" in attr:
+        parts.append(_len_field(2, _encode_any_value(attr["value"])))
+    return b"".join(parts)
+
+
+def _encode_any_value(value: Dict[str, Any]) -> bytes:
+    if "stringValue" in value:
+        return _len_field(1, value["stringValue"].encode("utf-8"))
+    if "boolValue" in value:
+        return _varint_field(2, int(bool(value["boolValue"])))
+    if "intValue" in value:
+        return _varint_field(3, int(value["intValue"]))
+    if "doubleValue" in value:
+        return _fixed64_field(4, _DOUBLE, float(value["doubleValue"]))
+    if "arrayValue" in value:
+        items = value["arrayValue"].get("values", [])
+        return _len_field(5, b"".join(_len_field(1, _encode_any_value(item)) for item in items))
+    if "kvlistValue" in value:
+        items = value["kvlistValue"].get("values", [])
+        return _len_field(6, b"".join(_len_field(1, _encode_key_value(item)) for item in items))
+    if "bytesValue" in value:
+        return _len_field(7, base64.b64decode(value["bytesValue"]))
+    return b""
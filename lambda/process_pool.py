@@ -0,0 +1,99 @@
+# ABOUTME: Fork-based worker processes for CPU-bound flatten/encode on multi-vCPU Lambdas
+# ABOUTME: Uses Process + Pipe only, since Lambda has no /dev/shm for Pool or Queue semaphores
+
+import multiprocessing
+import os
+import traceback
+from typing import Any, Callable, Iterator, List, Sequence, Tuple
+
+# Status prefixes on each worker's reply
+_OK = b"\x00"
+_ERROR = b"\x01"
+
+
+def split_evenly(items: Sequence[Any], parts: int) -> List[Sequence[Any]]:
+    """
+    Split items into at most parts contiguous, near-equal chunks (order preserved).
+
+    Args:
+        items: Sequence to split
+        parts: Maximum number of chunks
+
+    Returns:
+        List of non-empty slices of items
+    """
+    parts = max(1, min(parts, len(items)))
+    size, extra = divmod(len(items), parts)
+    chunks = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return [chunk for chunk in chunks if len(chunk)]
+
+
+def run_forked(chunks: Sequence[Any], work: Callable[[Any], bytes]) -> Iterator[bytes]:
+    """
+    Run work(chunk) for every chunk in its own forked process.
+
+    Children inherit chunks and work through fork, so inputs are never
+    pickled; each child sends back a single compact bytes result over a pipe.
+
+    Every process is forked before this returns, in the calling thread. A
+    child only inherits the locks of the thread that forked, so call this
+    before starting other threads (pipeline stage, send pool) and read the
+    results from any thread. Consume the returned iterator to reap the workers.
+
+    Args:
+        chunks: Work items, one per process
+        work: Function turning a chunk into bytes (runs in the child)
+
+    Returns:
+        Iterator over each chunk's result, in chunk order
+
+    Raises:
+        RuntimeError: While iterating, if a worker raised (the child traceback is included)
+    """
+    context = multiprocessing.get_context("fork")
+    workers = []
+    for chunk in chunks:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_child, args=(work, chunk, sender), daemon=True)
+        process.start()
+        sender.close()
+        workers.append((process, receiver))
+    return _collect(workers)
+
+
+def _collect(workers: List[Tuple[Any, Any]]) -> Iterator[bytes]:
+    """Read each worker's reply in order, then close the pipes and reap the processes."""
+    try:
+        for process, receiver in workers:
+            try:
+                reply = receiver.recv_bytes()
+            except EOFError:
+                raise RuntimeError(f"Flatten worker {process.pid} exited without a result")
+            if reply[:1] == _ERROR:
+                raise RuntimeError(f"Flatten worker failed:\n{reply[1:].decode('utf-8')}")
+            yield reply[1:]
+    finally:
+        for process, receiver in workers:
+            receiver.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+
+
+def _child(work: Callable[[Any], bytes], chunk: Any, sender) -> None:
+    """Worker entry point: run work and send back the result or traceback."""
+    try:
+        reply = _OK + work(chunk)
+    except BaseException:
+        reply = _ERROR + traceback.format_exc().encode("utf-8")
+    try:
+        sender.send_bytes(reply)
+    finally:
+        sender.close()
+        # Skip parent atexit handlers and buffered I/O inherited through fork
+        os._exit(0)
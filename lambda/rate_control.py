@@ -0,0 +1,161 @@
+# ABOUTME: Additive-increase/multiplicative-decrease send-rate control for Firehose
+# ABOUTME: Paces PutRecordBatch calls and sizes batches from observed throttling, failures and latency
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class AimdController:
+    """
+    Additive-increase/multiplicative-decrease controller for the Firehose send path.
+
+    Every PutRecordBatch attempt is reported through observe(). An attempt is
+    congested when it was throttled, when the share of failed records reaches
+    failure_threshold, or when the call took longer than latency_target. A
+    congested attempt multiplies both the send rate (records per second) and
+    the batch size by decrease_factor; any other attempt adds rate_step and
+    batch_step back, up to the configured maxima.
+
+    acquire() paces calls to the current rate, so retries and new batches
+    alike slow down while the stream is throttled. The controller is meant to
+    live across warm invocations, so a throttled stream stays paced instead of
+    being hit at full rate by every new invocation. It is shared by the
+    dispatch threads of an invocation.
+    """
+
+    def __init__(
+        self,
+        max_rate: float = 100_000.0,
+        min_rate: float = 100.0,
+        rate_step: float = 500.0,
+        max_batch_size: int = 500,
+        min_batch_size: int = 25,
+        batch_step: int = 25,
+        decrease_factor: float = 0.5,
+        failure_threshold: float = 0.05,
+        latency_target: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            max_rate: Highest (and starting) send rate in records per second
+            min_rate: Lowest send rate in records per second
+            rate_step: Records per second added after each uncongested attempt
+            max_batch_size: Highest (and starting) records per batch
+            min_batch_size: Lowest records per batch
+            batch_step: Records per batch added after each uncongested attempt
+            decrease_factor: Multiplier applied to rate and batch size on congestion
+            failure_threshold: Failed-record ratio treated as congestion
+            latency_target: Call latency in seconds above which a call counts as congested
+            clock: Monotonic time source in seconds
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate_step = rate_step
+        self.max_batch_size = max_batch_size
+        self.min_batch_size = min(min_batch_size, max_batch_size)
+        self.batch_step = batch_step
+        self.decrease_factor = decrease_factor
+        self.failure_threshold = failure_threshold
+        self.latency_target = latency_target
+
+        self.rate = max_rate
+        self.batch_size = max_batch_size
+        self.increases = 0
+        self.decreases = 0
+
+        self._clock = clock
+        self._next_send = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, records: int, max_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Reserve a send slot for records at the current rate.
+
+        Args:
+            records: Records about to be sent
+            max_wait: Longest wait the caller can afford, e.g. the time left
+                before its deadline (None waits as long as pacing requires)
+
+        Returns:
+            Seconds the caller should wait before sending, or None if the slot
+            starts more than max_wait from now (nothing is then reserved, so
+            later callers, including the next warm invocation, are not held
+            back by a send that never happens)
+        """
+        with self._lock:
+            now = self._clock()
+            start = max(now, self._next_send)
+            if max_wait is not None and start - now > max_wait:
+                return None
+            self._next_send = start + records / self.rate
+            return start - now
+
+    def observe(self, records: int, failed: int, throttled: bool, latency: float) -> None:
+        """
+        Adjust rate and batch size from the outcome of one PutRecordBatch attempt.
+
+        Args:
+            records: Records sent in the attempt
+            failed: Records that failed
+            throttled: Whether any failure was a throttling error
+            latency: Call duration in seconds
+        """
+        congested = (
+            throttled
+            or (records and failed / records >= self.failure_threshold)
+            or latency > self.latency_target
+        )
+        with self._lock:
+            if congested:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self.batch_size = max(
+                    self.min_batch_size, int(self.batch_size * self.decrease_factor)
+                )
+                self.decreases += 1
+            else:
+                self.rate = min(self.max_rate, self.rate + self.rate_step)
+                self.batch_size = min(self.max_batch_size, self.batch_size + self.batch_step)
+                self.increases += 1
+
+    def report(self) -> Dict[str, Any]:
+        """Describe the current rate, batch size and adjustments made so far."""
+        return {
+            "rate": round(self.rate, 1),
+            "batch_size": self.batch_size,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+def metric_record(stream_name: str, report: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a CloudWatch Embedded Metric Format record of the controller state.
+
+    Printed to the Lambda log, it becomes the FirehoseSendRate and
+    FirehoseBatchSize metrics, dimensioned by delivery stream.
+
+    Args:
+        stream_name: Firehose delivery stream name
+        report: AimdController.report() output
+
+    Returns:
+        EMF log record
+    """
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": "LMDataPublisher/Fanout",
+                "Dimensions": [["DeliveryStream"]],
+                "Metrics": [
+                    {"Name": "FirehoseSendRate", "Unit": "Count/Second"},
+                    {"Name": "FirehoseBatchSize", "Unit": "Count"},
+                ],
+            }],
+        },
+        "DeliveryStream": stream_name,
+        "FirehoseSendRate": report["rate"],
+        "FirehoseBatchSize": report["batch_size"],
+    }
@@ -0,0 +1,153 @@
+# ABOUTME: Warm-container LRU cache of flattened, promoted and serialized resource fragments
+# ABOUTME: Keyed by a fingerprint of the raw OTLP resource attributes, bounded by entry and byte caps
+
+from collections import OrderedDict
+from itertools import repeat
+from operator import itemgetter
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+_key = itemgetter("key")
+_value = itemgetter("value")
+
+
+def resource_fingerprint(attributes: List[Dict[str, Any]]) -> Optional[Hashable]:
+    """
+    Build a cache key for a raw OTLP attribute list.
+
+    The key is the (key, (value type, value), Python types of the values)
+    sequence, built with C-level map/zip so it costs a fraction of flattening
+    the attributes. Keeping the OTLP value type stops e.g. boolValue true and
+    doubleValue 1.0 from colliding; keeping the Python types stops 1 and 1.0
+    (or true and 1) under the same value type from colliding, since they
+    hash equal but render differently.
+
+    Args:
+        attributes: OTLP attribute objects with key and value
+
+    Returns:
+        Hashable fingerprint, or None for attributes that cannot be keyed
+        (missing key/value, or array/kvlist values)
+    """
+    try:
+        values = list(map(_value, attributes))
+        fingerprint = tuple(zip(
+            map(_key, attributes),
+            map(tuple, map(dict.items, values)),
+            map(tuple, map(map, repeat(type), map(dict.values, values))),
+        ))
+        hash(fingerprint)
+    except (KeyError, TypeError):
+        return None
+    return fingerprint
+
+
+class ResourceCache:
+    """
+    LRU cache of ColumnarBatch resource table entries across warm invocations.
+
+    LMDP re-sends the same device resource block every collection interval;
+    a hit reuses the flattened attributes, promoted fields and rendered JSON
+    of an earlier bundle. Entries are tied to the flatten plan they were built
+    with and the cache empties itself when a different plan is used.
+
+    Sizes count the rendered JSON fragments of each entry, which dominate
+    (the attribute dicts share their strings with them). Hits, misses and
+    evictions accumulate until reset_stats(), once per invocation.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_entries: Most entries kept
+            max_bytes: Most rendered fragment bytes kept
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._plan = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self,
+        attributes: List[Dict[str, Any]],
+        plan: Any,
+        build: Callable[[List[Dict[str, Any]]], Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        Return the resource entry for attributes, building and caching it on a miss.
+
+        Args:
+            attributes: Raw OTLP resource attributes
+            plan: Flatten plan the entry is built with
+            build: Builds the entry from attributes (called on a miss)
+
+        Returns:
+            Resource table entry (shared; callers must not modify it)
+        """
+        if plan is not self._plan:
+            self.clear()
+            self._plan = plan
+
+        fingerprint = resource_fingerprint(attributes)
+        if fingerprint is None:
+            self.misses += 1
+            return build(attributes)
+
+        entry = self._entries.get(fingerprint)
+        if entry is not None:
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = build(attributes)
+        size = _entry_bytes(entry)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return entry
+        self._entries[fingerprint] = entry
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= _entry_bytes(evicted)
+            self.evictions += 1
+        return entry
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)."""
+        self._entries.clear()
+        self.bytes = 0
+
+    def reset_stats(self) -> None:
+        """Zero the hit, miss and eviction counters, e.g. at the start of an invocation."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def merge(self, report: Dict[str, Any]) -> None:
+        """Add the counters of another cache's report(), e.g. from a forked worker."""
+        self.hits += report["hits"]
+        self.misses += report["misses"]
+        self.evictions += report["evictions"]
+
+    def report(self) -> Dict[str, Any]:
+        """Describe the cache and its counters since the last reset_stats()."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+        }
+
+
+def _entry_bytes(entry: Dict[str, Any]) -> int:
+    return len(entry["resource_json"]) + len(entry["promoted_json"])
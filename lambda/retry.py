@@ -0,0 +1,151 @@
+# ABOUTME: Deadline-aware retry scheduling for Firehose PutRecordBatch calls
+# ABOUTME: Decorrelated jitter for throttling, a per-invocation retry budget, and a Lambda deadline
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Error codes meaning the stream is over its throughput limits. Firehose uses
+# ServiceUnavailableException both per record and for the whole call.
+THROTTLING_ERROR_CODES = frozenset({
+    "ServiceUnavailableException",
+    "ThrottlingException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+})
+
+
+def is_throttling(error_codes: Iterable[str]) -> bool:
+    """Return True if any of the error codes signals throttling."""
+    return any(code in THROTTLING_ERROR_CODES for code in error_codes)
+
+
+class RetryScheduler:
+    """
+    Decide whether, and after how long, failed Firehose records are retried.
+
+    Throttled attempts back off with decorrelated jitter (each delay is drawn
+    from [base_delay, 3 * previous delay], capped at max_delay), which spreads
+    retries from concurrent Lambdas instead of lining them up. Other errors are
+    transient failures unrelated to load, so they are retried after a jittered
+    base_delay without growing.
+
+    Every retry draws from a budget shared by all batches of the invocation,
+    and no retry is scheduled whose delay would end past the deadline. One
+    scheduler is shared by the dispatch threads of an invocation.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 0.1,
+        max_delay: float = 5.0,
+        budget: Optional[int] = None,
+        deadline: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            base_delay: Smallest retry delay in seconds
+            max_delay: Largest retry delay in seconds
+            budget: Retries allowed across the invocation (None is unlimited)
+            deadline: clock() value after which nothing is retried or sent
+                (None disables the deadline)
+            clock: Monotonic time source in seconds
+            rng: Random source for jitter
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.deadline = deadline
+        self.retries = 0
+        self.throttled_retries = 0
+        self.budget_exhausted = False
+        self.deadline_reached = False
+
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_context(
+        cls,
+        context: Any,
+        reserve_ms: int = 5000,
+        **kwargs: Any,
+    ) -> "RetryScheduler":
+        """
+        Build a scheduler whose deadline is reserve_ms before the Lambda times out.
+
+        Args:
+            context: Lambda context (None disables the deadline)
+            reserve_ms: Time kept back for reporting the response
+            **kwargs: Other RetryScheduler arguments
+
+        Returns:
+            RetryScheduler for this invocation
+        """
+        clock = kwargs.get("clock", time.monotonic)
+        deadline = None
+        if context is not None:
+            remaining_ms = context.get_remaining_time_in_millis()
+            deadline = clock() + (remaining_ms - reserve_ms) / 1000.0
+        return cls(deadline=deadline, **kwargs)
+
+    def expired(self) -> bool:
+        """Return True once the deadline has passed (nothing more should be sent)."""
+        if self.deadline is None or self._clock() < self.deadline:
+            return False
+        self.deadline_reached = True
+        return True
+
+    def mark_deadline(self) -> None:
+        """Record that sending stopped because the next wait would pass the deadline."""
+        self.deadline_reached = True
+
+    def remaining(self) -> Optional[float]:
+        """Return the seconds left before the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self._clock())
+
+    def next_delay(self, previous_delay: float, throttled: bool) -> Optional[float]:
+        """
+        Reserve one retry and return how long to wait before it.
+
+        Args:
+            previous_delay: Delay before the previous attempt of this batch (0 for the first retry)
+            throttled: Whether the last attempt failed with a throttling error
+
+        Returns:
+            Delay in seconds, or None if the budget or deadline allows no retry
+        """
+        if throttled:
+            upper = max(self.base_delay, previous_delay * 3)
+            delay = min(self.max_delay, self._rng.uniform(self.base_delay, upper))
+        else:
+            delay = self._rng.uniform(self.base_delay / 2, self.base_delay)
+
+        if self.deadline is not None and self._clock() + delay >= self.deadline:
+            self.deadline_reached = True
+            return None
+
+        with self._lock:
+            if self.budget is not None and self.retries >= self.budget:
+                self.budget_exhausted = True
+                return None
+            self.retries += 1
+            if throttled:
+                self.throttled_retries += 1
+        return delay
+
+    def report(self) -> Dict[str, Any]:
+        """Describe the retries spent and whether the budget or deadline cut them short."""
+        return {
+            "retries": self.retries,
+            "throttled_retries": self.throttled_retries,
+            "budget": self.budget,
+            "budget_exhausted": self.budget_exhausted,
+            "deadline_reached": self.deadline_reached,
+        }
@@ -1,32 +1,148 @@
 # ABOUTME: Loads and parses the kafka_ingest_spec.md specification
 # ABOUTME: Extracts schema definitions and field mappings for OTLP to Row Event transformation
 
+import hashlib
 import json
+import os
 import re
-import yaml
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from flatten import ColumnarBatch, FlattenPlan, compile_flatten_plan
+
+
+# Python types accepted for each schema field type (other types are not checked)
+_FIELD_TYPE_CHECKS = {
+    "string": str,
+    "int": int,
+    "number": (int, float),
+    "object": dict,
+}
+
+# Row fields every flattened row carries, mapped to their ColumnarBatch column
+# (attributes, resource and scope are always objects)
+_COLUMN_FIELDS = {
+    "metric": "metric",
+    "type": "type",
+    "value": "value",
+    "ts": "ts",
+    "tsUnixMs": "ts_unix_ms",
+}
+_OPTIONAL_COLUMN_FIELDS = {"instance": "instance", "unit": "unit"}
+_OBJECT_FIELDS = ("attributes", "resource", "scope")
+
+
+# Prebuilt spec artifact shipped next to the handler (see tools/build_spec.py)
+DEFAULT_ARTIFACT_PATH = Path(__file__).parent / "spec_artifact.json"
+ARTIFACT_FORMAT_VERSION = 1
 
 
 class SpecLoader:
     """Loads and validates the OTLP to Row Event specification from kafka_ingest_spec.md."""
 
-    def __init__(self, spec_path: Optional[Path] = None):
+    def __init__(self, spec_path: Optional[Path] = None, artifact_path: Optional[Path] = None):
         """
         Initialize the spec loader.
 
+        The schema and fixtures are read from the prebuilt JSON artifact when
+        one is available, which skips Markdown scanning and YAML parsing at
+        cold start. An artifact built from a different version of a spec file
+        that is present is ignored.
+
         Args:
             spec_path: Path to kafka_ingest_spec.md. If None, uses default location.
+            artifact_path: Path to the prebuilt spec artifact. If None, uses
+                SPEC_ARTIFACT_PATH or spec_artifact.json next to this module,
+                unless an explicit spec_path was given.
         """
         if spec_path is None:
             # Default to docs/kafka_ingest_spec.md relative to project root
             self.spec_path = Path(__file__).parent.parent / "docs" / "kafka_ingest_spec.md"
+            if artifact_path is None:
+                artifact_path = os.environ.get("SPEC_ARTIFACT_PATH") or DEFAULT_ARTIFACT_PATH
         else:
             self.spec_path = Path(spec_path)
+        self.artifact_path = Path(artifact_path) if artifact_path else None
 
+        self._artifact = None
         self._spec_content = None
         self._schema = None
         self._fixtures = None
+        self._flatten_plan = None
+        self._row_validator = None
+
+    @classmethod
+    def from_document(cls, document: str, source: str = "<remote>") -> "SpecLoader":
+        """
+        Build a loader over spec content fetched from somewhere other than disk.
+
+        Args:
+            document: Either a JSON spec artifact (see tools/build_spec.py) or
+                the Markdown spec itself
+            source: Where the document came from, used as spec_path in messages
+
+        Returns:
+            SpecLoader reading only from document
+
+        Raises:
+            ValueError: If a JSON artifact has an unknown format version
+        """
+        loader = cls(spec_path=Path(source), artifact_path="")
+        if document.lstrip().startswith("{"):
+            artifact = json.loads(document)
+            if artifact.get("format_version") != ARTIFACT_FORMAT_VERSION:
+                raise ValueError(f"Spec artifact from {source} has an unknown format")
+            loader._artifact = artifact
+        else:
+            loader._spec_content = document
+        return loader
+
+    def load_artifact(self) -> Optional[Dict[str, Any]]:
+        """
+        Load the prebuilt spec artifact, if there is a usable one.
+
+        Returns:
+            Artifact dictionary with "schema" and "fixtures", or None when the
+            artifact is missing, of another format version, or stale
+        """
+        if self._artifact is not None:
+            return self._artifact or None
+        self._artifact = {}
+
+        if self.artifact_path is None or not self.artifact_path.exists():
+            return None
+        with open(self.artifact_path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+
+        if artifact.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            print(f"Warning: Ignoring spec artifact {self.artifact_path} with unknown format")
+            return None
+        if self.spec_path.exists() and artifact.get("spec_sha256") != self.spec_sha256():
+            print(f"Warning: Ignoring stale spec artifact {self.artifact_path}; rebuild it")
+            return None
+
+        self._artifact = artifact
+        return artifact
+
+    def build_artifact(self) -> Dict[str, Any]:
+        """
+        Compile the Markdown spec into the artifact loaded at cold start.
+
+        Returns:
+            Artifact dictionary (schema, fixtures and the source spec hash)
+        """
+        return {
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "spec_sha256": self.spec_sha256(),
+            "schema": self._parse_row_event_schema(),
+            "fixtures": self._parse_fixtures(),
+        }
+
+    def spec_sha256(self) -> str:
+        """Return the SHA-256 hex digest of the spec file."""
+        return hashlib.sha256(self.load_spec().encode("utf-8")).hexdigest()
 
     def load_spec(self) -> str:
         """Load the spec file content."""
@@ -42,6 +158,9 @@ class SpecLoader:
         Returns:
             List of parsed YAML blocks as dictionaries
         """
+        # Imported here so loading from the artifact never pays for PyYAML
+        import yaml
+
         content = self.load_spec()
         yaml_pattern = r"```yaml\n(.*?)\n```"
         matches = re.findall(yaml_pattern, content, re.DOTALL)
@@ -91,6 +210,15 @@ class SpecLoader:
         if self._schema is not None:
             return self._schema
 
+        artifact = self.load_artifact()
+        if artifact is not None:
+            self._schema = artifact["schema"]
+        else:
+            self._schema = self._parse_row_event_schema()
+        return self._schema
+
+    def _parse_row_event_schema(self) -> Dict[str, Any]:
+        """Find the Row Event schema block in the Markdown spec."""
         yaml_blocks = self.extract_yaml_blocks()
 
         # Find the schema block
@@ -98,11 +226,36 @@ class SpecLoader:
             if isinstance(block, dict) and "schema" in block:
                 schema_def = block["schema"]
                 if schema_def.get("name") == "lm.kafka.row_event":
-                    self._schema = block
-                    return self._schema
+                    return block
 
         raise ValueError("Row Event schema not found in spec")
 
+    def get_flatten_plan(self) -> FlattenPlan:
+        """
+        Get the flatten plan compiled from the Row Event schema.
+
+        Compiled once per loader, so a module-level loader compiles it at cold start.
+
+        Returns:
+            FlattenPlan holding promotions, exclusions, field order and coercions
+        """
+        if self._flatten_plan is None:
+            self._flatten_plan = compile_flatten_plan(self.get_row_event_schema())
+        return self._flatten_plan
+
+    def get_row_validator(self) -> "RowValidator":
+        """
+        Get the row validator compiled from the Row Event schema.
+
+        Compiled once per loader, like the flatten plan.
+
+        Returns:
+            RowValidator for the schema's required fields and field types
+        """
+        if self._row_validator is None:
+            self._row_validator = RowValidator(self.get_required_fields(), self.get_field_types())
+        return self._row_validator
+
     def get_required_fields(self) -> List[str]:
         """
         Get list of required field names from the schema.
@@ -123,7 +276,7 @@ class SpecLoader:
         if "required_fields" in validation:
             required.extend(validation["required_fields"])
 
-        return list(set(required))  # Remove duplicates
+        return list(dict.fromkeys(required))  # Remove duplicates, keep schema order
 
     def get_field_types(self) -> Dict[str, str]:
         """
@@ -151,13 +304,21 @@ class SpecLoader:
         if self._fixtures is not None:
             return self._fixtures
 
+        artifact = self.load_artifact()
+        if artifact is not None:
+            self._fixtures = artifact["fixtures"]
+        else:
+            self._fixtures = self._parse_fixtures()
+        return self._fixtures
+
+    def _parse_fixtures(self) -> Dict[str, Any]:
+        """Find the fixtures block in the Markdown spec."""
         yaml_blocks = self.extract_yaml_blocks()
 
         # Find the fixtures block
         for block in yaml_blocks:
             if isinstance(block, dict) and "fixtures" in block:
-                self._fixtures = block["fixtures"]
-                return self._fixtures
+                return block["fixtures"]
 
         return {}
 
@@ -171,26 +332,299 @@ class SpecLoader:
         Returns:
             True if valid, False otherwise
         """
-        required = self.get_required_fields()
-        field_types = self.get_field_types()
+        return self.get_row_validator().check(event) is None
 
-        # Check all required fields present
-        for field in required:
-            if field not in event:
-                return False
 
-        # Check field types (basic validation)
-        for field_name, field_type in field_types.items():
-            if field_name in event:
-                value = event[field_name]
-                # Basic type checking
-                if field_type == "string" and not isinstance(value, str):
-                    return False
-                elif field_type == "int" and not isinstance(value, int):
-                    return False
-                elif field_type == "number" and not isinstance(value, (int, float)):
-                    return False
-                elif field_type == "object" and not isinstance(value, dict):
+class RowValidator:
+    """
+    Row Event checks compiled once from a schema's required fields and field types.
+
+    Each row gets an error code for the first check it fails, or None when
+    it is valid. Required fields are checked first, then field types in
+    schema order:
+
+        missing:<field>   a required field is absent
+        type:<field>      a field holds a value of the wrong type
+
+    check_batch() takes materialized rows; check_columnar() checks a
+    ColumnarBatch column by column without materializing rows, evaluating
+    resource and scope fields once per table entry.
+    """
+
+    def __init__(self, required_fields: List[str], field_types: Dict[str, str]):
+        """
+        Args:
+            required_fields: Names of fields every row must carry
+            field_types: Schema type per field name ("string", "int", "number", "object")
+        """
+        self.required_fields = tuple(required_fields)
+        self.type_checks = tuple(
+            (field, _FIELD_TYPE_CHECKS[field_type])
+            for field, field_type in field_types.items()
+            if field_type in _FIELD_TYPE_CHECKS
+        )
+        self._missing_codes = {field: f"missing:{field}" for field in self.required_fields}
+        self._type_codes = {field: f"type:{field}" for field, _ in self.type_checks}
+
+    def check(self, row: Dict[str, Any]) -> Optional[str]:
+        """
+        Check one row.
+
+        Args:
+            row: Row event dictionary
+
+        Returns:
+            Error code of the first failed check, or None if the row is valid
+        """
+        for field in self.required_fields:
+            if field not in row:
+                return self._missing_codes[field]
+        for field, types in self.type_checks:
+            if field in row and not isinstance(row[field], types):
+                return self._type_codes[field]
+        return None
+
+    def check_batch(self, rows: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Check a list of rows.
+
+        Args:
+            rows: Row event dictionaries
+
+        Returns:
+            Error code (or None) per row, in row order
+        """
+        check = self.check
+        return [check(row) for row in rows]
+
+    def check_columnar(self, batch: ColumnarBatch) -> List[Optional[str]]:
+        """
+        Check every row of a ColumnarBatch without materializing it.
+
+        Gives the same codes as check_batch(batch.rows()).
+
+        Args:
+            batch: Flattened batch
+
+        Returns:
+            Error code (or None) per row, in row order
+        """
+        codes: List[Optional[str]] = [None] * len(batch)
+
+        # Promoted and datasource values, present only when truthy (see ColumnarBatch.row)
+        resource_fields = [
+            {field: value for field, value in entry["promoted"] if value}
+            for entry in batch.resources
+        ]
+        scope_fields = [
+            {"datasource": entry["datasource"]} if entry["datasource"] else {}
+            for entry in batch.scopes
+        ]
+
+        def column(field: str) -> List[Any]:
+            return getattr(batch, _COLUMN_FIELDS.get(field) or _OPTIONAL_COLUMN_FIELDS[field])
+
+        def table_outcomes(
+            field: str, code: str, failed: Callable[[Dict[str, Any]], bool]
+        ) -> None:
+            """Decide a resource- or scope-level check once per table entry, then per row."""
+            if field == "datasource":
+                entries, index_column = scope_fields, batch.scope_index
+            else:
+                entries, index_column = resource_fields, batch.resource_index
+            outcomes = [failed(entry) for entry in entries]
+            for i, index in enumerate(index_column):
+                if codes[i] is None and outcomes[index]:
+                    codes[i] = code
+
+        for field in self.required_fields:
+            code = self._missing_codes[field]
+            if field in _COLUMN_FIELDS or field in _OBJECT_FIELDS:
+                continue  # every row carries these keys
+            if field in _OPTIONAL_COLUMN_FIELDS:
+                for i, value in enumerate(column(field)):
+                    if codes[i] is None and not value:
+                        codes[i] = code
+            else:
+                table_outcomes(field, code, lambda entry, field=field: field not in entry)
+
+        for field, types in self.type_checks:
+            code = self._type_codes[field]
+            if field in _OBJECT_FIELDS:
+                if not issubclass(dict, types):
+                    codes[:] = [existing or code for existing in codes]
+            elif field in _COLUMN_FIELDS or field in _OPTIONAL_COLUMN_FIELDS:
+                # Absent optional fields are falsy, and absent fields are not type-checked
+                optional = field in _OPTIONAL_COLUMN_FIELDS
+                for i, value in enumerate(column(field)):
+                    if (
+                        codes[i] is None
+                        and not isinstance(value, types)
+                        and not (optional and not value)
+                    ):
+                        codes[i] = code
+            else:
+                table_outcomes(
+                    field,
+                    code,
+                    lambda entry, field=field, types=types: (
+                        field in entry and not isinstance(entry[field], types)
+                    ),
+                )
+        return codes
+
+
+class RemoteSpec:
+    """
+    Row Event spec fetched from S3 or SSM Parameter Store and kept in the warm container.
+
+    The spec is re-checked at most once per ttl_seconds: S3 objects with a
+    conditional GET on the last ETag (an unchanged spec costs a 304 and no
+    download), SSM parameters by comparing the parameter version. A changed
+    spec is compiled into a new SpecLoader first and then published with a
+    single reference assignment, so callers holding the previous loader (and
+    its flatten plan) finish with it undisturbed. Until the first successful
+    fetch, and whenever a fetch or compile fails, the current loader stays in
+    use.
+
+    Sources are written as s3://<bucket>/<key> or ssm:<parameter-name>, and
+    may hold either the JSON spec artifact or the Markdown spec.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        fallback: SpecLoader,
+        ttl_seconds: float = 60.0,
+        s3_client: Any = None,
+        ssm_client: Any = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            uri: s3://<bucket>/<key> or ssm:<parameter-name>
+            fallback: Loader used until a remote spec has been loaded (usually the bundled spec)
+            ttl_seconds: Seconds between checks for a changed spec
+            s3_client: boto3 S3 client (created on first use if None)
+            ssm_client: boto3 SSM client (created on first use if None)
+            clock: Monotonic time source in seconds
+
+        Raises:
+            ValueError: If uri is neither an s3:// nor an ssm: source
+        """
+        if uri.startswith("s3://"):
+            bucket, _, key = uri[len("s3://"):].partition("/")
+            if not bucket or not key:
+                raise ValueError(f"Spec source {uri} must be s3://<bucket>/<key>")
+            self._location: Tuple[str, str] = (bucket, key)
+            self._fetch = self._fetch_s3
+        elif uri.startswith("ssm:"):
+            name = uri[len("ssm:"):]
+            if not name:
+                raise ValueError(f"Spec source {uri} must be ssm:<parameter-name>")
+            self._location = (name, "")
+            self._fetch = self._fetch_ssm
+        else:
+            raise ValueError(f"Unsupported spec source {uri}; use s3://<bucket>/<key> or ssm:<name>")
+
+        self.uri = uri
+        self.ttl_seconds = ttl_seconds
+        self.version: Optional[str] = None
+        self.checks = 0
+        self.reloads = 0
+        self.errors = 0
+
+        self._loader = fallback
+        self._s3 = s3_client
+        self._ssm = ssm_client
+        self._clock = clock
+        self._checked_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+
+    def current(self) -> SpecLoader:
+        """
+        Return the loader to use now, re-checking the source once the TTL has passed.
+
+        Returns:
+            SpecLoader of the newest spec that compiled
+        """
+        if self._checked_at is None or self._clock() - self._checked_at >= self.ttl_seconds:
+            self.refresh()
+        return self._loader
+
+    def refresh(self) -> bool:
+        """
+        Check the source now and publish the spec if it changed.
+
+        A refresh already running in another thread is not waited for; the
+        caller keeps the current loader.
+
+        Returns:
+            True if a new spec was published
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked_at = self._clock()
+            self.checks += 1
+            try:
+                fetched = self._fetch()
+                if fetched is None:
                     return False
+                document, version = fetched
+                loader = SpecLoader.from_document(document, source=self.uri)
+                # Compile before publishing, so a bad spec never replaces a good one
+                loader.get_flatten_plan()
+                loader.get_row_validator()
+            except Exception as e:
+                # Whatever a fetched spec breaks (AWS errors, parsing, a malformed
+                # flatten section), invocations keep running on the last good one
+                self.errors += 1
+                print(f"Warning: Keeping current spec; failed to load {self.uri}: {e!r}")
+                return False
 
-        return True
+            self._loader = loader
+            self.version = version
+            self.reloads += 1
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def report(self) -> Dict[str, Any]:
+        """Describe the source, the loaded version and the checks made so far."""
+        return {
+            "source": self.uri,
+            "version": self.version,
+            "checks": self.checks,
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
+
+    def _fetch_s3(self) -> Optional[Tuple[str, str]]:
+        from botocore.exceptions import ClientError
+
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client("s3")
+        bucket, key = self._location
+        request = {"Bucket": bucket, "Key": key}
+        if self.version is not None:
+            request["IfNoneMatch"] = self.version
+        try:
+            response = self._s3.get_object(**request)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("304", "NotModified"):
+                return None
+            raise
+        return response["Body"].read().decode("utf-8"), response["ETag"]
+
+    def _fetch_ssm(self) -> Optional[Tuple[str, str]]:
+        if self._ssm is None:
+            import boto3
+            self._ssm = boto3.client("ssm")
+        name, _ = self._location
+        parameter = self._ssm.get_parameter(Name=name, WithDecryption=True)["Parameter"]
+        version = str(parameter["Version"])
+        if version == self.version:
+            return None
+        return parameter["Value"], version
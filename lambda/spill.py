@@ -0,0 +1,126 @@
+# ABOUTME: S3 spill sink for row events that Firehose never accepted
+# ABOUTME: Buffers rows per Kafka partition and writes gzip NDJSON chunks with one PUT each
+
+import gzip
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Uncompressed bytes buffered per partition before a chunk is written
+DEFAULT_SPILL_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class _Chunk:
+    """Rows buffered for one topic-partition."""
+
+    def __init__(self):
+        self.rows: List[bytes] = []
+        self.size = 0
+        self.record_ids: Set[str] = set()
+        self.first_offset: Optional[str] = None
+        self.last_offset: Optional[str] = None
+
+
+class S3Spill:
+    """
+    Write undelivered row events to S3 as size-rotated, gzip-compressed NDJSON.
+
+    Rows are buffered per Kafka topic-partition and written as one object per
+    chunk once max_chunk_bytes of rows are buffered (and on flush), so a
+    Firehose outage costs one PUT per chunk rather than one per row. Keys
+    carry the partition, the offset range and the write time:
+
+        <prefix><topic-partition>/<yyyy>/<mm>/<dd>/<HH>/<first>-<last>-<epoch_ms>-<id>.ndjson.gz
+
+    Record ids whose rows could not be written are collected in unsaved, so
+    the caller can still hand those records back for redelivery.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        s3_client: Any,
+        prefix: str = "spill/",
+        max_chunk_bytes: int = DEFAULT_SPILL_CHUNK_BYTES,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            bucket: Destination bucket name
+            s3_client: boto3 S3 client
+            prefix: Key prefix for spill objects
+            max_chunk_bytes: Uncompressed bytes per object before rotating
+            clock: Wall-clock time source in epoch seconds
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_chunk_bytes = max_chunk_bytes
+        self.rows = 0
+        self.objects: List[str] = []
+        self.unsaved: Set[str] = set()
+
+        self._s3 = s3_client
+        self._clock = clock
+        self._chunks: Dict[str, _Chunk] = {}
+
+    def add(self, record_id: str, row: bytes) -> None:
+        """
+        Buffer one newline-terminated row, writing its partition's chunk when full.
+
+        Args:
+            record_id: "<topic-partition>:<offset>" of the Kafka record the row came from
+            row: Encoded row event
+        """
+        partition, _, offset = record_id.rpartition(":")
+        chunk = self._chunks.get(partition)
+        if chunk is None:
+            chunk = self._chunks[partition] = _Chunk()
+
+        chunk.rows.append(row)
+        chunk.size += len(row)
+        chunk.record_ids.add(record_id)
+        if chunk.first_offset is None:
+            chunk.first_offset = offset
+        chunk.last_offset = offset
+        self.rows += 1
+
+        if chunk.size >= self.max_chunk_bytes:
+            self._write(partition, self._chunks.pop(partition))
+
+    def flush(self) -> None:
+        """Write every partially filled chunk."""
+        chunks, self._chunks = self._chunks, {}
+        for partition, chunk in chunks.items():
+            self._write(partition, chunk)
+
+    def report(self) -> Dict[str, Any]:
+        """Describe what was spilled (call after flush)."""
+        return {
+            "bucket": self.bucket,
+            "rows": self.rows,
+            "objects": len(self.objects),
+            "unsaved_records": len(self.unsaved),
+        }
+
+    def _write(self, partition: str, chunk: _Chunk) -> None:
+        now = self._clock()
+        key = (
+            f"{self.prefix}{partition}/{time.strftime('%Y/%m/%d/%H', time.gmtime(now))}/"
+            f"{chunk.first_offset}-{chunk.last_offset}-{int(now * 1000)}-{uuid.uuid4().hex[:8]}"
+            ".ndjson.gz"
+        )
+        try:
+            self._s3.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=gzip.compress(b"".join(chunk.rows)),
+                ContentType="application/x-ndjson",
+                ContentEncoding="gzip",
+            )
+        except (BotoCoreError, ClientError) as e:
+            print(f"Warning: Failed to spill {len(chunk.rows)} rows to s3://{self.bucket}/{key}: {e}")
+            self.unsaved.update(chunk.record_ids)
+            return
+        self.objects.append(key)
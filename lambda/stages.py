@@ -0,0 +1,137 @@
+# ABOUTME: Bounded-queue pipeline stages for overlapping CPU work with Firehose I/O
+# ABOUTME: Runs an upstream generator chain on a background thread and reports busy/idle time
+
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+# Sentinel marking the end of the upstream iterator
+_DONE = object()
+
+
+class StageStats:
+    """Busy/idle wall-clock accounting for one pipeline stage."""
+
+    def __init__(self, name: str, threads: int = 1):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the stats in response-body form (times in milliseconds)."""
+        return {
+            "name": self.name,
+            "threads": self.threads,
+            "items": self.items,
+            "busy_ms": round(self.busy * 1000, 1),
+            "idle_ms": round(self.idle * 1000, 1),
+        }
+
+
+class BackgroundStage:
+    """
+    Iterate an upstream iterator on a background thread through a bounded queue.
+
+    The producer thread pulls items from upstream (doing whatever decode,
+    flatten and encode work the generator chain performs) while the consumer
+    handles the previous item. At most depth items wait in the queue, so a slow
+    consumer applies backpressure instead of letting memory grow.
+
+    producer_stats counts time spent inside upstream (busy) and blocked on a
+    full queue (idle). consumer_stats counts time the consumer spends between
+    items (busy) and blocked on an empty queue (idle).
+    """
+
+    def __init__(
+        self,
+        upstream: Iterator[Any],
+        depth: int,
+        producer_name: str,
+        consumer_name: str,
+        consumer_threads: int = 1,
+    ):
+        self.depth = depth
+        self.peak_depth = 0
+        self.producer_stats = StageStats(producer_name)
+        self.consumer_stats = StageStats(consumer_name, consumer_threads)
+
+        self._upstream = upstream
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._consumer_mark: Optional[float] = None
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def __iter__(self) -> "BackgroundStage":
+        return self
+
+    def __next__(self) -> Any:
+        now = time.perf_counter()
+        if self._consumer_mark is not None:
+            self.consumer_stats.busy += now - self._consumer_mark
+
+        item = self._queue.get()
+        self._consumer_mark = time.perf_counter()
+        self.consumer_stats.idle += self._consumer_mark - now
+
+        if item is _DONE:
+            self._consumer_mark = None
+            if self._error is not None:
+                raise self._error
+            raise StopIteration
+        self.consumer_stats.items += 1
+        return item
+
+    def close(self) -> None:
+        """Stop the producer (if still running) and wait for it to exit."""
+        self._stop.set()
+        # Unblock a producer waiting on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(timeout=0.01)
+
+    def report(self) -> Dict[str, Any]:
+        """Describe the stage layout, queue depth and per-stage busy/idle time."""
+        return {
+            "stages": [self.producer_stats.as_dict(), self.consumer_stats.as_dict()],
+            "queue_depth": self.depth,
+            "queue_peak": self.peak_depth,
+        }
+
+    def _produce(self) -> None:
+        stats = self.producer_stats
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    item = next(self._upstream)
+                except StopIteration:
+                    break
+                produced = time.perf_counter()
+                stats.busy += produced - start
+                stats.items += 1
+
+                if not self._put(item):
+                    return
+                stats.idle += time.perf_counter() - produced
+                self.peak_depth = max(self.peak_depth, self._queue.qsize())
+        except BaseException as e:
+            self._error = e
+        self._put(_DONE)
+
+    def _put(self, item: Any) -> bool:
+        """Put with backpressure, giving up if the consumer has closed the stage."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
@@ -0,0 +1,93 @@
+# ABOUTME: Exact integer timestamp conversion and RFC3339 formatting for row events
+# ABOUTME: Formats each distinct second once and appends the milliseconds, with a batch API for columns
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Sequence
+
+DEFAULT_MAX_SECONDS = 4096
+
+_NANOS_PER_MS = 1_000_000
+
+
+def nanos_to_ms(time_unix_nano: Any) -> int:
+    """
+    Convert an OTLP timeUnixNano value to Unix milliseconds without a float.
+
+    Args:
+        time_unix_nano: Nanoseconds since the epoch, as an int or decimal string
+
+    Returns:
+        Unix timestamp in milliseconds, truncated toward zero
+    """
+    nanos = int(time_unix_nano)
+    if nanos >= 0:
+        return nanos // _NANOS_PER_MS
+    return -(-nanos // _NANOS_PER_MS)
+
+
+class Rfc3339Formatter:
+    """
+    RFC3339 UTC formatter with a per-second cache of the date/time part.
+
+    Output matches datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+    .isoformat() with "+00:00" replaced by "Z": whole seconds have no
+    fraction, other timestamps carry six fractional digits. The datapoints of
+    a bundle cluster on a few collection timestamps, so the datetime work is
+    done once per distinct second. The cache is emptied once it holds
+    max_seconds entries.
+    """
+
+    def __init__(self, max_seconds: int = DEFAULT_MAX_SECONDS):
+        """
+        Args:
+            max_seconds: Distinct seconds cached before the cache is emptied
+        """
+        self.max_seconds = max_seconds
+        self._seconds: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._seconds)
+
+    def format(self, ts_unix_ms: int) -> str:
+        """
+        Format a Unix millisecond timestamp as RFC3339.
+
+        Args:
+            ts_unix_ms: Unix timestamp in milliseconds
+
+        Returns:
+            RFC3339 formatted timestamp string
+
+        Raises:
+            OverflowError, ValueError: If the timestamp is outside datetime's range
+        """
+        seconds, millis = divmod(ts_unix_ms, 1000)
+        prefix = self._seconds.get(seconds)
+        if prefix is None:
+            prefix = datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()[:-6]
+            if len(self._seconds) >= self.max_seconds:
+                self._seconds.clear()
+            self._seconds[seconds] = prefix
+        if millis:
+            return f"{prefix}.{millis:03d}000Z"
+        return prefix + "Z"
+
+    def format_many(self, timestamps: Sequence[int]) -> List[str]:
+        """
+        Format a column of Unix millisecond timestamps.
+
+        Each distinct timestamp is formatted once and its string shared by
+        every position holding it.
+
+        Args:
+            timestamps: Unix timestamps in milliseconds
+
+        Returns:
+            RFC3339 strings in the same order
+        """
+        formatted = {ts: self.format(ts) for ts in set(timestamps)}
+        return list(map(formatted.__getitem__, timestamps))
+
+
+# Shared by the flatten paths; stays warm across invocations
+RFC3339 = Rfc3339Formatter()
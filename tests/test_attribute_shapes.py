@@ -0,0 +1,176 @@
+# ABOUTME: Tests for attribute_shapes module
+# ABOUTME: Validates shape detection, generated extractors, fallback on shape changes, stats, and row parity
+
+import sys
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from attribute_shapes import AttributeShapes, attribute_shape, compile_extractor
+from flatten import FlattenPlan, compile_flatten_plan, flatten_otlp_batch
+from interning import StringInterner
+from spec_loader import SpecLoader
+
+
+def _attr(key, **value):
+    return {"key": key, "value": value}
+
+
+def _bundle(attribute_lists):
+    datapoints = [
+        {"timeUnixNano": "1768646400000000000", "asDouble": float(i), "attributes": attributes}
+        for i, attributes in enumerate(attribute_lists)
+    ]
+    return {
+        "resourceMetrics": [{
+            "resource": {"attributes": [_attr("hostName", stringValue="web-1")]},
+            "scopeMetrics": [{
+                "scope": {"name": "aws.ec2"},
+                "metrics": [{"name": "cpu", "gauge": {"dataPoints": datapoints}}],
+            }],
+        }]
+    }
+
+
+def _lmdp(i):
+    return [
+        _attr("dataSourceInstanceName", stringValue=f"instance_{i}"),
+        _attr("wildAlias", stringValue=f"Instance {i}"),
+        _attr("datapointId", intValue=str(i)),
+    ]
+
+
+MIXED = [
+    _lmdp(0),
+    _lmdp(1),
+    # Value type change
+    [_attr("dataSourceInstanceName", stringValue="i2"), _attr("wildAlias", stringValue="I2"),
+     _attr("datapointId", doubleValue=2.0)],
+    # Null value, then a higher-precedence type alongside the expected one
+    [_attr("dataSourceInstanceName", stringValue="i3"), _attr("wildAlias", stringValue=None),
+     _attr("datapointId", intValue="3")],
+    [_attr("dataSourceInstanceName", stringValue="i4"), _attr("wildAlias", stringValue="I4"),
+     _attr("datapointId", intValue="4", stringValue="four")],
+    [_attr("dataSourceInstanceName", stringValue="i5"), _attr("wildAlias", stringValue="I5"),
+     _attr("datapointId", stringValue=None, intValue="5")],
+    # Duplicate keys: the last value wins at the first position
+    [_attr("dataSourceInstanceName", stringValue="i6"), _attr("tag", stringValue="a"),
+     _attr("dataSourceInstanceName", stringValue="i6b"), _attr("tag", boolValue=False)],
+    # Attributes the generic path skips
+    [_attr("dataSourceInstanceName", stringValue="i7"), _attr("list", arrayValue={"values": []})],
+    [_attr("", stringValue="empty"), {"value": {"stringValue": "nokey"}}, {"key": "novalue"}],
+    # Fewer and no attributes, then the common shape again
+    [_attr("wildValue", stringValue="w8")],
+    [],
+    _lmdp(9),
+    _lmdp(10),
+]
+
+
+@pytest.fixture
+def schema():
+    return SpecLoader().get_row_event_schema()
+
+
+def _generic_plan(schema):
+    plan = compile_flatten_plan(schema)
+    plan.attribute_shapes.max_shapes = 0
+    return plan
+
+
+def test_attribute_shape():
+    """Test shapes record keys and selected value types, and reject unspecializable lists."""
+    assert attribute_shape(_lmdp(0)) == (
+        ("dataSourceInstanceName", "stringValue"),
+        ("wildAlias", "stringValue"),
+        ("datapointId", "intValue"),
+    )
+    assert attribute_shape([_attr("x", intValue="1", stringValue="s")]) == (("x", "stringValue"),)
+    assert attribute_shape([]) == ()
+    assert attribute_shape([_attr("x", stringValue=None)]) is None
+    assert attribute_shape([_attr("x", arrayValue={})]) is None
+    assert attribute_shape([_attr("", stringValue="s")]) is None
+    assert attribute_shape(None) is None
+
+
+def test_extractor_returns_none_on_other_shapes():
+    """Test a generated extractor rejects lists whose keys, types or lengths differ."""
+    extract = compile_extractor(attribute_shape(_lmdp(0)), ("dataSourceInstanceName",), {"dataSourceInstanceName"})
+
+    assert extract(_lmdp(7), None) == ("instance_7", {"wildAlias": "Instance 7", "datapointId": "7"})
+    assert extract(_lmdp(7)[:2], None) is None
+    assert extract(_lmdp(7) + [_attr("extra", stringValue="x")], None) is None
+    assert extract(MIXED[2], None) is None
+    assert extract(MIXED[3], None) is None
+    assert extract(MIXED[4], None) is None
+    assert extract([{"key": "dataSourceInstanceName"}] + _lmdp(7)[1:], None) is None
+    assert extract("abc", None) is None
+
+
+def test_extractor_keys_never_enter_generated_source():
+    """Test keys that would break or inject source are matched and emitted as plain data."""
+    for key in ("quote'\"\\\n☃", "x'] or __import__('os') or a0['", "}, {"):
+        extract = compile_extractor(((key, "stringValue"), ("b", "intValue")), ("b",), ())
+        attributes = [_attr(key, stringValue="v"), _attr("b", intValue="1")]
+        assert extract(attributes, None) == ("1", {key: "v", "b": "1"})
+        assert extract([_attr("other", stringValue="v"), _attr("b", intValue="1")], None) is None
+        assert extract.__code__.co_consts.count(key) == 0
+
+
+def test_batch_matches_generic_path(schema):
+    """Test shaped extraction produces the generic path's rows across shape changes."""
+    bundle = _bundle(MIXED)
+
+    shaped = flatten_otlp_batch([bundle], compile_flatten_plan(schema))
+    generic = flatten_otlp_batch([bundle], _generic_plan(schema))
+
+    assert shaped.instance == generic.instance
+    assert shaped.attributes == generic.attributes
+    assert [list(a) for a in shaped.attributes] == [list(a) for a in generic.attributes]
+    assert list(shaped.encode()) == list(generic.encode())
+
+
+def test_batch_matches_generic_path_with_interner_and_coercion():
+    """Test parity when attribute values are interned and the instance is coerced."""
+    bundle = _bundle(MIXED)
+    kwargs = {"field_types": {"instance": "string"}}
+    shaped_plan = FlattenPlan(attribute_exclusions=("tag",), **kwargs)
+    generic_plan = FlattenPlan(attribute_exclusions=("tag",), max_attribute_shapes=0, **kwargs)
+    interner = StringInterner()
+
+    shaped = flatten_otlp_batch([bundle, bundle], shaped_plan, interner=interner)
+    generic = flatten_otlp_batch([bundle, bundle], generic_plan, interner=StringInterner())
+
+    assert list(shaped.encode()) == list(generic.encode())
+    assert shaped.attributes[0]["wildAlias"] is shaped.attributes[len(MIXED)]["wildAlias"]
+    assert shaped.attributes[0]["wildAlias"] is interner.table["Instance 0"]
+
+
+def test_stats_count_hits_misses_and_fallbacks(schema):
+    """Test a homogeneous bundle is all hits after the first datapoint."""
+    plan = compile_flatten_plan(schema)
+    flatten_otlp_batch([_bundle([_lmdp(i) for i in range(100)])], plan)
+
+    report = plan.attribute_shapes.report()
+    assert report == {
+        "hits": 99, "misses": 1, "fallbacks": 0, "compiled": 1, "shapes": 1, "hit_rate": 0.99,
+    }
+
+    plan.attribute_shapes.reset_stats()
+    flatten_otlp_batch([_bundle([_lmdp(0), MIXED[7], _lmdp(1)])], plan)
+    report = plan.attribute_shapes.report()
+    assert (report["hits"], report["misses"], report["fallbacks"], report["compiled"]) == (1, 1, 1, 0)
+
+
+def test_max_shapes_caps_compiled_extractors():
+    """Test shapes past max_shapes use the generic path instead of compiling."""
+    shapes = AttributeShapes((), (), max_shapes=1)
+    assert shapes.lookup(_lmdp(0)) is not None
+    assert shapes.lookup([_attr("other", stringValue="x")]) is None
+    assert shapes.lookup(_lmdp(1)) is not None
+    assert len(shapes) == 1
+
+    shapes.merge({"hits": 5, "misses": 1, "fallbacks": 0, "compiled": 1})
+    assert shapes.report()["hits"] == 5
+    assert shapes.report()["compiled"] == 2
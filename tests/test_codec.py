@@ -0,0 +1,129 @@
+# ABOUTME: Conformance tests for the JSON codec backends
+# ABOUTME: Every backend must decode bundles and encode rows byte-identically to stdlib json
+
+import base64
+import json
+import sys
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+import codec
+from codec import get_codec
+from flatten import flatten_otlp_batch
+from kafka_decode import decode_kafka_value
+from spec_loader import SpecLoader
+
+BACKENDS = ["stdlib", pytest.param("orjson", marks=pytest.mark.skipif(
+    get_codec("auto").name != "orjson", reason="orjson not installed"
+))]
+
+# Values whose JSON spelling differs between encoders unless the row encoder is pinned
+EDGE_DOUBLES = [0.1, 1e-05, 1e16, 123456789.12345679, -0.0, 5e-324, 1.7976931348623157e308, 42.0]
+EDGE_STRINGS = ["Zürich", "東京", "🚀 launch", 'quote " and \\ backslash', "bell\u0007", "tab\tnewline\n"]
+
+
+def _attr(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": value}}
+
+
+@pytest.fixture
+def edge_bundle():
+    """Fixture providing a bundle full of float and non-ASCII edge cases."""
+    datapoints = [
+        {
+            "timeUnixNano": str(1768646400000000000 + i * 1_000_000_123),
+            "asDouble": value,
+            "attributes": [
+                _attr("wildValue", EDGE_STRINGS[i % len(EDGE_STRINGS)]),
+                _attr("ratio", value),
+                _attr("enabled", i % 2 == 0),
+                _attr("Größe", "ß"),
+            ],
+        }
+        for i, value in enumerate(EDGE_DOUBLES)
+    ]
+    datapoints.append({"timeUnixNano": "1768646400999000000", "asInt": "9007199254740993"})
+    datapoints.append({"timeUnixNano": "1768646401000000000", "asInt": 2 ** 62})
+    return {"resourceMetrics": [{
+        "resource": {"attributes": [
+            _attr("orgId", "acme"), _attr("hostId", "i-ü"), _attr("hostName", "hôte-01"),
+            _attr("region", "ap-northeast-1 東京"),
+        ]},
+        "scopeMetrics": [{
+            "scope": {"name": "Ünïcode.DS", "version": "1.0"},
+            "metrics": [{"name": "temp.°C", "unit": "°C", "gauge": {"dataPoints": datapoints}}],
+        }],
+    }]}
+
+
+@pytest.fixture
+def fixture_bundle():
+    """Fixture providing the LMDP sample bundle."""
+    with open(Path(__file__).parent / "fixtures" / "otlp" / "otlp_bundle_ok.json") as f:
+        return json.load(f)
+
+
+def _payload(bundle):
+    """Encode a bundle the way LMDP does (UTF-8 JSON, non-ASCII left unescaped)."""
+    return base64.b64encode(json.dumps(bundle, ensure_ascii=False).encode("utf-8")).decode("ascii")
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_codec_decodes_bundles_like_stdlib(backend, edge_bundle, fixture_bundle):
+    """Test that each backend decodes bundles to the same Python objects as json.loads."""
+    selected = get_codec(backend)
+
+    for bundle in (edge_bundle, fixture_bundle):
+        decoded = decode_kafka_value(_payload(bundle), codec=selected)
+        assert decoded == bundle
+        assert json.dumps(decoded) == json.dumps(bundle)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_codec_rows_are_byte_identical(backend, edge_bundle, fixture_bundle, monkeypatch):
+    """Test that rows encoded under each backend match the stdlib Snowflake mapping byte for byte."""
+    plan = SpecLoader().get_flatten_plan()
+    bundles = (edge_bundle, fixture_bundle)
+    references = [
+        [(json.dumps(row) + "\n").encode("utf-8") for row in flatten_otlp_batch([bundle], plan).rows()]
+        for bundle in bundles
+    ]
+    selected = get_codec(backend)
+    monkeypatch.setattr("flatten.CODEC", selected)
+
+    for bundle, reference in zip(bundles, references):
+        decoded = decode_kafka_value(_payload(bundle), codec=selected)
+        assert list(flatten_otlp_batch([decoded], plan).encode()) == reference
+
+
+def test_rows_pin_stdlib_float_and_escape_spelling(edge_bundle):
+    """Test the row spellings Snowflake has been loading: repr floats and \\u escapes."""
+    rows = b"".join(flatten_otlp_batch([edge_bundle], SpecLoader().get_flatten_plan()).encode())
+
+    assert b'"value": 1e-05, ' in rows
+    assert b'"value": 1e+16, ' in rows
+    assert b'"value": -0.0, ' in rows
+    assert b'"value": "9007199254740993", ' in rows
+    assert b'"instance": "Z\\u00fcrich"' in rows
+    assert b'"instance": "\\ud83d\\ude80 launch"' in rows
+    assert rows.isascii()
+
+
+def test_get_codec_selects_backends(monkeypatch):
+    """Test backend selection, including the stdlib fallback when orjson is missing."""
+    assert get_codec("stdlib").name == "stdlib"
+    with pytest.raises(ValueError, match="JSON_CODEC"):
+        get_codec("simdjson")
+
+    def missing():
+        raise ImportError("no orjson")
+
+    monkeypatch.setattr(codec, "OrjsonCodec", missing)
+    assert get_codec("auto").name == "stdlib"
+    assert get_codec("orjson").name == "stdlib"
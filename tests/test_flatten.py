@@ -9,7 +9,9 @@ import pytest
 
 # Add lambda directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
-from flatten import flatten_otlp
+from flatten import (
+    FlattenPlan, RowEvent, compile_flatten_plan, flatten_otlp, flatten_otlp_batch,
+)
 from spec_loader import SpecLoader
 
 
@@ -264,6 +266,37 @@ def test_flatten_otlp_with_multiple_datapoints():
     assert result[1]["tsUnixMs"] == 2000000000000
 
 
+def test_flatten_timestamps_use_exact_integer_nanos(spec):
+    """Test nanosecond timestamps are truncated exactly, in both flatten paths."""
+    bundle = {
+        "resourceMetrics": [{
+            "resource": {"attributes": []},
+            "scopeMetrics": [{
+                "scope": {"name": "test"},
+                "metrics": [{
+                    "name": "test.metric",
+                    "gauge": {"dataPoints": [
+                        {"timeUnixNano": "1768646400999999999", "asDouble": 1.0},
+                        {"timeUnixNano": "1768646400999999999", "asDouble": 2.0},
+                        {"timeUnixNano": "1768646401000000000", "asDouble": 3.0},
+                    ]},
+                }],
+            }],
+        }]
+    }
+
+    rows = flatten_otlp(bundle, spec)
+    batch = flatten_otlp_batch([bundle], spec)
+
+    assert [row["tsUnixMs"] for row in rows] == [1768646400999, 1768646400999, 1768646401000]
+    assert [row["ts"] for row in rows] == [
+        "2026-01-17T10:40:00.999000Z", "2026-01-17T10:40:00.999000Z", "2026-01-17T10:40:01Z",
+    ]
+    assert batch.ts_unix_ms == [row["tsUnixMs"] for row in rows]
+    assert batch.ts == [row["ts"] for row in rows]
+    assert batch.ts[0] is batch.ts[1]
+
+
 def test_flatten_otlp_with_empty_bundle(spec):
     """Test that empty bundle returns empty list."""
     bundle = {"resourceMetrics": []}
@@ -365,3 +398,280 @@ def test_flatten_otlp_includes_all_partitioning_fields(otlp_bundle, spec):
     assert row["orgId"], "orgId must not be empty"
     assert row["metric"], "metric must not be empty"
     assert row["tsUnixMs"] > 0, "tsUnixMs must be positive"
+
+
+@pytest.fixture
+def multi_resource_bundle():
+    """Fixture providing a bundle with two resources, a sum metric and a nameless scope."""
+    return {
+        "resourceMetrics": [
+            {
+                "resource": {"attributes": [
+                    {"key": "hostId", "value": {"stringValue": "h1"}},
+                    {"key": "orgId", "value": {"stringValue": "org1"}},
+                    {"key": "region", "value": {"stringValue": "us-east-1"}},
+                ]},
+                "scopeMetrics": [{
+                    "scope": {"name": "ds.one", "version": "2"},
+                    "metrics": [
+                        {"name": "m.gauge", "unit": "ms", "gauge": {"dataPoints": [
+                            {"timeUnixNano": "1768646400123000000", "asDouble": 1.5,
+                             "attributes": [
+                                 {"key": "wildValue", "value": {"stringValue": "w1"}},
+                                 {"key": "port", "value": {"intValue": "443"}},
+                             ]},
+                            {"timeUnixNano": "1768646401000000000", "asInt": "7"},
+                        ]}},
+                        {"name": "m.sum", "sum": {"dataPoints": [
+                            {"timeUnixNano": "1768646402000000000", "asDouble": 0.0},
+                        ]}},
+                    ],
+                }],
+            },
+            {
+                "resource": {"attributes": [
+                    {"key": "hostName", "value": {"stringValue": "web-02"}},
+                ]},
+                "scopeMetrics": [{
+                    "scope": {"epoch": "1768646400"},
+                    "metrics": [{"name": "m.epoch", "gauge": {"dataPoints": [{"asDouble": 3.0}]}}],
+                }],
+            },
+        ]
+    }
+
+
+def test_flatten_otlp_batch_matches_per_row_path(otlp_bundle, multi_resource_bundle, spec):
+    """Test that materialized columnar rows equal flatten_otlp output bundle by bundle."""
+    bundles = [otlp_bundle, multi_resource_bundle, {"resourceMetrics": []}, otlp_bundle]
+
+    expected = []
+    for bundle in bundles:
+        expected.extend(flatten_otlp(bundle, spec))
+
+    batch = flatten_otlp_batch(bundles, spec)
+
+    assert len(batch) == len(expected)
+    assert batch.rows() == expected
+    # Key order matters for the serialized output, not just equality
+    assert [list(row) for row in batch.rows()] == [list(row) for row in expected]
+
+
+def test_flatten_otlp_batch_shares_resource_and_scope_tables(multi_resource_bundle, spec):
+    """Test that resource/scope content is stored once and referenced by offset."""
+    batch = flatten_otlp_batch([multi_resource_bundle, multi_resource_bundle], spec)
+
+    assert len(batch) == 8
+    assert len(batch.resources) == 4
+    assert len(batch.scopes) == 4
+    assert batch.resource_index[:4] == [0, 0, 0, 1]
+    assert batch.scope_index[:4] == [0, 0, 0, 1]
+    assert batch.bundle_index == [0, 0, 0, 0, 1, 1, 1, 1]
+    assert dict(batch.resources[0]["promoted"])["orgId"] == "org1"
+    assert batch.resources[0]["resource"] == {"region": "us-east-1"}
+    assert batch.scopes[0]["datasource"] == "ds.one"
+    assert batch.scopes[0]["scope"] == {"name": "ds.one", "version": "2"}
+
+
+def test_flatten_otlp_batch_encode_matches_json_dumps(otlp_bundle, multi_resource_bundle, spec):
+    """Test that encoded rows are the newline-terminated JSON of the materialized rows."""
+    batch = flatten_otlp_batch([otlp_bundle, multi_resource_bundle], spec)
+
+    encoded = list(batch.encode())
+
+    assert encoded == [(json.dumps(row) + "\n").encode("utf-8") for row in batch.rows()]
+
+
+def test_flatten_otlp_batch_renders_resource_and_scope_fragments_once(multi_resource_bundle, spec):
+    """Test that resource/scope JSON fragments are pre-rendered per table entry."""
+    batch = flatten_otlp_batch([multi_resource_bundle], spec)
+
+    assert batch.resources[0]["promoted_json"] == b'"orgId": "org1", "deviceId": "h1", '
+    assert batch.resources[0]["resource_json"] == b'{"region": "us-east-1"}'
+    assert batch.resources[1]["promoted_json"] == b'"deviceName": "web-02", '
+    assert batch.scopes[0]["datasource_json"] == b'"datasource": "ds.one", '
+    assert batch.scopes[1]["datasource_json"] == b""
+    assert batch.scopes[1]["scope_json"] == b"{}"
+
+
+def test_flatten_otlp_batch_encode_escapes_like_json_dumps(spec):
+    """Test that spliced output matches json.dumps for non-ASCII, quotes and special floats."""
+    bundle = {
+        "resourceMetrics": [{
+            "resource": {"attributes": [
+                {"key": "orgId", "value": {"stringValue": "acmé"}},
+                {"key": "hostName", "value": {"stringValue": 'web "01"'}},
+                {"key": "rack", "value": {"stringValue": "東京"}},
+            ]},
+            "scopeMetrics": [{
+                "scope": {"name": "ds\\x", "version": "1"},
+                "metrics": [{"name": "m", "unit": "°C", "gauge": {"dataPoints": [
+                    {"timeUnixNano": "1768646400000000000", "asDouble": 1e-7,
+                     "attributes": [{"key": "wildValue", "value": {"stringValue": "ü"}}]},
+                    {"timeUnixNano": "1768646400000000000", "asDouble": float("nan")},
+                    {"timeUnixNano": "1768646400000000000", "asDouble": 1e16},
+                    {"timeUnixNano": "1768646400000000000", "asInt": "-5"},
+                    {"timeUnixNano": "1768646400000000000"},
+                ]}}],
+            }],
+        }]
+    }
+
+    batch = flatten_otlp_batch([bundle], spec)
+    rows = flatten_otlp(bundle, spec)
+
+    assert list(batch.encode()) == [
+        (json.dumps(row.to_dict()) + "\n").encode("utf-8") for row in rows
+    ]
+    assert [row.to_json() for row in rows] == list(batch.encode())
+
+
+def test_flatten_otlp_batch_with_no_bundles(spec):
+    """Test that an empty input produces an empty batch."""
+    batch = flatten_otlp_batch([], spec)
+    assert len(batch) == 0
+    assert batch.rows() == []
+    assert list(batch.encode()) == []
+
+
+def test_compiled_default_plan_matches_lmdp_layout(spec):
+    """Test that a spec without a flatten section compiles to the LMDP promotions."""
+    plan = compile_flatten_plan(spec)
+
+    assert plan.resource_promotions == (
+        ("orgId", "orgId"), ("deviceId", "hostId"), ("deviceName", "hostName")
+    )
+    assert plan.resource_exclusions == frozenset({"orgId", "hostId", "hostName"})
+    assert plan.instance_attributes == ("dataSourceInstanceName", "wildValue")
+    assert plan.attribute_exclusions == frozenset({"dataSourceInstanceName", "wildValue"})
+    assert plan.field_order == (
+        "metric", "type", "value", "ts", "tsUnixMs", "orgId", "deviceId", "deviceName",
+        "datasource", "instance", "unit", "attributes", "resource", "scope",
+    )
+
+
+def test_flatten_plan_from_spec_changes_promotions(multi_resource_bundle, spec):
+    """Test that promotions and exclusions come from the spec's flatten section."""
+    custom = dict(spec, flatten={
+        "resource_promotions": {"orgId": "orgId", "region": "region"},
+        "instance_attributes": ["port"],
+        "attribute_exclusions": ["wildValue"],
+    })
+
+    rows = flatten_otlp(multi_resource_bundle, custom)
+
+    assert rows[0]["region"] == "us-east-1"
+    assert rows[0]["resource"] == {"hostId": "h1"}
+    assert "deviceId" not in rows[0]
+    assert rows[0]["instance"] == "443"
+    assert rows[0]["attributes"] == {}
+    assert list(rows[0])[:7] == ["metric", "type", "value", "ts", "tsUnixMs", "orgId", "region"]
+    assert flatten_otlp_batch([multi_resource_bundle], custom).rows() == rows
+
+
+def test_flatten_plan_coerces_promoted_values_to_spec_types(multi_resource_bundle):
+    """Test that promoted values are coerced to the field types the spec declares."""
+    bundle = json.loads(json.dumps(multi_resource_bundle))
+    bundle["resourceMetrics"][0]["resource"]["attributes"][0] = {
+        "key": "hostId", "value": {"doubleValue": 12.5}
+    }
+    plan = FlattenPlan(field_types={"deviceId": "string", "instance": "string"})
+    plan_without_types = FlattenPlan()
+
+    assert flatten_otlp(bundle, plan)[0]["deviceId"] == "12.5"
+    assert flatten_otlp(bundle, plan_without_types)[0]["deviceId"] == 12.5
+    assert flatten_otlp_batch([bundle], plan).rows()[0]["deviceId"] == "12.5"
+
+
+def test_flatten_plan_omits_falsy_promoted_values_before_coercion(multi_resource_bundle):
+    """Test that false/0 promoted values stay omitted, as without coercion, instead of becoming "false"/"0"."""
+    bundle = json.loads(json.dumps(multi_resource_bundle))
+    bundle["resourceMetrics"][0]["resource"]["attributes"][0] = {
+        "key": "hostId", "value": {"boolValue": False}
+    }
+    datapoint = bundle["resourceMetrics"][0]["scopeMetrics"][0]["metrics"][0]["gauge"]["dataPoints"][0]
+    datapoint["attributes"] = [{"key": "wildValue", "value": {"intValue": 0}}]
+    plan = FlattenPlan(field_types={"deviceId": "string", "instance": "string"})
+
+    rows = flatten_otlp(bundle, plan)
+
+    assert "deviceId" not in rows[0]
+    assert "instance" not in rows[0]
+    assert flatten_otlp_batch([bundle], plan).rows()[0] == rows[0]
+
+
+def test_compiled_plans_for_spec_dicts_are_bounded(spec):
+    """Test that plans compiled from spec dicts are cached, but only for the latest few specs."""
+    import flatten
+
+    assert flatten._plan_for(spec) is flatten._plan_for(spec)
+    for _ in range(flatten._MAX_COMPILED_PLANS + 2):
+        flatten._plan_for(dict(spec))
+
+    assert len(flatten._compiled_plans) == flatten._MAX_COMPILED_PLANS
+    assert all(cached_spec is not spec for cached_spec, _ in flatten._compiled_plans.values())
+
+
+def test_flatten_plan_rejects_structural_promotions():
+    """Test that a resource attribute cannot be promoted over a fixed row field."""
+    with pytest.raises(ValueError, match="metric"):
+        FlattenPlan(resource_promotions=[("metric", "hostName")])
+
+
+def test_row_events_are_slotted_and_share_resource_objects(multi_resource_bundle, spec):
+    """Test that rows carry no per-instance dict and reference their resource/scope objects."""
+    rows = flatten_otlp(multi_resource_bundle, spec)
+    same_resource = [row for row in rows if row["resource"] == rows[0]["resource"]]
+
+    assert all(isinstance(row, RowEvent) for row in rows)
+    assert not hasattr(rows[0], "__dict__")
+    assert len(same_resource) > 1
+    assert all(row["resource"] is rows[0]["resource"] for row in same_resource)
+    assert all(row["scope"] is rows[0]["scope"] for row in same_resource)
+
+
+def test_row_event_mapping_view_matches_row_dict(otlp_bundle, spec, spec_loader):
+    """Test that the mapping view has the row dict's keys, order, length and lookups."""
+    row = flatten_otlp(otlp_bundle, spec)[0]
+    as_dict = row.to_dict()
+
+    assert row == as_dict
+    assert list(row) == list(as_dict)
+    assert len(row) == len(as_dict)
+    assert dict(row.items()) == as_dict
+    assert "instance" in row and "missing" not in row
+    assert row.get("missing") is None
+    with pytest.raises(KeyError):
+        row["missing"]
+    assert spec_loader.validate_row_event(row)
+
+
+def test_row_event_lookups_match_row_dict_for_every_key(multi_resource_bundle):
+    """Test that each row key, including promoted and omitted ones, looks up as in the row dict."""
+    bundle = json.loads(json.dumps(multi_resource_bundle))
+    bundle["resourceMetrics"][0]["resource"]["attributes"][0] = {
+        "key": "hostId", "value": {"boolValue": False}
+    }
+    plan = FlattenPlan(field_types={"deviceId": "string"})
+    keys = {field for field, _ in plan.resource_promotions}
+    keys |= {"metric", "type", "value", "ts", "tsUnixMs", "datasource", "instance", "unit",
+             "attributes", "resource", "scope", "missing"}
+
+    for row in flatten_otlp(bundle, plan):
+        as_dict = row.to_dict()
+        for key in keys:
+            assert (key in row) == (key in as_dict), key
+            assert row.get(key) == as_dict.get(key), key
+    assert "deviceId" not in flatten_otlp(bundle, plan)[0]
+
+
+def test_row_event_to_dict_copies_nested_objects(otlp_bundle, spec):
+    """Test that to_dict gives a row whose nested objects can be changed safely."""
+    rows = flatten_otlp(otlp_bundle, spec)
+    copy = rows[0].to_dict()
+    copy["resource"]["hostId"] = "changed"
+    copy["attributes"]["x"] = 1
+
+    assert rows[0]["resource"].get("hostId") != "changed"
+    assert "x" not in rows[0]["attributes"]
+    assert rows[0].to_json() == (json.dumps(rows[0].to_dict()) + "\n").encode("utf-8")
@@ -1,7 +1,9 @@
 # ABOUTME: Tests for Lambda handler contract
 # ABOUTME: Validates EventBridge Pipes event processing, Firehose batching, and error handling
 
+import gzip
 import json
+import subprocess
 import sys
 import base64
 from pathlib import Path
@@ -61,6 +63,7 @@ def lambda_context():
     context.memory_limit_in_mb = 512
     context.invoked_function_arn = "arn:aws:lambda:us-west-2:123456789012:function:lm-datapublisher-writer"
     context.aws_request_id = "test-request-id"
+    context.get_remaining_time_in_millis.return_value = 300000
     return context
 
 
@@ -122,6 +125,231 @@ def test_batch_to_firehose_respects_max_batch_size():
     assert len(second_call_args[1]["Records"]) == 100
 
 
+def test_batch_to_firehose_flushes_each_batch_as_it_fills():
+    """Test that a generator input is sent batch by batch, not materialized up front."""
+    consumed = []
+
+    def row_stream():
+        for i in range(1200):
+            consumed.append(i)
+            yield {"metric": f"test.{i}", "value": i}
+
+    sent_after = []
+    mock_firehose = MagicMock()
+
+    def put_record_batch(**kwargs):
+        sent_after.append(len(consumed))
+        return {"FailedPutCount": 0}
+
+    mock_firehose.put_record_batch.side_effect = put_record_batch
+
+    result = batch_to_firehose(
+        row_stream(), "test-stream", batch_size=500, firehose_client=mock_firehose
+    )
+
+    # Each flush happens as soon as its batch is full
+    assert sent_after == [500, 1000, 1200]
+    assert result["total_records"] == 1200
+    assert result["failed_records"] == 0
+    assert result["batches"] == 3
+
+
+def test_batch_to_firehose_sends_pre_encoded_rows_unchanged():
+    """Test that pre-encoded JSON lines are passed through as record Data."""
+    line = b'{"metric": "test", "value": 1}\n'
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    batch_to_firehose(iter([line]), "test-stream", firehose_client=mock_firehose)
+
+    call_args = mock_firehose.put_record_batch.call_args
+    assert call_args[1]["Records"] == [{"Data": line}]
+
+
+def test_batch_to_firehose_closes_batch_at_byte_limit():
+    """Test that a batch closes when the next record would exceed max_batch_bytes."""
+    rows = [b"x" * 99 + b"\n" for _ in range(10)]
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    result = batch_to_firehose(
+        rows, "test-stream", batch_size=500, max_batch_bytes=350, firehose_client=mock_firehose
+    )
+
+    sizes = [len(c[1]["Records"]) for c in mock_firehose.put_record_batch.call_args_list]
+    assert sizes == [3, 3, 3, 1]
+    assert result["batch_fill"][0] == {
+        "rows": 3, "records": 3, "bytes": 300, "record_fill": 0.006, "byte_fill": 0.857,
+    }
+
+
+def test_batch_to_firehose_splits_off_oversized_records():
+    """Test that rows over the per-record limit are reported, not sent."""
+    rows = [b"small\n", b"y" * 2000 + b"\n", b"small\n"]
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    result = batch_to_firehose(
+        rows, "test-stream", max_record_bytes=1000, firehose_client=mock_firehose
+    )
+
+    records = mock_firehose.put_record_batch.call_args[1]["Records"]
+    assert records == [{"Data": b"small\n"}, {"Data": b"small\n"}]
+    assert result["total_records"] == 2
+    assert result["oversized_records"] == 1
+    assert result["failed_records"] == 0
+
+
+def test_batch_to_firehose_aggregates_rows_into_records():
+    """Test that aggregation packs newline-delimited rows up to the byte target."""
+    rows = [{"metric": f"test.{i}", "value": i} for i in range(10)]
+    row_bytes = len((json.dumps(rows[0]) + "\n").encode("utf-8"))
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    result = batch_to_firehose(
+        rows, "test-stream", aggregate_bytes=row_bytes * 4, firehose_client=mock_firehose
+    )
+
+    records = mock_firehose.put_record_batch.call_args[1]["Records"]
+    assert len(records) == 3
+    # Every aggregated record is newline-delimited JSON, in order
+    parsed = [
+        json.loads(line)
+        for record in records
+        for line in record["Data"].decode("utf-8").splitlines()
+    ]
+    assert parsed == rows
+    assert result["total_records"] == 10
+    assert result["put_records"] == 3
+    assert result["batch_fill"][0]["rows"] == 10
+
+
+def test_batch_to_firehose_retries_only_failed_aggregates():
+    """Test that a failed aggregate re-sends its own rows and failures count rows."""
+    rows = [{"metric": f"test.{i}", "value": i} for i in range(6)]
+    row_bytes = len((json.dumps(rows[0]) + "\n").encode("utf-8"))
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.side_effect = [
+        {
+            "FailedPutCount": 1,
+            "RequestResponses": [
+                {"RecordId": "1"},
+                {"ErrorCode": "ServiceUnavailableException"},
+                {"RecordId": "3"},
+            ],
+        },
+        {
+            "FailedPutCount": 1,
+            "RequestResponses": [{"ErrorCode": "ServiceUnavailableException"}],
+        },
+    ]
+
+    with patch("handler.time.sleep"):
+        result = batch_to_firehose(
+            rows,
+            "test-stream",
+            max_retries=1,
+            aggregate_bytes=row_bytes * 2,
+            firehose_client=mock_firehose,
+        )
+
+    retried = mock_firehose.put_record_batch.call_args_list[1][1]["Records"]
+    assert [json.loads(line) for line in retried[0]["Data"].splitlines()] == rows[2:4]
+    assert result["failed_records"] == 2
+
+
+def test_batch_to_firehose_bounds_concurrent_dispatch():
+    """Test that parallel dispatch never exceeds max_in_flight outstanding calls."""
+    import threading
+    import time
+
+    rows = [{"metric": f"test.{i}", "value": i} for i in range(1000)]
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+
+    def put_record_batch(**kwargs):
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.02)
+        with lock:
+            active["now"] -= 1
+        return {"FailedPutCount": 0}
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.side_effect = put_record_batch
+
+    result = batch_to_firehose(
+        rows, "test-stream", batch_size=100, max_in_flight=3, firehose_client=mock_firehose
+    )
+
+    assert mock_firehose.put_record_batch.call_count == 10
+    assert 1 < active["peak"] <= 3
+    assert result["total_records"] == 1000
+    assert result["batches"] == 10
+
+
+def test_batch_to_firehose_parallel_summary_matches_sequential():
+    """Test that parallel dispatch reports the same summary as sequential sends."""
+    rows = [{"metric": f"test.{i}", "value": i} for i in range(250)]
+
+    def put_record_batch(**kwargs):
+        records = kwargs["Records"]
+        # Fail the last record of every call, every time
+        return {
+            "FailedPutCount": 1,
+            "RequestResponses": [{"RecordId": "ok"}] * (len(records) - 1)
+            + [{"ErrorCode": "InternalFailure"}],
+        }
+
+    results = []
+    for max_in_flight in (1, 4):
+        mock_firehose = MagicMock()
+        mock_firehose.put_record_batch.side_effect = put_record_batch
+        with patch("handler.time.sleep"):
+            results.append(batch_to_firehose(
+                rows,
+                "test-stream",
+                batch_size=50,
+                max_retries=0,
+                max_in_flight=max_in_flight,
+                firehose_client=mock_firehose,
+            ))
+
+    assert results[0] == results[1]
+    assert results[0]["failed_records"] == 5
+
+
+def test_batch_to_firehose_overlaps_encoding_with_sends():
+    """Test that a pipelined run sends the same records and reports its stages."""
+    rows = [{"metric": f"test.{i}", "value": i} for i in range(1200)]
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    result = batch_to_firehose(
+        iter(rows), "test-stream", pipeline_depth=2, firehose_client=mock_firehose
+    )
+
+    sent = [
+        json.loads(record["Data"])
+        for call in mock_firehose.put_record_batch.call_args_list
+        for record in call[1]["Records"]
+    ]
+    assert sent == rows
+    assert result["total_records"] == 1200
+    pipeline = result["pipeline"]
+    assert pipeline["queue_depth"] == 2
+    assert [s["name"] for s in pipeline["stages"]] == ["decode_flatten_encode", "send"]
+    assert pipeline["stages"][0]["items"] == 3
+
+
 def test_batch_to_firehose_formats_records_as_json_newline():
     """Test that records are formatted as JSON with newlines."""
     rows = [{"metric": "test", "value": 1}]
@@ -188,10 +416,10 @@ def test_batch_to_firehose_limits_retries():
     assert result["failed_records"] > 0
 
 
-@patch("handler.boto3")
+@patch("handler._create_client")
 @patch("handler._firehose_client", None)
 def test_handler_processes_kafka_event_and_writes_to_firehose(
-    mock_boto3, kafka_event, lambda_context, env_vars
+    mock_create_client, kafka_event, lambda_context, env_vars
 ):
     """Test end-to-end handler processing."""
     # Reset global client to ensure mock is used
@@ -199,7 +427,7 @@ def test_handler_processes_kafka_event_and_writes_to_firehose(
     h._firehose_client = None
 
     mock_firehose = MagicMock()
-    mock_boto3.client.return_value = mock_firehose
+    mock_create_client.return_value = mock_firehose
     mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
 
     response = handler(kafka_event, lambda_context)
@@ -214,9 +442,9 @@ def test_handler_processes_kafka_event_and_writes_to_firehose(
     assert "total_row_events" in response["body"]
 
 
-@patch("handler.boto3")
+@patch("handler._create_client")
 def test_handler_returns_summary_counts(
-    mock_boto3, kafka_event, lambda_context, env_vars
+    mock_create_client, kafka_event, lambda_context, env_vars
 ):
     """Test that handler returns correct summary counts."""
     # Reset global client
@@ -224,7 +452,7 @@ def test_handler_returns_summary_counts(
     h._firehose_client = None
 
     mock_firehose = MagicMock()
-    mock_boto3.client.return_value = mock_firehose
+    mock_create_client.return_value = mock_firehose
     mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
 
     response = handler(kafka_event, lambda_context)
@@ -235,11 +463,15 @@ def test_handler_returns_summary_counts(
     assert body["total_row_events"] == 1
     assert body["total_firehose_records"] == 1
     assert body["failed_records"] == 0
+    assert body["oversized_records"] == 0
+    assert len(body["batch_fill"]) == body["batches"] == 1
+    assert body["batch_fill"][0]["records"] == 1
+    assert body["batch_fill"][0]["bytes"] > 0
 
 
-@patch("handler.boto3")
+@patch("handler._create_client")
 def test_handler_handles_empty_event(
-    mock_boto3, lambda_context, env_vars
+    mock_create_client, lambda_context, env_vars
 ):
     """Test that handler gracefully handles empty events."""
     empty_event = {
@@ -254,9 +486,9 @@ def test_handler_handles_empty_event(
     assert response["body"]["total_row_events"] == 0
 
 
-@patch("handler.boto3")
+@patch("handler._create_client")
 def test_handler_handles_firehose_errors(
-    mock_boto3, kafka_event, lambda_context, env_vars
+    mock_create_client, kafka_event, lambda_context, env_vars, monkeypatch
 ):
     """Test that handler reports errors when Firehose fails."""
     # Reset global client
@@ -264,7 +496,7 @@ def test_handler_handles_firehose_errors(
     h._firehose_client = None
 
     mock_firehose = MagicMock()
-    mock_boto3.client.return_value = mock_firehose
+    mock_create_client.return_value = mock_firehose
 
     # Simulate complete failure (with max retries exhausted)
     mock_firehose.put_record_batch.return_value = {
@@ -272,11 +504,17 @@ def test_handler_handles_firehose_errors(
         "RequestResponses": [{"ErrorCode": "ServiceUnavailable"}]
     }
 
+    # Without a partial batch response, the invocation fails so Pipes retries
+    with pytest.raises(RuntimeError, match="neither delivered nor kept"):
+        handler(kafka_event, lambda_context)
+
+    # With one, it returns 200, reports the failures and hands the record back
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", "true")
     response = handler(kafka_event, lambda_context)
 
-    # Should still return 200 but report failures
     assert response["statusCode"] == 200
     assert response["body"]["failed_records"] > 0
+    assert len(response["batchItemFailures"]) == response["body"]["failed_kafka_records"] == 1
 
 
 def test_handler_uses_environment_variables(kafka_event, lambda_context, monkeypatch):
@@ -284,13 +522,13 @@ def test_handler_uses_environment_variables(kafka_event, lambda_context, monkeyp
     monkeypatch.setenv("FIREHOSE_STREAM_NAME", "custom-stream")
     monkeypatch.setenv("BATCH_SIZE", "100")
 
-    with patch("handler.boto3") as mock_boto3:
+    with patch("handler._create_client") as mock_create_client:
         # Reset global client
         import handler as h
         h._firehose_client = None
 
         mock_firehose = MagicMock()
-        mock_boto3.client.return_value = mock_firehose
+        mock_create_client.return_value = mock_firehose
         mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
 
         handler(kafka_event, lambda_context)
@@ -298,3 +536,853 @@ def test_handler_uses_environment_variables(kafka_event, lambda_context, monkeyp
         # Verify stream name used
         call_args = mock_firehose.put_record_batch.call_args
         assert call_args[1]["DeliveryStreamName"] == "custom-stream"
+
+
+@patch("handler._create_client")
+def test_handler_flattens_in_worker_processes(
+    mock_create_client, otlp_bundle, lambda_context, env_vars, monkeypatch
+):
+    """Test that the process-pool mode sends the same rows as the in-process path."""
+    import handler as h
+
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    event = {
+        "eventSource": "aws:kafka",
+        "records": {
+            "topic-0": [{"value": value_b64}, {"value": value_b64}],
+            "topic-1": [{"value": value_b64}],
+        },
+    }
+
+    sent = {}
+    for workers in ("0", "2"):
+        monkeypatch.setenv("FLATTEN_WORKERS", workers)
+        monkeypatch.setenv("FLATTEN_PROCESS_MIN_RECORDS", "2")
+        h._firehose_client = None
+        mock_firehose = MagicMock()
+        mock_create_client.return_value = mock_firehose
+        mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+        response = handler(event, lambda_context)
+
+        assert response["body"]["total_kafka_records"] == 3
+        assert response["body"]["total_row_events"] == 3
+        sent[workers] = mock_firehose.put_record_batch.call_args[1]["Records"]
+
+    assert sent["2"] == sent["0"]
+
+
+@pytest.mark.parametrize("pipeline_depth, max_in_flight", [("2", "1"), ("2", "4"), ("0", "4")])
+def test_handler_forks_workers_before_starting_threads(
+    otlp_bundle, lambda_context, env_vars, monkeypatch, capsys, pipeline_depth, max_in_flight
+):
+    """Test that flatten workers are forked from the main thread, before the stage or send pool starts."""
+    import os
+    import threading
+    import handler as h
+
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    event = {"records": {"topic-0": [{"offset": i, "value": value_b64} for i in range(4)]}}
+    monkeypatch.setenv("FLATTEN_WORKERS", "2")
+    monkeypatch.setenv("FLATTEN_PROCESS_MIN_RECORDS", "2")
+    monkeypatch.setenv("PIPELINE_DEPTH", pipeline_depth)
+    monkeypatch.setenv("MAX_IN_FLIGHT_BATCHES", max_in_flight)
+    monkeypatch.setenv("BATCH_SIZE", "1")
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    forks = []
+    fork = os.fork
+
+    def recording_fork():
+        threads = (threading.current_thread() is threading.main_thread(), threading.active_count())
+        pid = fork()
+        if pid:
+            forks.append(threads)
+        return pid
+
+    monkeypatch.setattr(os, "fork", recording_fork)
+
+    response = handler(event, lambda_context)
+
+    assert response["body"]["total_row_events"] == 4
+    assert forks == [(True, threading.active_count())] * 2
+    assert "2 forked workers for 4 records" in capsys.readouterr().out
+
+
+def test_batch_to_firehose_retries_raised_put_errors():
+    """Test that a PutRecordBatch call that raises is retried instead of failing the batch."""
+    from botocore.exceptions import ClientError
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.side_effect = [
+        ClientError({"Error": {"Code": "ServiceUnavailableException"}}, "PutRecordBatch"),
+        {"FailedPutCount": 0},
+    ]
+
+    with patch("handler.time.sleep"):
+        result = batch_to_firehose([b"{}\n"] * 3, "test-stream", firehose_client=mock_firehose)
+
+    assert mock_firehose.put_record_batch.call_count == 2
+    assert result["failed_records"] == 0
+    assert result["failed_rows"] == []
+
+
+def test_batch_to_firehose_reports_failed_row_positions():
+    """Test that rows still failing after retries are reported by input position."""
+    rows = [f'{{"i": {i}}}\n'.encode("utf-8") for i in range(6)]
+    sent_ok = {rows[0], rows[2], rows[3]}
+
+    def put_record_batch(DeliveryStreamName, Records):
+        responses = [{} if r["Data"] in sent_ok else {"ErrorCode": "InternalFailure"} for r in Records]
+        failed = sum(1 for r in responses if r)
+        return {"FailedPutCount": failed, "RequestResponses": responses}
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.side_effect = put_record_batch
+
+    with patch("handler.time.sleep"):
+        result = batch_to_firehose(
+            rows, "test-stream", batch_size=2, max_retries=1, firehose_client=mock_firehose
+        )
+
+    assert result["failed_records"] == 3
+    assert result["failed_rows"] == [[1, 1], [4, 1], [5, 1]]
+
+
+@patch("handler._create_client")
+def test_handler_reports_batch_item_failures(
+    mock_create_client, otlp_bundle, lambda_context, env_vars, monkeypatch
+):
+    """Test that only Kafka records with undelivered rows are returned for retry."""
+    import handler as h
+
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", "true")
+    monkeypatch.setenv("BATCH_SIZE", "1")
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    event = {
+        "eventSource": "aws:kafka",
+        "records": {
+            "topic-0": [{"offset": 7, "value": value_b64}, {"offset": 8, "value": value_b64}],
+            "topic-1": [{"offset": 3, "value": value_b64}],
+        },
+    }
+
+    h._firehose_client = None
+    mock_firehose = MagicMock()
+    mock_create_client.return_value = mock_firehose
+    # Second batch (the row from topic-0 offset 8) never gets through
+    calls = iter(range(100))
+
+    def put_record_batch(DeliveryStreamName, Records):
+        if next(calls) in (1, 2, 3, 4):
+            return {"FailedPutCount": 1, "RequestResponses": [{"ErrorCode": "InternalFailure"}]}
+        return {"FailedPutCount": 0}
+
+    mock_firehose.put_record_batch.side_effect = put_record_batch
+
+    with patch("handler.time.sleep"):
+        response = handler(event, lambda_context)
+
+    assert response["batchItemFailures"] == [{"itemIdentifier": "topic-0:8"}]
+    assert response["body"]["failed_kafka_records"] == 1
+
+
+@patch("handler._create_client")
+def test_handler_redelivers_undecodable_records_without_spill_bucket(
+    mock_create_client, otlp_bundle, lambda_context, env_vars, monkeypatch, capsys
+):
+    """Test that bad payloads are handed back for redelivery without failing the other records."""
+    import handler as h
+
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", "true")
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    bad_json = base64.b64encode(b"{not json").decode("utf-8")
+    event = {
+        "eventSource": "aws:kafka",
+        "records": {
+            "topic-0": [
+                {"offset": 1, "value": "!!not-base64!!"},
+                {"offset": 2, "value": value_b64},
+                {"offset": 3, "value": bad_json},
+            ],
+        },
+    }
+
+    h._firehose_client = None
+    mock_firehose = MagicMock()
+    mock_create_client.return_value = mock_firehose
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    response = handler(event, lambda_context)
+
+    body = response["body"]
+    assert body["total_kafka_records"] == 3
+    assert body["invalid_records"] == 2
+    assert body["total_row_events"] == 1
+    assert response["batchItemFailures"] == [
+        {"itemIdentifier": "topic-0:1"}, {"itemIdentifier": "topic-0:3"},
+    ]
+    assert '"UndecodableRecords": 2' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("spill_bucket", [None, "errors"])
+def test_handler_fails_invocation_for_records_it_cannot_keep_by_default(
+    otlp_bundle, lambda_context, env_vars, monkeypatch, capsys, spill_bucket
+):
+    """Test that without REPORT_BATCH_ITEM_FAILURES, unkept undecodable records fail the invocation."""
+    import handler as h
+    from botocore.exceptions import ClientError
+
+    monkeypatch.delenv("REPORT_BATCH_ITEM_FAILURES", raising=False)
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    event = {"records": {"topic-0": [
+        {"offset": 1, "value": "!!not-base64!!"},
+        {"offset": 2, "value": value_b64},
+        {"offset": 3, "value": base64.b64encode(b"{not json").decode("utf-8")},
+    ]}}
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    if spill_bucket:
+        monkeypatch.setenv("SPILL_BUCKET", spill_bucket)
+        mock_s3 = MagicMock()
+        mock_s3.put_object.side_effect = ClientError({"Error": {"Code": "AccessDenied"}}, "PutObject")
+        monkeypatch.setattr(h, "_s3_client", mock_s3)
+
+    with pytest.raises(RuntimeError, match="2 of 3 Kafka records"):
+        handler(event, lambda_context)
+
+    assert "Redelivering" not in capsys.readouterr().out
+
+
+def test_handler_spills_undecodable_records(otlp_bundle, lambda_context, env_vars, monkeypatch):
+    """Test that undecodable values, including out-of-range timestamps, are kept in S3 and not retried."""
+    import handler as h
+
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", "true")
+    monkeypatch.setenv("SPILL_BUCKET", "errors")
+    out_of_range = json.loads(json.dumps(otlp_bundle))
+    datapoint = out_of_range["resourceMetrics"][0]["scopeMetrics"][0]["metrics"][0]["gauge"]["dataPoints"][0]
+    datapoint["timeUnixNano"] = str(10 ** 30)
+    values = [
+        base64.b64encode(json.dumps(bundle).encode("utf-8")).decode("utf-8")
+        for bundle in (otlp_bundle, out_of_range)
+    ]
+    event = {"records": {"topic-0": [{"offset": i, "value": value} for i, value in enumerate(values)]}}
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    mock_s3 = MagicMock()
+    monkeypatch.setattr(h, "_s3_client", mock_s3)
+
+    response = handler(event, lambda_context)
+
+    put = mock_s3.put_object.call_args[1]
+    assert put["Key"].startswith("undecodable/topic-0/")
+    kept = json.loads(gzip.decompress(put["Body"]))
+    assert (kept["record"], kept["partition"], kept["offset"]) == ("topic-0:1", "topic-0", "1")
+    assert kept["value"] == values[1]
+    assert "Malformed OTLP bundle" in kept["error"]
+    assert response["body"]["undecodable"]["rows"] == 1
+    assert response["body"]["total_row_events"] > 0
+    assert response["batchItemFailures"] == []
+
+
+def test_handler_redelivers_undecodable_records_it_cannot_spill(lambda_context, env_vars, monkeypatch):
+    """Test that an undecodable record whose spill PUT fails is reported for redelivery."""
+    import handler as h
+    from botocore.exceptions import ClientError
+
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", "true")
+    monkeypatch.setenv("SPILL_BUCKET", "errors")
+    monkeypatch.setattr(h, "_firehose_client", MagicMock())
+    mock_s3 = MagicMock()
+    mock_s3.put_object.side_effect = ClientError({"Error": {"Code": "AccessDenied"}}, "PutObject")
+    monkeypatch.setattr(h, "_s3_client", mock_s3)
+
+    response = handler({"records": {"topic-0": [{"offset": 5, "value": "!!not-base64!!"}]}}, lambda_context)
+
+    assert response["batchItemFailures"] == [{"itemIdentifier": "topic-0:5"}]
+
+
+def test_handler_stops_decoding_at_deadline(otlp_bundle, lambda_context, env_vars, monkeypatch):
+    """Test that no record is decoded once the deadline has passed, and all are redelivered."""
+    import handler as h
+
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", "true")
+    # Less time left than the 5 s reserve: the deadline has already passed
+    lambda_context.get_remaining_time_in_millis.return_value = 4000
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    event = {"records": {"topic-0": [{"offset": i, "value": value_b64} for i in range(3)]}}
+    mock_firehose = MagicMock()
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    decode = MagicMock(wraps=h.decode_kafka_value)
+    monkeypatch.setattr(h, "decode_kafka_value", decode)
+
+    response = handler(event, lambda_context)
+
+    decode.assert_not_called()
+    mock_firehose.put_record_batch.assert_not_called()
+    assert response["body"]["unread_kafka_records"] == 3
+    assert response["batchItemFailures"] == [{"itemIdentifier": f"topic-0:{i}"} for i in range(3)]
+
+
+def test_iter_encoded_rows_stops_consuming_records_once_stopped(otlp_bundle, monkeypatch):
+    """Test that records after the stop signal are never decoded or registered."""
+    import handler as h
+    from handler import RowSources, _iter_encoded_rows
+
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    entries = [(f"topic-0:{i}", value_b64, None) for i in range(3)]
+    decode = MagicMock(wraps=h.decode_kafka_value)
+    monkeypatch.setattr(h, "decode_kafka_value", decode)
+    sources = RowSources()
+
+    rows = list(_iter_encoded_rows(entries, sources, stop=lambda: sources.records >= 1))
+
+    assert decode.call_count == 1
+    assert sources.records == 1
+    assert len(rows) == sources.rows > 0
+
+
+def test_batch_to_firehose_stops_at_deadline_and_reports_undelivered_rows():
+    """Test that batches left once the deadline passes are reported, not sent."""
+    from retry import RetryScheduler
+
+    now = [0.0]
+    scheduler = RetryScheduler(deadline=5.0, clock=lambda: now[0])
+
+    def slow_put(DeliveryStreamName, Records):
+        now[0] += 10.0
+        return {"FailedPutCount": 0}
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.side_effect = slow_put
+
+    result = batch_to_firehose(
+        [b"{}\n"] * 4,
+        "test-stream",
+        batch_size=2,
+        firehose_client=mock_firehose,
+        retry_scheduler=scheduler,
+    )
+
+    assert mock_firehose.put_record_batch.call_count == 1
+    assert result["failed_records"] == 2
+    assert result["failed_rows"] == [[2, 1], [3, 1]]
+    assert result["retry"]["deadline_reached"]
+
+
+def test_batch_to_firehose_backs_off_longer_when_throttled():
+    """Test that throttling errors back off with growing jitter and others do not."""
+    from retry import RetryScheduler
+
+    def failing(code):
+        return {"FailedPutCount": 1, "RequestResponses": [{"ErrorCode": code}]}
+
+    sleeps = {}
+    for code in ("ServiceUnavailableException", "InternalFailure"):
+        mock_firehose = MagicMock()
+        mock_firehose.put_record_batch.return_value = failing(code)
+        scheduler = RetryScheduler(base_delay=0.1, max_delay=10.0)
+
+        with patch("handler.time.sleep") as mock_sleep:
+            batch_to_firehose(
+                [b"{}\n"], "test-stream", max_retries=6,
+                firehose_client=mock_firehose, retry_scheduler=scheduler,
+            )
+        sleeps[code] = [c.args[0] for c in mock_sleep.call_args_list]
+
+    assert len(sleeps["InternalFailure"]) == 6
+    assert max(sleeps["InternalFailure"]) <= 0.1
+    assert max(sleeps["ServiceUnavailableException"]) > 0.1
+
+
+def test_batch_to_firehose_respects_retry_budget():
+    """Test that the per-invocation budget caps retries across all batches."""
+    from retry import RetryScheduler
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {
+        "FailedPutCount": 1,
+        "RequestResponses": [{"ErrorCode": "InternalFailure"}],
+    }
+
+    with patch("handler.time.sleep"):
+        result = batch_to_firehose(
+            [b"{}\n"] * 3, "test-stream", batch_size=1, max_retries=3,
+            firehose_client=mock_firehose, retry_scheduler=RetryScheduler(budget=2),
+        )
+
+    # 3 initial sends + 2 budgeted retries
+    assert mock_firehose.put_record_batch.call_count == 5
+    assert result["failed_records"] == 3
+    assert result["retry"]["budget_exhausted"]
+
+
+def test_batch_to_firehose_slows_down_when_throttled():
+    """Test that throttling shrinks later batches and paces the retries."""
+    from rate_control import AimdController
+
+    responses = iter(
+        [{"FailedPutCount": 4, "RequestResponses": [{"ErrorCode": "ServiceUnavailableException"}] * 4}]
+    )
+
+    def put_record_batch(DeliveryStreamName, Records):
+        return next(responses, {"FailedPutCount": 0})
+
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.side_effect = put_record_batch
+    controller = AimdController(max_rate=100, max_batch_size=4, min_batch_size=2, batch_step=0)
+
+    with patch("handler.time.sleep") as mock_sleep:
+        result = batch_to_firehose(
+            [b"{}\n"] * 10, "test-stream", batch_size=4,
+            firehose_client=mock_firehose, rate_controller=controller,
+        )
+
+    assert result["failed_records"] == 0
+    assert [fill["records"] for fill in result["batch_fill"]] == [4, 2, 2, 2]
+    assert result["rate_control"]["decreases"] == 1
+    assert mock_sleep.called
+
+
+def test_put_batch_does_not_pace_past_the_deadline():
+    """Test that a pacing wait longer than the time left is neither slept nor reserved."""
+    from handler import _put_batch_with_retry
+    from rate_control import AimdController
+    from retry import RetryScheduler
+
+    now = [0.0]
+    scheduler = RetryScheduler(deadline=1.0, clock=lambda: now[0])
+    controller = AimdController(max_rate=100, min_rate=100, clock=lambda: now[0])
+    controller.acquire(500)
+    next_send = controller._next_send
+    mock_firehose = MagicMock()
+
+    with patch("handler.time.sleep") as mock_sleep:
+        failed = _put_batch_with_retry(
+            [b"{}\n"] * 500, "test-stream", 3, mock_firehose, scheduler, controller
+        )
+
+    assert failed == list(range(500))
+    mock_sleep.assert_not_called()
+    mock_firehose.put_record_batch.assert_not_called()
+    assert controller._next_send == next_send
+    assert scheduler.report()["deadline_reached"]
+
+
+@patch("handler._create_client")
+def test_handler_keeps_rate_controller_across_invocations(
+    mock_create_client, kafka_event, lambda_context, env_vars, monkeypatch, capsys
+):
+    """Test that the controller state survives warm invocations and is logged as a metric."""
+    import handler as h
+
+    monkeypatch.setenv("RATE_CONTROL", "true")
+    monkeypatch.setattr(h, "_rate_controller", None)
+    h._firehose_client = None
+    mock_firehose = MagicMock()
+    mock_create_client.return_value = mock_firehose
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    first = handler(kafka_event, lambda_context)
+    controller = h._rate_controller
+    controller.observe(1, 1, throttled=True, latency=0.1)
+    second = handler(kafka_event, lambda_context)
+
+    assert h._rate_controller is controller
+    assert first["body"]["rate_control"]["decreases"] == 0
+    assert second["body"]["rate_control"]["decreases"] == 1
+    assert '"FirehoseSendRate"' in capsys.readouterr().out
+
+
+def test_batch_to_firehose_hands_undelivered_records_to_callback():
+    """Test that failed and oversized records are passed on with their first row."""
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {
+        "FailedPutCount": 1,
+        "RequestResponses": [{}, {"ErrorCode": "InternalFailure"}],
+    }
+    undelivered = []
+    rows = [b'{"i": 0}\n', b"x" * 50 + b"\n", b'{"i": 2}\n']
+
+    with patch("handler.time.sleep"):
+        batch_to_firehose(
+            rows, "test-stream", max_retries=0, max_record_bytes=40,
+            firehose_client=mock_firehose,
+            on_undelivered=lambda first_row, record: undelivered.append((first_row, record)),
+        )
+
+    assert undelivered == [(2, b'{"i": 2}\n'), (1, rows[1])]
+
+
+@patch("handler._create_client")
+def test_handler_spills_undelivered_rows_to_s3(
+    mock_create_client, otlp_bundle, lambda_context, env_vars, monkeypatch
+):
+    """Test that rows Firehose rejects are spilled and not handed back for redelivery."""
+    import handler as h
+
+    monkeypatch.setenv("SPILL_BUCKET", "errors")
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", "true")
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("utf-8")
+    event = {"records": {"topic-0": [{"offset": 4, "value": value_b64}]}}
+
+    h._firehose_client = None
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {
+        "FailedPutCount": 1,
+        "RequestResponses": [{"ErrorCode": "InternalFailure"}],
+    }
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    mock_s3 = MagicMock()
+    monkeypatch.setattr(h, "_s3_client", mock_s3)
+
+    with patch("handler.time.sleep"):
+        response = handler(event, lambda_context)
+
+    put = mock_s3.put_object.call_args[1]
+    assert put["Bucket"] == "errors"
+    assert put["Key"].startswith("spill/topic-0/")
+    assert b'"metric"' in gzip.decompress(put["Body"])
+    assert response["body"]["spill"]["rows"] == 1
+    assert response["batchItemFailures"] == []
+
+
+@patch("handler._create_client")
+def test_handler_flattens_with_remote_spec(
+    mock_create_client, kafka_event, lambda_context, env_vars, monkeypatch
+):
+    """Test that a spec published to S3 drives the flatten plan without a redeploy."""
+    import handler as h
+    from spec_loader import SpecLoader
+
+    artifact = SpecLoader(artifact_path="").build_artifact()
+    artifact["schema"] = dict(
+        artifact["schema"], flatten={"resource_promotions": {"orgId": "orgId", "host": "hostName"}}
+    )
+    mock_s3 = MagicMock()
+    mock_s3.get_object.return_value = {
+        "Body": MagicMock(read=lambda: json.dumps(artifact).encode("utf-8")),
+        "ETag": '"v1"',
+    }
+    monkeypatch.setenv("SPEC_SOURCE", "s3://spec-config/spec.json")
+    monkeypatch.setattr(h, "_spec_source", None)
+    monkeypatch.setattr(h, "_s3_client", mock_s3)
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+
+    response = handler(kafka_event, lambda_context)
+
+    records = mock_firehose.put_record_batch.call_args[1]["Records"]
+    row = json.loads(records[0]["Data"].splitlines()[0])
+    assert row["host"] == "acme-prod-web-01"
+    assert "deviceId" not in row
+    assert response["body"]["spec"]["version"] == '"v1"'
+    mock_s3.get_object.assert_called_once_with(Bucket="spec-config", Key="spec.json")
+
+
+def test_firehose_client_leaves_retries_to_handler(monkeypatch):
+    """Test that the Firehose client has SDK retries off, keep-alive on and a pool per in-flight batch."""
+    import handler as h
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("MAX_IN_FLIGHT_BATCHES", "16")
+    monkeypatch.setattr(h, "_firehose_client", None)
+
+    config = h.get_firehose_client().meta.config
+
+    assert config.retries["total_max_attempts"] == 1
+    assert config.tcp_keepalive is True
+    assert config.max_pool_connections == 16
+    assert config.read_timeout == h.FIREHOSE_READ_TIMEOUT
+
+
+def test_handler_import_defers_heavy_modules(tmp_path):
+    """Test that importing the handler loads neither boto3 nor worker/pool modules."""
+    from spec_loader import SpecLoader
+
+    artifact_path = tmp_path / "spec_artifact.json"
+    artifact_path.write_text(json.dumps(SpecLoader(artifact_path="").build_artifact()))
+    env = {"PATH": "", "SPEC_ARTIFACT_PATH": str(artifact_path)}
+    deferred = ["boto3", "s3transfer", "yaml", "multiprocessing", "concurrent.futures"]
+    loaded = subprocess.run(
+        [sys.executable, "-c", f"import sys, handler; print([m for m in {deferred!r} if m in sys.modules])"],
+        cwd=Path(__file__).parent.parent / "lambda",
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout.strip()
+
+    assert loaded == "[]"
+
+
+@pytest.fixture
+def mixed_event(otlp_bundle):
+    """Fixture providing an event with one valid record and one whose row lacks orgId."""
+    invalid = json.loads(json.dumps(otlp_bundle))
+    resource = invalid["resourceMetrics"][0]["resource"]
+    resource["attributes"] = [attr for attr in resource["attributes"] if attr["key"] != "orgId"]
+    values = [
+        base64.b64encode(json.dumps(bundle).encode("utf-8")).decode("utf-8")
+        for bundle in (otlp_bundle, invalid)
+    ]
+    return {"records": {"topic-0": [{"offset": i, "value": value} for i, value in enumerate(values)]}}
+
+
+def test_handler_routes_invalid_rows_to_sidecar(mixed_event, lambda_context, env_vars, monkeypatch):
+    """Test that rows failing validation go to the sidecar prefix instead of Firehose."""
+    import handler as h
+
+    monkeypatch.setenv("VALIDATION_MODE", "all")
+    monkeypatch.setenv("SPILL_BUCKET", "errors")
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    mock_s3 = MagicMock()
+    monkeypatch.setattr(h, "_s3_client", mock_s3)
+
+    response = handler(mixed_event, lambda_context)
+
+    assert len(mock_firehose.put_record_batch.call_args[1]["Records"]) == 1
+    put = mock_s3.put_object.call_args[1]
+    assert put["Key"].startswith("invalid/topic-0/")
+    assert "/1-1-" in put["Key"]
+    rejected = json.loads(gzip.decompress(put["Body"]))
+    assert rejected["error"] == "missing:orgId"
+    assert rejected["row"]["metric"]
+    validation = response["body"]["validation"]
+    assert validation["checked_rows"] == 2
+    assert validation["rejected_rows"] == 1
+    assert validation["errors"] == {"missing:orgId": 1}
+    assert validation["sidecar"]["objects"] == 1
+    assert response["body"]["total_row_events"] == 1
+
+
+@pytest.mark.parametrize("mode", ["all", "sample"])
+def test_handler_rejects_validation_without_spill_bucket(mixed_event, lambda_context, env_vars, monkeypatch, mode):
+    """Test that validation with nowhere to keep rejected rows is a config error, not data loss."""
+    import handler as h
+
+    monkeypatch.setenv("VALIDATION_MODE", mode)
+    monkeypatch.delenv("SPILL_BUCKET", raising=False)
+    mock_firehose = MagicMock()
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+
+    with pytest.raises(ValueError, match="needs a SPILL_BUCKET"):
+        handler(mixed_event, lambda_context)
+    mock_firehose.put_record_batch.assert_not_called()
+
+
+def test_handler_skips_unsampled_records(mixed_event, lambda_context, env_vars, monkeypatch):
+    """Test that sample mode only validates the configured share of records."""
+    import handler as h
+
+    monkeypatch.setenv("VALIDATION_MODE", "sample")
+    monkeypatch.setenv("VALIDATION_SAMPLE_RATE", "0")
+    monkeypatch.setenv("SPILL_BUCKET", "errors")
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+
+    response = handler(mixed_event, lambda_context)
+
+    assert response["body"]["validation"]["checked_rows"] == 0
+    assert response["body"]["total_row_events"] == 2
+
+
+def test_flatten_in_processes_returns_rejected_rows(mixed_event):
+    """Test that forked workers hand back rejected rows with their codes, like the in-process path."""
+    from handler import PLAN, SPEC_LOADER, RowSources, _iter_encoded_rows, flatten_in_processes, _kafka_entries
+
+    entries = _kafka_entries(mixed_event)
+    validator = SPEC_LOADER.get_row_validator()
+    in_process = RowSources()
+    forked = RowSources()
+
+    expected = list(_iter_encoded_rows(entries, in_process, PLAN, validator))
+    rows = list(flatten_in_processes(entries, 2, forked, PLAN, validator))
+
+    assert rows == expected
+    assert forked.rejected == in_process.rejected
+    assert [code for _, code, _ in forked.rejected] == ["missing:orgId"]
+    assert forked.checked == 2
+
+
+def test_handler_decodes_gzip_values(otlp_bundle, lambda_context, env_vars, monkeypatch):
+    """Test that gzip-compressed Kafka values produce the same rows as plain JSON."""
+    import handler as h
+
+    document = json.dumps(otlp_bundle).encode("utf-8")
+    values = [document, gzip.compress(document)]
+    event = {"records": {"topic-0": [
+        {"offset": i, "value": base64.b64encode(value).decode("ascii")}
+        for i, value in enumerate(values)
+    ]}}
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+
+    response = handler(event, lambda_context)
+
+    records = mock_firehose.put_record_batch.call_args[1]["Records"]
+    assert records[0]["Data"] == records[1]["Data"]
+    decode = response["body"]["decode"]
+    assert decode["records"] == 2
+    assert decode["compressed_records"] == 1
+    assert decode["json_bytes"] == 2 * len(document)
+    assert decode["max_rss_mb"] > 0
+
+
+def test_handler_decodes_protobuf_values(otlp_bundle, lambda_context, env_vars, monkeypatch):
+    """Test that protobuf Kafka values, with or without a content-type header, match the JSON rows."""
+    import handler as h
+    from otlp_proto import encode_export_request
+
+    document = json.dumps(otlp_bundle).encode("utf-8")
+    proto = encode_export_request(otlp_bundle)
+    content_type = [{"content-type": list(b"application/x-protobuf; proto=ExportMetricsServiceRequest")}]
+    event = {"records": {"topic-0": [
+        {"offset": 0, "value": base64.b64encode(document).decode("ascii"), "headers": []},
+        {"offset": 1, "value": base64.b64encode(proto).decode("ascii"), "headers": content_type},
+        {"offset": 2, "value": base64.b64encode(proto).decode("ascii")},
+    ]}}
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+
+    response = handler(event, lambda_context)
+
+    records = mock_firehose.put_record_batch.call_args[1]["Records"]
+    rows_per_record = len(records) // 3
+    assert rows_per_record > 0
+    assert records[:rows_per_record] == records[rows_per_record:2 * rows_per_record]
+    assert records[:rows_per_record] == records[2 * rows_per_record:]
+    assert response["body"]["decode"]["protobuf_records"] == 2
+
+
+def test_kafka_entries_read_content_type_header():
+    """Test that the content-type header is read from Pipes byte lists, case-insensitively."""
+    from handler import _kafka_entries
+
+    event = {"records": {"topic-0": [
+        {"offset": 1, "value": "e30=", "headers": [{"trace": [1]}, {"Content-Type": list(b"Application/JSON")}]},
+        {"offset": 2, "value": "e30="},
+    ]}}
+
+    assert _kafka_entries(event) == [
+        ("topic-0:1", "e30=", "application/json"),
+        ("topic-0:2", "e30=", None),
+    ]
+
+
+def test_handler_reuses_resource_fragments_across_invocations(otlp_bundle, lambda_context, env_vars, monkeypatch):
+    """Test that the warm resource cache hits on later invocations, in-process and in workers."""
+    import handler as h
+
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("ascii")
+    event = {"records": {"topic-0": [{"offset": i, "value": value_b64} for i in range(2)]}}
+    resources = len(otlp_bundle["resourceMetrics"])
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    monkeypatch.setattr(h, "_resource_cache", None)
+    monkeypatch.setenv("RESOURCE_CACHE_ENTRIES", "1024")
+
+    first = handler(event, lambda_context)["body"]["resource_cache"]
+    monkeypatch.setenv("FLATTEN_WORKERS", "2")
+    monkeypatch.setenv("FLATTEN_PROCESS_MIN_RECORDS", "2")
+    second = handler(event, lambda_context)["body"]["resource_cache"]
+
+    assert (first["hits"], first["misses"]) == (resources, resources)
+    assert (second["hits"], second["misses"]) == (2 * resources, 0)
+    assert second["entries"] == resources
+
+
+def test_handler_reports_attribute_shapes(otlp_bundle, lambda_context, env_vars, monkeypatch):
+    """Test that attribute shape counts cover every datapoint, in-process and in workers."""
+    import handler as h
+
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("ascii")
+    event = {"records": {"topic-0": [{"offset": i, "value": value_b64} for i in range(2)]}}
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+
+    first = handler(event, lambda_context)["body"]
+    monkeypatch.setenv("FLATTEN_WORKERS", "2")
+    monkeypatch.setenv("FLATTEN_PROCESS_MIN_RECORDS", "2")
+    second = handler(event, lambda_context)["body"]
+
+    for body in (first, second):
+        shapes = body["attribute_shapes"]
+        assert shapes["hits"] + shapes["misses"] + shapes["fallbacks"] == body["total_row_events"]
+        assert shapes["shapes"] >= 1
+    assert second["attribute_shapes"]["compiled"] == 0
+
+
+@pytest.mark.parametrize("entries", [None, "0"])
+def test_handler_resource_cache_is_off_by_default(otlp_bundle, lambda_context, env_vars, monkeypatch, entries):
+    """Test that without RESOURCE_CACHE_ENTRIES, or with 0, rows are flattened without a cache."""
+    import handler as h
+
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("ascii")
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    if entries is None:
+        monkeypatch.delenv("RESOURCE_CACHE_ENTRIES", raising=False)
+    else:
+        monkeypatch.setenv("RESOURCE_CACHE_ENTRIES", entries)
+
+    response = handler({"records": {"topic-0": [{"value": value_b64}]}}, lambda_context)
+
+    assert response["body"]["resource_cache"] is None
+    assert response["body"]["total_row_events"] > 0
+
+
+def test_handler_intern_scope(otlp_bundle, lambda_context, env_vars, monkeypatch):
+    """Test that INTERN_SCOPE selects a per-invocation table, a warm table, or none."""
+    import handler as h
+
+    value_b64 = base64.b64encode(json.dumps(otlp_bundle).encode("utf-8")).decode("ascii")
+    event = {"records": {"topic-0": [{"value": value_b64}]}}
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+    monkeypatch.setattr(h, "_firehose_client", mock_firehose)
+    monkeypatch.setattr(h, "_interner", None)
+
+    per_invocation = handler(event, lambda_context)["body"]["interning"]
+    monkeypatch.setenv("INTERN_SCOPE", "warm")
+    handler(event, lambda_context)
+    warm = handler(event, lambda_context)["body"]["interning"]
+    monkeypatch.setenv("INTERN_SCOPE", "off")
+    off = handler(event, lambda_context)["body"]["interning"]
+
+    assert per_invocation["scope"] == "invocation"
+    assert per_invocation["entries"] > 0
+    assert warm == {"entries": per_invocation["entries"], "resets": 0, "scope": "warm"}
+    assert h._interner is not None
+    assert off is None
+
+    monkeypatch.setenv("INTERN_SCOPE", "global")
+    with pytest.raises(ValueError, match="INTERN_SCOPE"):
+        handler(event, lambda_context)
+
+
+def test_batch_to_firehose_serializes_row_events(otlp_bundle):
+    """Test that RowEvents from flatten_otlp are sent as the same JSON lines as row dicts."""
+    from flatten import flatten_otlp
+    from handler import PLAN
+
+    rows = flatten_otlp(otlp_bundle, PLAN)
+    mock_firehose = MagicMock()
+    mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+
+    batch_to_firehose(rows, "test-stream", firehose_client=mock_firehose)
+
+    records = mock_firehose.put_record_batch.call_args[1]["Records"]
+    assert [record["Data"] for record in records] == [
+        (json.dumps(row.to_dict()) + "\n").encode("utf-8") for row in rows
+    ]
@@ -0,0 +1,71 @@
+# ABOUTME: Tests for interning module
+# ABOUTME: Validates shared string instances, warm-table trimming, and row parity of interned batches
+
+import json
+import sys
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from flatten import flatten_otlp_batch
+from interning import StringInterner
+from spec_loader import SpecLoader
+
+
+@pytest.fixture
+def otlp_bundle():
+    with open(Path(__file__).parent / "fixtures" / "otlp" / "otlp_bundle_ok.json") as f:
+        return json.load(f)
+
+
+def test_intern_returns_one_instance_per_string():
+    """Test that equal strings intern to the first instance seen."""
+    interner = StringInterner()
+    first = "".join(["cpu", "Busy"])
+    second = "".join(["cpu", "Busy"])
+
+    assert first is not second
+    assert interner.intern(first) is first
+    assert interner.intern(second) is first
+    assert len(interner) == 1
+
+
+def test_intern_passes_other_values_through():
+    """Test that numbers, booleans and None are returned unchanged and not stored."""
+    interner = StringInterner()
+
+    assert interner.intern(1.5) == 1.5
+    assert interner.intern(True) is True
+    assert interner.intern(None) is None
+    assert len(interner) == 0
+
+
+def test_trim_empties_table_past_max_entries():
+    """Test that a warm table is emptied once it passes its cap, and only then."""
+    interner = StringInterner(max_entries=2)
+    interner.intern("a")
+    interner.intern("b")
+    interner.trim()
+    assert interner.report() == {"entries": 2, "resets": 0}
+
+    interner.intern("c")
+    interner.trim()
+    assert interner.report() == {"entries": 0, "resets": 1}
+
+
+def test_interned_batch_shares_strings_and_encodes_identically(otlp_bundle):
+    """Test that an interned batch keeps one object per distinct string and the same rows."""
+    plan = SpecLoader().get_flatten_plan()
+    bundles = [otlp_bundle, json.loads(json.dumps(otlp_bundle))]
+    interner = StringInterner()
+
+    interned = flatten_otlp_batch(bundles, plan, interner=interner)
+    plain = flatten_otlp_batch(bundles, plan)
+
+    assert list(interned.encode()) == list(plain.encode())
+    assert interned.rows() == plain.rows()
+    assert len({id(ts) for ts in interned.ts}) == len(set(interned.ts))
+    assert len({id(m) for m in interned.metric}) == len(set(interned.metric))
+    values = [v for attrs in interned.attributes for v in attrs.values() if isinstance(v, str)]
+    assert len({id(v) for v in values}) == len(set(values))
@@ -0,0 +1,127 @@
+# ABOUTME: Tests for kafka_decode module
+# ABOUTME: Validates base64/JSON decoding, gzip, zstd and protobuf detection, and decode stats
+
+import base64
+import gzip
+import importlib.util
+import json
+import sys
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from kafka_decode import DecodeStats, decode_kafka_value, decompress
+from otlp_proto import encode_export_request
+
+BUNDLE = {"resourceMetrics": [{"resource": {"attributes": [{"key": "hostName", "value": {"stringValue": "wé-01"}}]}}]}
+
+
+def _b64(payload: bytes) -> str:
+    return base64.b64encode(payload).decode("ascii")
+
+
+def test_decode_kafka_value_parses_json_bytes():
+    """Test that plain JSON values (including non-ASCII text) decode to the bundle."""
+    stats = DecodeStats()
+    payload = json.dumps(BUNDLE, ensure_ascii=False).encode("utf-8")
+
+    assert decode_kafka_value(_b64(payload), stats) == BUNDLE
+    report = stats.report()
+    assert report["records"] == 1
+    assert report["compressed_records"] == 0
+    assert report["payload_bytes"] == report["json_bytes"] == len(payload)
+    assert report["encoded_bytes"] == len(_b64(payload))
+
+
+def test_decode_kafka_value_parses_json_with_leading_newline():
+    """Test that JSON starting with LF, the protobuf tag byte, is not taken for protobuf."""
+    stats = DecodeStats()
+    payload = b"\n" + json.dumps(BUNDLE, indent=2).encode("utf-8") + b"\n"
+
+    assert decode_kafka_value(_b64(payload), stats) == BUNDLE
+    assert decode_kafka_value(_b64(gzip.compress(payload)), stats) == BUNDLE
+    assert stats.protobuf_records == 0
+
+
+def test_decode_kafka_value_detects_gzip():
+    """Test that gzip values are recognized by their magic bytes and decompressed."""
+    stats = DecodeStats()
+    document = json.dumps(BUNDLE).encode("utf-8")
+    payload = gzip.compress(document)
+
+    assert decode_kafka_value(_b64(payload), stats) == BUNDLE
+    assert stats.compressed_records == 1
+    assert stats.payload_bytes == len(payload)
+    assert stats.json_bytes == len(document)
+
+
+def test_decode_kafka_value_detects_protobuf():
+    """Test that protobuf values, plain or gzip, are sniffed and decoded to the JSON bundle shape."""
+    stats = DecodeStats()
+    document = encode_export_request(BUNDLE)
+
+    # Repeated fields always decode, so the empty scopeMetrics list appears
+    expected = {"resourceMetrics": [{**BUNDLE["resourceMetrics"][0], "scopeMetrics": []}]}
+
+    assert decode_kafka_value(_b64(document), stats) == expected
+    assert decode_kafka_value(_b64(gzip.compress(document)), stats) == expected
+    assert stats.protobuf_records == 2
+    assert stats.compressed_records == 1
+
+
+def test_decode_kafka_value_follows_content_type():
+    """Test that a content-type header overrides sniffing the payload."""
+    document = encode_export_request(BUNDLE)
+
+    with pytest.raises(ValueError):
+        decode_kafka_value(_b64(document), content_type="application/json")
+    with pytest.raises(ValueError):
+        decode_kafka_value(_b64(json.dumps(BUNDLE).encode("utf-8")), content_type="application/x-protobuf")
+
+
+@pytest.mark.skipif(importlib.util.find_spec("zstandard") is None, reason="zstandard not installed")
+def test_decode_kafka_value_detects_zstd():
+    """Test that zstd values, with or without a content size, are decompressed."""
+    import zstandard
+
+    document = json.dumps(BUNDLE).encode("utf-8")
+    framed = zstandard.ZstdCompressor().compress(document)
+    streamed = zstandard.ZstdCompressor(write_content_size=False).compress(document)
+
+    assert decode_kafka_value(_b64(framed)) == BUNDLE
+    assert decode_kafka_value(_b64(streamed)) == BUNDLE
+
+
+@pytest.mark.skipif(importlib.util.find_spec("zstandard") is not None, reason="zstandard installed")
+def test_zstd_without_zstandard_is_a_value_error():
+    """Test that a zstd value is reported as undecodable when zstandard is missing."""
+    with pytest.raises(ValueError, match="zstandard is not installed"):
+        decompress(b"\x28\xb5\x2f\xfd" + b"\x00" * 8)
+
+
+def test_decode_kafka_value_rejects_corrupt_values():
+    """Test that bad base64, truncated gzip and bad JSON all raise ValueError."""
+    truncated = gzip.compress(json.dumps(BUNDLE).encode("utf-8"))[:-6]
+
+    with pytest.raises(ValueError, match="base64"):
+        decode_kafka_value("abc")
+    with pytest.raises(ValueError, match="gzip"):
+        decode_kafka_value(_b64(truncated))
+    with pytest.raises(ValueError):
+        decode_kafka_value(_b64(b"{not json"))
+
+
+def test_decode_stats_merge_adds_worker_reports():
+    """Test that stats reported by worker processes add up in the parent."""
+    worker = DecodeStats()
+    worker.add(100, 75, 300, 0.002, compressed=True)
+    parent = DecodeStats()
+    parent.add(40, 30, 30, 0.001)
+
+    parent.merge(worker.report())
+
+    assert parent.records == 2
+    assert parent.compressed_records == 1
+    assert parent.json_bytes == 330
+    assert parent.report()["max_record_ms"] == 2.0
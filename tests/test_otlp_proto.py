@@ -0,0 +1,151 @@
+# ABOUTME: Tests for otlp_proto module
+# ABOUTME: Validates protobuf round trips, OTLP/JSON value spellings and row parity with the JSON path
+
+import json
+import struct
+import sys
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from flatten import flatten_otlp_batch
+from otlp_proto import decode_export_request, encode_export_request, is_protobuf
+from spec_loader import SpecLoader
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "otlp"
+
+
+@pytest.fixture
+def otlp_bundle():
+    with open(FIXTURES_DIR / "otlp_bundle_ok.json") as f:
+        return json.load(f)
+
+
+def _bundle(data_point, metric_type="gauge", scope=None, **metric_fields):
+    metric = {"name": "CPUBusyPercent", metric_type: {"dataPoints": [data_point], **metric_fields}}
+    return {"resourceMetrics": [{
+        "resource": {"attributes": [{"key": "hostName", "value": {"stringValue": "server-01"}}]},
+        "scopeMetrics": [{"scope": scope or {"name": "CPU_Usage"}, "metrics": [metric]}],
+    }]}
+
+
+def test_fixture_rows_match_json_path(otlp_bundle):
+    """Test that a protobuf-encoded fixture flattens to the same rows as its JSON."""
+    plan = SpecLoader().get_flatten_plan()
+    decoded = decode_export_request(encode_export_request(otlp_bundle))
+
+    json_rows = list(flatten_otlp_batch([otlp_bundle], plan).encode())
+    proto_rows = list(flatten_otlp_batch([decoded], plan).encode())
+
+    assert proto_rows == json_rows
+    assert len(proto_rows) > 0
+
+
+def test_round_trip_preserves_value_spellings():
+    """Test that timestamps decode as strings, integer values as ints, and others keep their types."""
+    bundle = _bundle(
+        {
+            "startTimeUnixNano": "1768646340000000000",
+            "timeUnixNano": "1768646400000000000",
+            "asInt": -42,
+            "attributes": [
+                {"key": "s", "value": {"stringValue": "Zürich"}},
+                {"key": "i", "value": {"intValue": -9223372036854775808}},
+                {"key": "d", "value": {"doubleValue": 1e-05}},
+                {"key": "b", "value": {"boolValue": True}},
+                {"key": "raw", "value": {"bytesValue": "AAEC"}},
+                {"key": "arr", "value": {"arrayValue": {"values": [{"stringValue": "a"}, {"intValue": 1}]}}},
+                {"key": "kv", "value": {"kvlistValue": {"values": [{"key": "k", "value": {"boolValue": False}}]}}},
+            ],
+        },
+        metric_type="sum",
+        aggregationTemporality=2,
+        isMonotonic=True,
+    )
+
+    assert decode_export_request(encode_export_request(bundle)) == bundle
+    # String spellings (OTLP/JSON int64) encode the same and decode to ints
+    spelled = json.loads(json.dumps(bundle).replace('"asInt": -42', '"asInt": "-42"'))
+    assert decode_export_request(encode_export_request(spelled)) == bundle
+
+
+def test_integer_datapoints_pass_validation_like_json(otlp_bundle):
+    """Test that protobuf asInt values flatten to numbers the row validator accepts."""
+    spec_loader = SpecLoader()
+    plan = spec_loader.get_flatten_plan()
+    validator = spec_loader.get_row_validator()
+    bundle = json.loads(json.dumps(otlp_bundle))
+    for resource_metrics in bundle["resourceMetrics"]:
+        for scope_metrics in resource_metrics["scopeMetrics"]:
+            for metric in scope_metrics["metrics"]:
+                for data_point in metric.get("gauge", metric.get("sum", {})).get("dataPoints", []):
+                    data_point["asInt"] = int(data_point.pop("asDouble", 0))
+
+    json_batch = flatten_otlp_batch([bundle], plan)
+    proto_batch = flatten_otlp_batch([decode_export_request(encode_export_request(bundle))], plan)
+
+    assert len(proto_batch) > 0
+    assert set(validator.check_columnar(json_batch)) == {None}
+    assert validator.check_columnar(proto_batch) == validator.check_columnar(json_batch)
+    assert list(proto_batch.encode()) == list(json_batch.encode())
+
+
+def test_shared_attributes_decode_to_equal_values():
+    """Test that repeated datapoint attributes decode equal on every point."""
+    attribute = {"key": "wildValue", "value": {"stringValue": "eth0"}}
+    points = [{"timeUnixNano": str(i), "asDouble": float(i), "attributes": [attribute]} for i in range(1, 4)]
+    bundle = _bundle(points[0])
+    bundle["resourceMetrics"][0]["scopeMetrics"][0]["metrics"][0]["gauge"]["dataPoints"] = points
+
+    decoded = decode_export_request(encode_export_request(bundle))
+
+    assert decoded == bundle
+
+
+def test_decoder_skips_unknown_fields(monkeypatch):
+    """Test that fields a newer OTLP may add (here on the data point) are skipped."""
+    import otlp_proto
+
+    bundle = _bundle({"timeUnixNano": "5", "asDouble": 1.5})
+    point = b"\x19" + struct.pack("<Q", 5) + b"\x21" + struct.pack("<d", 1.5)
+    # fixed32 field 15, then varint field 16 (a two-byte tag)
+    extended = point + b"\x7d\x00\x00\x00\x00" + b"\x80\x01\x01"
+    monkeypatch.setattr(otlp_proto, "_encode_data_point", lambda data_point: extended)
+
+    assert decode_export_request(encode_export_request(bundle)) == bundle
+
+
+def test_is_protobuf_sniffs_first_byte(otlp_bundle):
+    """Test that protobuf requests are told apart from JSON documents."""
+    document = json.dumps(otlp_bundle).encode("utf-8")
+    assert is_protobuf(encode_export_request(otlp_bundle))
+    assert not is_protobuf(document)
+    assert not is_protobuf(b"  {}")
+    # A leading LF is the same byte as the resource_metrics tag
+    assert not is_protobuf(b"\n" + document)
+    assert not is_protobuf(b"\r\n\t " + document)
+    assert not is_protobuf(b"")
+
+
+def test_is_protobuf_when_length_byte_looks_like_json():
+    """Test requests whose first length byte is "{" or whitespace are still protobuf."""
+    # Tag, then a length of "{", space or LF, then a message starting with "{"
+    for length in (0x7B, 0x20, 0x0A):
+        request = b"\x0a" + bytes([length]) + b"{" * length
+        assert is_protobuf(request)
+        assert is_protobuf(request + request)
+        assert not is_protobuf(request[:-1])
+
+
+@pytest.mark.parametrize("data", [
+    b"\x0a\x05\x0a",            # length runs past the end of the request
+    b"\x0a\x02\x0a\x05",        # nested length runs past its parent
+    b"\x0b",                    # unsupported wire type (start group)
+    b"\x0a\x03\x12\x01\xff",    # invalid UTF-8 in schemaUrl
+    b"\x08" + b"\xff" * 11,     # varint longer than 10 bytes
+])
+def test_malformed_payloads_raise_value_error(data):
+    """Test that truncated or malformed protobuf raises ValueError."""
+    with pytest.raises(ValueError):
+        decode_export_request(data)
@@ -0,0 +1,65 @@
+# ABOUTME: Tests for process_pool module
+# ABOUTME: Validates chunk splitting, eager forking, forked worker ordering, and worker error propagation
+
+import os
+import sys
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from process_pool import run_forked, split_evenly
+
+
+def test_split_evenly_preserves_order_and_balances_chunks():
+    """Test that chunks are contiguous, ordered, and differ in size by at most one."""
+    chunks = split_evenly(list(range(10)), 3)
+
+    assert chunks == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+
+
+def test_split_evenly_never_returns_empty_chunks():
+    """Test that asking for more parts than items yields one chunk per item."""
+    assert split_evenly([1, 2], 8) == [[1], [2]]
+    assert split_evenly([], 4) == []
+
+
+def test_run_forked_returns_results_in_chunk_order():
+    """Test that each chunk runs in a separate process and results keep chunk order."""
+    parent = os.getpid()
+
+    def work(chunk):
+        assert os.getpid() != parent
+        return ",".join(str(i * i) for i in chunk).encode("utf-8")
+
+    results = list(run_forked([[1, 2], [3], [4, 5, 6]], work))
+
+    assert results == [b"1,4", b"9", b"16,25,36"]
+
+
+def test_run_forked_forks_every_worker_before_returning(monkeypatch):
+    """Test that all processes are forked by the call itself, not when results are read."""
+    forks = []
+    fork = os.fork
+
+    def counting_fork():
+        pid = fork()
+        if pid:
+            forks.append(pid)
+        return pid
+
+    monkeypatch.setattr(os, "fork", counting_fork)
+
+    results = run_forked([[1], [2], [3]], lambda chunk: bytes(chunk))
+
+    assert len(forks) == 3
+    assert list(results) == [b"\x01", b"\x02", b"\x03"]
+
+
+def test_run_forked_raises_worker_errors_with_traceback():
+    """Test that an exception in a worker surfaces in the parent."""
+    def work(chunk):
+        raise ValueError(f"bad chunk {chunk}")
+
+    with pytest.raises(RuntimeError, match="bad chunk"):
+        list(run_forked([1], work))
@@ -0,0 +1,94 @@
+# ABOUTME: Tests for rate_control module
+# ABOUTME: Validates AIMD rate and batch-size adjustment, pacing, and the EMF metric record
+
+import sys
+from pathlib import Path
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from rate_control import AimdController, metric_record
+
+
+def test_throttling_halves_rate_and_batch_size():
+    """Test the multiplicative decrease on a throttled attempt."""
+    controller = AimdController(max_rate=1000, min_rate=10, max_batch_size=500)
+
+    controller.observe(500, 1, throttled=True, latency=0.1)
+
+    assert controller.rate == 500
+    assert controller.batch_size == 250
+    assert controller.decreases == 1
+
+
+def test_high_failure_ratio_or_latency_counts_as_congestion():
+    """Test that failure ratio and latency alone also trigger a decrease."""
+    controller = AimdController(max_rate=1000, failure_threshold=0.1, latency_target=1.0)
+
+    controller.observe(100, 20, throttled=False, latency=0.1)
+    controller.observe(100, 0, throttled=False, latency=3.0)
+
+    assert controller.decreases == 2
+    assert controller.rate == 250
+
+
+def test_successful_attempts_recover_additively_up_to_the_maximum():
+    """Test the additive increase, capped at the configured maxima."""
+    controller = AimdController(
+        max_rate=1000, rate_step=100, max_batch_size=500, min_batch_size=25, batch_step=25
+    )
+    controller.observe(500, 500, throttled=True, latency=0.1)
+
+    controller.observe(250, 0, throttled=False, latency=0.1)
+    assert controller.rate == 600
+    assert controller.batch_size == 275
+
+    for _ in range(20):
+        controller.observe(250, 0, throttled=False, latency=0.1)
+    assert controller.rate == 1000
+    assert controller.batch_size == 500
+
+
+def test_decrease_stops_at_the_floor():
+    """Test that repeated throttling never drops below min_rate and min_batch_size."""
+    controller = AimdController(max_rate=1000, min_rate=50, max_batch_size=500, min_batch_size=25)
+
+    for _ in range(20):
+        controller.observe(10, 10, throttled=True, latency=0.1)
+
+    assert controller.rate == 50
+    assert controller.batch_size == 25
+
+
+def test_acquire_paces_sends_to_the_current_rate():
+    """Test that back-to-back sends are spaced by records / rate."""
+    now = [10.0]
+    controller = AimdController(max_rate=100, clock=lambda: now[0])
+
+    assert controller.acquire(50) == 0
+    assert controller.acquire(50) == 0.5
+    assert controller.acquire(100) == 1.0
+
+    now[0] = 20.0
+    assert controller.acquire(100) == 0
+
+
+def test_acquire_refuses_slots_past_max_wait_without_reserving():
+    """Test that a slot further away than max_wait is refused and leaves pacing untouched."""
+    now = [10.0]
+    controller = AimdController(max_rate=100, clock=lambda: now[0])
+
+    assert controller.acquire(100, max_wait=5.0) == 0
+    assert controller.acquire(500, max_wait=0.5) is None
+    assert controller.acquire(100, max_wait=1.0) == 1.0
+
+
+def test_metric_record_is_embedded_metric_format():
+    """Test that the metric record declares and carries the controller state."""
+    record = metric_record("stream-a", {"rate": 123.0, "batch_size": 200})
+
+    directive = record["_aws"]["CloudWatchMetrics"][0]
+    assert [m["Name"] for m in directive["Metrics"]] == ["FirehoseSendRate", "FirehoseBatchSize"]
+    assert directive["Dimensions"] == [["DeliveryStream"]]
+    assert record["DeliveryStream"] == "stream-a"
+    assert record["FirehoseSendRate"] == 123.0
+    assert record["FirehoseBatchSize"] == 200
@@ -0,0 +1,151 @@
+# ABOUTME: Tests for resource_cache module
+# ABOUTME: Validates fingerprints, LRU eviction by entry and byte caps, stats, and row parity with uncached flattening
+
+import json
+import sys
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from flatten import compile_flatten_plan, flatten_otlp_batch
+from resource_cache import ResourceCache, resource_fingerprint
+from spec_loader import SpecLoader
+
+
+@pytest.fixture
+def plan():
+    return SpecLoader().get_flatten_plan()
+
+
+@pytest.fixture
+def otlp_bundle():
+    with open(Path(__file__).parent / "fixtures" / "otlp" / "otlp_bundle_ok.json") as f:
+        return json.load(f)
+
+
+def _attributes(host: str, **extra):
+    attributes = [{"key": "hostName", "value": {"stringValue": host}}]
+    attributes += [{"key": k, "value": v} for k, v in extra.items()]
+    return attributes
+
+
+def _build(attributes):
+    return {"resource_json": json.dumps(attributes).encode("utf-8"), "promoted_json": b""}
+
+
+def test_fingerprint_keeps_value_types():
+    """Test that equal-comparing values of different OTLP types get different fingerprints."""
+    as_bool = resource_fingerprint(_attributes("a", flag={"boolValue": True}))
+    as_double = resource_fingerprint(_attributes("a", flag={"doubleValue": 1.0}))
+
+    assert as_bool != as_double
+    assert resource_fingerprint(_attributes("a")) == resource_fingerprint(_attributes("a"))
+
+
+@pytest.mark.parametrize("first, second", [
+    ({"doubleValue": 1}, {"doubleValue": 1.0}),
+    ({"intValue": True}, {"intValue": 1}),
+    ({"boolValue": False}, {"boolValue": 0}),
+])
+def test_fingerprint_keeps_python_types(first, second):
+    """Test that equal-hashing values that render differently get different fingerprints."""
+    assert first == second
+    assert resource_fingerprint(_attributes("a", flag=first)) != resource_fingerprint(_attributes("a", flag=second))
+
+
+def test_fingerprint_is_none_for_unkeyable_attributes():
+    """Test that nested values and malformed attributes are not cached."""
+    nested = _attributes("a", tags={"arrayValue": {"values": [{"stringValue": "x"}]}})
+
+    assert resource_fingerprint(nested) is None
+    assert resource_fingerprint([{"value": {"stringValue": "x"}}]) is None
+
+
+def test_get_reuses_entries_and_counts_hits(plan):
+    """Test that a repeated attribute list returns the cached entry without rebuilding."""
+    cache = ResourceCache()
+    built = []
+
+    def build(attributes):
+        built.append(attributes)
+        return _build(attributes)
+
+    first = cache.get(_attributes("a"), plan, build)
+    second = cache.get(_attributes("a"), plan, build)
+
+    assert second is first
+    assert len(built) == 1
+    assert cache.report() == {
+        "hits": 1, "misses": 1, "evictions": 0, "entries": 1, "bytes": len(first["resource_json"]),
+    }
+
+
+def test_get_evicts_least_recently_used_entry(plan):
+    """Test that the entry cap evicts the least recently used entry."""
+    cache = ResourceCache(max_entries=2)
+    cache.get(_attributes("a"), plan, _build)
+    cache.get(_attributes("b"), plan, _build)
+    cache.get(_attributes("a"), plan, _build)
+    cache.get(_attributes("c"), plan, _build)
+
+    assert cache.evictions == 1
+    assert len(cache) == 2
+    cache.get(_attributes("a"), plan, _build)
+    assert cache.hits == 2
+    cache.get(_attributes("b"), plan, _build)
+    assert cache.misses == 4
+
+
+def test_get_enforces_byte_cap(plan):
+    """Test that the byte cap evicts old entries and never stores an oversized one."""
+    size = len(_build(_attributes("a"))["resource_json"])
+    cache = ResourceCache(max_bytes=2 * size)
+    for host in ("a", "b", "c"):
+        cache.get(_attributes(host), plan, _build)
+
+    assert len(cache) == 2
+    assert cache.bytes == 2 * size
+    assert cache.evictions == 1
+
+    cache.get(_attributes("a" * 10 * size), plan, _build)
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+
+def test_get_clears_entries_for_a_new_plan(plan):
+    """Test that entries built with one plan are never returned for another."""
+    cache = ResourceCache()
+    cache.get(_attributes("a"), plan, _build)
+    other_plan = compile_flatten_plan(SpecLoader().get_row_event_schema())
+
+    cache.get(_attributes("a"), other_plan, _build)
+
+    assert cache.hits == 0
+    assert len(cache) == 1
+
+
+def test_reset_stats_and_merge(plan):
+    """Test that counters reset per invocation and merge worker reports."""
+    cache = ResourceCache()
+    cache.get(_attributes("a"), plan, _build)
+    cache.reset_stats()
+    cache.merge({"hits": 3, "misses": 1, "evictions": 2})
+
+    report = cache.report()
+    assert (report["hits"], report["misses"], report["evictions"]) == (3, 1, 2)
+    assert report["entries"] == 1
+
+
+def test_cached_batches_encode_identical_rows(otlp_bundle, plan):
+    """Test that flattening with a warm cache produces the same rows as without one."""
+    cache = ResourceCache()
+    expected = list(flatten_otlp_batch([otlp_bundle], plan).encode())
+
+    cold = list(flatten_otlp_batch([otlp_bundle], plan, cache).encode())
+    warm_batch = flatten_otlp_batch([otlp_bundle, otlp_bundle], plan, cache)
+
+    assert cold == expected
+    assert list(warm_batch.encode()) == expected * 2
+    assert warm_batch.rows() == flatten_otlp_batch([otlp_bundle] * 2, plan).rows()
+    assert cache.hits == 2 * len(otlp_bundle["resourceMetrics"])
@@ -0,0 +1,127 @@
+# ABOUTME: Tests for retry module
+# ABOUTME: Validates decorrelated jitter, throttling classification, retry budget, and deadlines
+
+import random
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from retry import RetryScheduler, is_throttling
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_is_throttling_separates_throttling_codes():
+    """Test that only throttling codes are classified as throttling."""
+    assert is_throttling(["InternalFailure", "ServiceUnavailableException"])
+    assert is_throttling(["ThrottlingException"])
+    assert not is_throttling(["InternalFailure"])
+    assert not is_throttling([])
+
+
+def test_throttled_delays_use_decorrelated_jitter():
+    """Test that throttled delays stay within [base, 3 * previous] and the cap."""
+    scheduler = RetryScheduler(base_delay=0.1, max_delay=2.0, rng=random.Random(7))
+
+    delay = 0.0
+    for _ in range(50):
+        previous = delay
+        delay = scheduler.next_delay(previous, throttled=True)
+        assert 0.1 <= delay <= min(2.0, max(0.1, previous * 3))
+
+    assert scheduler.throttled_retries == 50
+
+
+def test_throttled_delays_are_spread_across_callers():
+    """Test that concurrent invocations do not retry in lockstep."""
+    delays = {
+        RetryScheduler(base_delay=0.1, rng=random.Random(seed)).next_delay(0.4, throttled=True)
+        for seed in range(10)
+    }
+
+    assert len(delays) == 10
+
+
+def test_non_throttled_delays_do_not_grow():
+    """Test that other errors are retried after a short jittered base delay."""
+    scheduler = RetryScheduler(base_delay=0.1, max_delay=5.0, rng=random.Random(1))
+
+    delay = 0.0
+    for _ in range(20):
+        delay = scheduler.next_delay(delay, throttled=False)
+        assert 0.05 <= delay <= 0.1
+
+    assert scheduler.throttled_retries == 0
+
+
+def test_budget_is_shared_across_batches():
+    """Test that retries stop once the invocation budget is spent."""
+    scheduler = RetryScheduler(budget=3)
+
+    granted = [scheduler.next_delay(0.0, throttled=True) for _ in range(5)]
+
+    assert [d is not None for d in granted] == [True, True, True, False, False]
+    assert scheduler.report()["retries"] == 3
+    assert scheduler.report()["budget_exhausted"]
+
+
+def test_no_retry_ends_past_the_deadline():
+    """Test that a retry whose delay would overrun the deadline is refused."""
+    clock = FakeClock()
+    scheduler = RetryScheduler(base_delay=1.0, max_delay=1.0, deadline=0.5, clock=clock)
+
+    assert scheduler.next_delay(0.0, throttled=True) is None
+    assert scheduler.report()["deadline_reached"]
+    assert not scheduler.expired()
+
+    clock.now = 0.5
+    assert scheduler.expired()
+
+
+def test_remaining_counts_down_to_the_deadline():
+    """Test that remaining() is the time left before the deadline, never negative."""
+    clock = FakeClock()
+    scheduler = RetryScheduler(deadline=2.0, clock=clock)
+
+    assert scheduler.remaining() == 2.0
+    clock.now = 3.0
+    assert scheduler.remaining() == 0.0
+    assert RetryScheduler().remaining() is None
+
+
+def test_mark_deadline_is_reported():
+    """Test that a caller stopping short of the deadline records it in the report."""
+    scheduler = RetryScheduler(deadline=2.0, clock=FakeClock())
+
+    assert not scheduler.report()["deadline_reached"]
+    scheduler.mark_deadline()
+    assert scheduler.report()["deadline_reached"]
+    assert not scheduler.expired()
+
+
+def test_from_context_reserves_time_before_the_timeout():
+    """Test that the deadline is the remaining Lambda time minus the reserve."""
+    context = Mock()
+    context.get_remaining_time_in_millis.return_value = 30000
+
+    scheduler = RetryScheduler.from_context(context, reserve_ms=5000, clock=FakeClock(100.0))
+
+    assert scheduler.deadline == 125.0
+
+
+def test_from_context_without_context_has_no_deadline():
+    """Test that local runs without a Lambda context never expire."""
+    scheduler = RetryScheduler.from_context(None)
+
+    assert scheduler.deadline is None
+    assert not scheduler.expired()
@@ -4,11 +4,14 @@
 import json
 import sys
 from pathlib import Path
+import boto3
 import pytest
+from moto import mock_aws
 
 # Add lambda directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
-from spec_loader import SpecLoader
+from flatten import flatten_otlp_batch
+from spec_loader import RemoteSpec, RowValidator, SpecLoader
 
 
 @pytest.fixture
@@ -133,3 +136,208 @@ def test_row_event_fixture_exists(fixtures_path):
     assert "metric" in row_event
     assert "value" in row_event
     assert "ts" in row_event
+
+
+def test_spec_loader_compiles_flatten_plan_once(spec_loader):
+    """Test that the flatten plan is compiled from the schema and cached."""
+    plan = spec_loader.get_flatten_plan()
+
+    assert plan is spec_loader.get_flatten_plan()
+    assert ("deviceId", "hostId") in plan.resource_promotions
+    assert plan.field_order[:2] == ("metric", "type")
+
+
+@pytest.fixture
+def artifact_path(tmp_path):
+    """Fixture providing a spec artifact built from the Markdown spec."""
+    path = tmp_path / "spec_artifact.json"
+    path.write_text(json.dumps(SpecLoader(artifact_path="").build_artifact()))
+    return path
+
+
+def test_spec_loader_prefers_prebuilt_artifact(spec_loader, artifact_path, monkeypatch):
+    """Test that the artifact is loaded without scanning Markdown or parsing YAML."""
+    loader = SpecLoader(artifact_path=artifact_path)
+    monkeypatch.setattr(loader, "extract_yaml_blocks", lambda: pytest.fail("parsed Markdown"))
+
+    assert loader.get_row_event_schema() == SpecLoader(artifact_path="").get_row_event_schema()
+    assert loader.get_fixtures() == SpecLoader(artifact_path="").get_fixtures()
+
+
+def test_spec_loader_ignores_stale_artifact(artifact_path, tmp_path):
+    """Test that an artifact built from another spec version falls back to the Markdown."""
+    artifact = json.loads(artifact_path.read_text())
+    artifact["spec_sha256"] = "0" * 64
+    artifact["schema"] = {"schema": {"name": "stale"}}
+    artifact_path.write_text(json.dumps(artifact))
+
+    loader = SpecLoader(artifact_path=artifact_path)
+
+    assert loader.load_artifact() is None
+    assert loader.get_row_event_schema()["schema"]["name"] == "lm.kafka.row_event"
+
+
+def test_spec_loader_uses_artifact_without_spec_file(artifact_path, tmp_path):
+    """Test that the artifact alone is enough when the Markdown spec is not shipped."""
+    loader = SpecLoader(artifact_path=artifact_path)
+    loader.spec_path = tmp_path / "missing.md"
+
+    assert loader.get_row_event_schema()["schema"]["name"] == "lm.kafka.row_event"
+
+
+@pytest.fixture
+def mixed_bundle(fixtures_path):
+    """Fixture providing a bundle whose second resource lacks orgId and hostId."""
+    with open(fixtures_path / "otlp_bundle_ok.json") as f:
+        bundle = json.load(f)
+    stripped = json.loads(json.dumps(bundle["resourceMetrics"][0]))
+    stripped["resource"]["attributes"] = [
+        attr for attr in stripped["resource"]["attributes"] if attr["key"] not in ("orgId", "hostId")
+    ]
+    bundle["resourceMetrics"].append(stripped)
+    return bundle
+
+
+def test_row_validator_reports_first_failed_check(spec_loader):
+    """Test that required fields are checked before types, in schema order."""
+    validator = spec_loader.get_row_validator()
+    row = {
+        "orgId": "acme", "deviceId": "i-abc", "datasource": "CPU", "metric": "cpu",
+        "type": "gauge", "ts": "2026-01-17T10:40:00.000Z", "tsUnixMs": 1768646400000, "value": 1.5,
+    }
+
+    assert validator.check(row) is None
+    assert validator.check(dict(row, value="high")) == "type:value"
+    assert validator.check({k: v for k, v in row.items() if k != "orgId"}) == "missing:orgId"
+    assert validator.check_batch([row, {}]) == [None, "missing:orgId"]
+
+
+def test_row_validator_columnar_matches_materialized_rows(spec_loader, mixed_bundle):
+    """Test that columnar checks give the same codes as checking materialized rows."""
+    batch = flatten_otlp_batch([mixed_bundle], spec_loader.get_flatten_plan())
+    strict = RowValidator(
+        ["orgId", "unit", "scope"], dict(spec_loader.get_field_types(), metric="int")
+    )
+
+    for validator in (spec_loader.get_row_validator(), strict):
+        assert validator.check_columnar(batch) == validator.check_batch(batch.rows())
+    assert spec_loader.get_row_validator().check_columnar(batch) == [None, "missing:orgId"]
+    assert strict.check_columnar(batch)[0] == "type:metric"
+
+
+def _remote_artifact(promotions):
+    """Build a spec artifact whose flatten section promotes the given resource attributes."""
+    artifact = SpecLoader(artifact_path="").build_artifact()
+    artifact["schema"] = dict(artifact["schema"], flatten={"resource_promotions": promotions})
+    return json.dumps(artifact)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def aws():
+    """Fixture providing moto S3 and SSM clients with a spec bucket."""
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="spec-config")
+        yield s3, boto3.client("ssm", region_name="us-east-1")
+
+
+def test_remote_spec_reloads_s3_spec_only_when_etag_changes(aws):
+    """Test that the S3 spec is re-checked per TTL and recompiled only when it changed."""
+    s3, _ = aws
+    s3.put_object(Bucket="spec-config", Key="spec.json", Body=_remote_artifact({"orgId": "orgId"}))
+    clock = _Clock()
+    fallback = SpecLoader()
+    remote = RemoteSpec("s3://spec-config/spec.json", fallback, ttl_seconds=60, s3_client=s3, clock=clock)
+
+    first = remote.current()
+    assert first is not fallback
+    assert first.get_flatten_plan().resource_promotions == (("orgId", "orgId"),)
+
+    s3.put_object(Bucket="spec-config", Key="spec.json", Body=_remote_artifact({"region": "region"}))
+    clock.now = 30
+    assert remote.current() is first
+
+    clock.now = 60
+    second = remote.current()
+    assert second.get_flatten_plan().resource_promotions == (("region", "region"),)
+    # The loader handed out before the swap still holds the old plan
+    assert first.get_flatten_plan().resource_promotions == (("orgId", "orgId"),)
+
+    clock.now = 120
+    assert remote.current() is second
+    assert remote.report()["checks"] == 3
+    assert remote.report()["reloads"] == 2
+
+
+def test_remote_spec_reads_ssm_parameter_versions(aws):
+    """Test that an SSM parameter spec is reloaded when its version changes."""
+    _, ssm = aws
+    ssm.put_parameter(Name="/lmdp/spec", Value=_remote_artifact({"orgId": "orgId"}), Type="String")
+    clock = _Clock()
+    remote = RemoteSpec("ssm:/lmdp/spec", SpecLoader(), ttl_seconds=0, ssm_client=ssm, clock=clock)
+
+    assert remote.current().get_flatten_plan().resource_promotions == (("orgId", "orgId"),)
+    assert remote.version == "1"
+    assert remote.refresh() is False
+
+    ssm.put_parameter(
+        Name="/lmdp/spec", Value=_remote_artifact({"region": "region"}), Type="String", Overwrite=True
+    )
+    assert remote.refresh() is True
+    assert remote.version == "2"
+    assert remote.current().get_flatten_plan().resource_promotions == (("region", "region"),)
+
+
+def test_remote_spec_accepts_markdown_spec(aws, spec_loader):
+    """Test that the Markdown spec itself can be published as the remote spec."""
+    s3, _ = aws
+    s3.put_object(Bucket="spec-config", Key="spec.md", Body=spec_loader.load_spec().encode("utf-8"))
+    remote = RemoteSpec("s3://spec-config/spec.md", SpecLoader(artifact_path=""), s3_client=s3)
+
+    assert remote.current().get_row_event_schema() == spec_loader.get_row_event_schema()
+
+
+def test_remote_spec_keeps_current_spec_on_errors(aws):
+    """Test that a missing object or an uncompilable spec never replaces the current one."""
+    s3, _ = aws
+    fallback = SpecLoader()
+    remote = RemoteSpec("s3://spec-config/spec.json", fallback, ttl_seconds=0, s3_client=s3)
+
+    assert remote.current() is fallback
+
+    s3.put_object(Bucket="spec-config", Key="spec.json", Body=_remote_artifact({"metric": "hostName"}))
+    assert remote.current() is fallback
+    assert remote.report()["errors"] == 2
+    assert remote.version is None
+
+
+@pytest.mark.parametrize("flatten", [["not", "a", "mapping"], {"resource_promotions": ["orgId"]}])
+def test_remote_spec_keeps_current_spec_on_malformed_flatten_section(aws, flatten):
+    """Test that a flatten section failing to compile in any way keeps the last good spec."""
+    s3, _ = aws
+    s3.put_object(Bucket="spec-config", Key="spec.json", Body=_remote_artifact({"orgId": "orgId"}))
+    remote = RemoteSpec("s3://spec-config/spec.json", SpecLoader(), ttl_seconds=0, s3_client=s3)
+    good = remote.current()
+
+    artifact = json.loads(_remote_artifact({"orgId": "orgId"}))
+    artifact["schema"]["flatten"] = flatten
+    s3.put_object(Bucket="spec-config", Key="spec.json", Body=json.dumps(artifact))
+
+    assert remote.current() is good
+    assert remote.report()["errors"] == 1
+
+
+def test_remote_spec_rejects_unknown_sources():
+    """Test that only s3:// and ssm: spec sources are accepted."""
+    with pytest.raises(ValueError, match="Unsupported spec source"):
+        RemoteSpec("https://example.com/spec.json", SpecLoader())
+    with pytest.raises(ValueError, match="s3://<bucket>/<key>"):
+        RemoteSpec("s3://bucket-only", SpecLoader())
@@ -0,0 +1,90 @@
+# ABOUTME: Tests for spill module
+# ABOUTME: Validates per-partition gzip NDJSON chunks, size rotation, key layout, and failed PUTs
+
+import gzip
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from spill import S3Spill
+
+# 2026-01-17T10:40:00Z
+NOW = 1768646400.0
+
+
+@pytest.fixture
+def s3():
+    """Fixture providing a moto S3 client with a spill bucket."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="errors")
+        yield client
+
+
+def _objects(s3):
+    keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket="errors").get("Contents", [])]
+    return {
+        key: gzip.decompress(s3.get_object(Bucket="errors", Key=key)["Body"].read())
+        for key in sorted(keys)
+    }
+
+
+def test_spill_writes_one_object_per_partition_on_flush(s3):
+    """Test that rows are grouped per partition into one gzip NDJSON object each."""
+    spill = S3Spill("errors", s3, clock=lambda: NOW)
+
+    spill.add("topic-0:5", b'{"a": 1}\n')
+    spill.add("topic-1:9", b'{"b": 2}\n')
+    spill.add("topic-0:7", b'{"a": 3}\n')
+    assert _objects(s3) == {}
+
+    spill.flush()
+
+    objects = _objects(s3)
+    assert len(objects) == 2
+    (key0, body0), (key1, body1) = objects.items()
+    assert key0.startswith("spill/topic-0/2026/01/17/10/5-7-1768646400000-")
+    assert key0.endswith(".ndjson.gz")
+    assert body0 == b'{"a": 1}\n{"a": 3}\n'
+    assert key1.startswith("spill/topic-1/2026/01/17/10/9-9-")
+    assert body1 == b'{"b": 2}\n'
+    assert spill.report() == {"bucket": "errors", "rows": 3, "objects": 2, "unsaved_records": 0}
+
+
+def test_spill_rotates_chunks_by_size(s3):
+    """Test that a partition's chunk is written as soon as it reaches max_chunk_bytes."""
+    spill = S3Spill("errors", s3, max_chunk_bytes=20)
+    row = b'{"value": 1}\n'
+
+    for offset in range(5):
+        spill.add(f"topic-0:{offset}", row)
+    assert len(_objects(s3)) == 2
+
+    spill.flush()
+
+    bodies = list(_objects(s3).values())
+    assert len(bodies) == 3
+    assert b"".join(bodies).count(b"\n") == 5
+
+
+def test_spill_reports_records_whose_rows_were_not_saved():
+    """Test that a failed PUT marks its records unsaved instead of raising."""
+    s3_client = MagicMock()
+    s3_client.put_object.side_effect = ClientError(
+        {"Error": {"Code": "AccessDenied"}}, "PutObject"
+    )
+    spill = S3Spill("errors", s3_client)
+
+    spill.add("topic-0:1", b"{}\n")
+    spill.add("topic-0:2", b"{}\n")
+    spill.flush()
+
+    assert spill.unsaved == {"topic-0:1", "topic-0:2"}
+    assert spill.report()["objects"] == 0
@@ -0,0 +1,87 @@
+# ABOUTME: Tests for stages module
+# ABOUTME: Validates bounded-queue background stages, backpressure, errors, and busy/idle reporting
+
+import sys
+import time
+from pathlib import Path
+import pytest
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from stages import BackgroundStage
+
+
+def test_background_stage_yields_upstream_items_in_order():
+    """Test that items pass through the stage unchanged and in order."""
+    stage = BackgroundStage(iter(range(100)), depth=2, producer_name="p", consumer_name="c")
+
+    assert list(stage) == list(range(100))
+    assert stage.producer_stats.items == 100
+    assert stage.consumer_stats.items == 100
+
+
+def test_background_stage_applies_backpressure():
+    """Test that the producer never runs more than the queue depth ahead."""
+    produced = []
+
+    def upstream():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    stage = BackgroundStage(upstream(), depth=2, producer_name="p", consumer_name="c")
+
+    lead = []
+    for consumed, _ in enumerate(stage, start=1):
+        time.sleep(0.005)
+        # queued items + the one the producer is holding
+        lead.append(len(produced) - consumed)
+
+    assert max(lead) <= 3
+    assert stage.report()["queue_peak"] <= 2
+
+
+def test_background_stage_reraises_upstream_errors():
+    """Test that an exception raised upstream surfaces in the consumer."""
+    def upstream():
+        yield 1
+        raise ValueError("bad record")
+
+    stage = BackgroundStage(upstream(), depth=2, producer_name="p", consumer_name="c")
+
+    assert next(stage) == 1
+    with pytest.raises(ValueError, match="bad record"):
+        next(stage)
+
+
+def test_background_stage_close_stops_a_blocked_producer():
+    """Test that closing early releases a producer blocked on a full queue."""
+    stage = BackgroundStage(iter(range(1000)), depth=1, producer_name="p", consumer_name="c")
+    next(stage)
+
+    stage.close()
+
+    assert not stage._thread.is_alive()
+
+
+def test_background_stage_reports_layout_and_busy_idle_time():
+    """Test that the report names both stages with busy/idle milliseconds."""
+    def upstream():
+        for i in range(5):
+            time.sleep(0.01)
+            yield i
+
+    stage = BackgroundStage(
+        upstream(), depth=3, producer_name="encode", consumer_name="send", consumer_threads=4
+    )
+    list(stage)
+
+    report = stage.report()
+    assert report["queue_depth"] == 3
+    assert [s["name"] for s in report["stages"]] == ["encode", "send"]
+    assert report["stages"][1]["threads"] == 4
+    producer = report["stages"][0]
+    assert producer["items"] == 5
+    assert producer["busy_ms"] >= 40
+    # The consumer mostly waits on the slow producer
+    assert report["stages"][1]["idle_ms"] >= 30
@@ -0,0 +1,67 @@
+# ABOUTME: Tests for timestamps module
+# ABOUTME: Validates exact nanosecond conversion and RFC3339 output against the datetime formatting it replaces
+
+import random
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Add lambda directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent.parent / "lambda"))
+from timestamps import Rfc3339Formatter, nanos_to_ms
+
+
+def _reference(ts_unix_ms):
+    """The per-datapoint datetime formatting the flattener used before."""
+    return datetime.fromtimestamp(ts_unix_ms / 1000, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def test_format_matches_datetime_formatting():
+    """Property test: random timestamps from 1900 to 2200 format as datetime did."""
+    rng = random.Random(25)
+    formatter = Rfc3339Formatter(max_seconds=64)
+    samples = [rng.randrange(-2_208_988_800_000, 7_258_118_400_000) for _ in range(20000)]
+    # Clustered collection timestamps, whole seconds and millisecond edges
+    base = 1768646400000
+    samples += [base + offset for offset in (0, 1, 10, 100, 999, 1000, 59_999, 60_000, -1, -999)]
+    samples += [0, -1, -1000, -1001, 1, 999]
+
+    for ts_unix_ms in samples:
+        assert formatter.format(ts_unix_ms) == _reference(ts_unix_ms), ts_unix_ms
+
+    assert len(formatter) <= 64
+
+
+def test_format_examples():
+    """Test whole seconds have no fraction and others carry six digits."""
+    formatter = Rfc3339Formatter()
+    assert formatter.format(1768646400000) == "2026-01-17T10:40:00Z"
+    assert formatter.format(1768646400123) == "2026-01-17T10:40:00.123000Z"
+    assert formatter.format(1768646400007) == "2026-01-17T10:40:00.007000Z"
+
+
+def test_format_many_shares_strings_per_timestamp():
+    """Test the batch API keeps order and shares one string per distinct timestamp."""
+    formatter = Rfc3339Formatter()
+    column = [1768646400000, 1768646401500, 1768646400000, 1768646401500]
+
+    formatted = formatter.format_many(column)
+
+    assert formatted == [formatter.format(ts) for ts in column]
+    assert formatted[0] is formatted[2]
+    assert formatted[1] is formatted[3]
+    assert formatter.format_many([]) == []
+
+
+def test_nanos_to_ms_is_exact():
+    """Test nanosecond conversion does not round through a float."""
+    # int(1768646400999999999 / 1_000_000) rounds up to the next second
+    assert nanos_to_ms("1768646400999999999") == 1768646400999
+    assert nanos_to_ms(1768646400123456789) == 1768646400123
+    assert nanos_to_ms("9223372036854775807") == 9223372036854
+    assert nanos_to_ms("-1500000") == -1
+
+    rng = random.Random(3)
+    for _ in range(1000):
+        nanos = rng.randrange(0, 2 ** 63)
+        assert nanos_to_ms(str(nanos)) * 1_000_000 <= nanos < (nanos_to_ms(nanos) + 1) * 1_000_000
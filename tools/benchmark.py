@@ -0,0 +1,694 @@
+# Description: Local performance benchmarks for the fan-out Lambda hot paths
+# Description: Generates synthetic LMDP-shaped OTLP bundles and reports throughput per code path
+
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).parent.parent / "lambda"
+# Recorded init-phase import profile that `importtime` runs are compared against
+IMPORTTIME_BASELINE = Path(__file__).parent / "importtime_baseline.json"
+sys.path.insert(0, str(LAMBDA_DIR))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from flatten import flatten_otlp, flatten_otlp_batch  # noqa: E402
+
+
+def _attr(key: str, value) -> dict:
+    """Build an OTLP attribute object for a Python value."""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": value}}
+
+
+def make_bundle(
+    resources: int = 10,
+    datapoints_per_resource: int = 200,
+    resource_properties: int = 30,
+    seed: int = 0,
+) -> dict:
+    """
+    Build a synthetic LMDP-shaped OTLP bundle.
+
+    Args:
+        resources: Number of resourceMetrics (devices) in the bundle
+        datapoints_per_resource: Datapoints emitted per device
+        resource_properties: Extra (non-promoted) resource attributes per device
+        seed: Offset mixed into ids and values so bundles differ
+
+    Returns:
+        OTLP metrics bundle dictionary
+    """
+    base_nanos = 1768646400000000000 + seed * 60_000_000_000
+    instances = 10
+    metrics_per_scope = max(1, datapoints_per_resource // instances)
+
+    resource_metrics = []
+    for r in range(resources):
+        attributes = [
+            _attr("hostId", f"i-{seed:04d}{r:04d}"),
+            _attr("hostName", f"acme-prod-web-{r:03d}"),
+            _attr("orgId", "acme"),
+        ]
+        attributes.extend(
+            _attr(f"system.property{p}", f"value-{p}-{r}") for p in range(resource_properties)
+        )
+
+        metrics = []
+        for m in range(metrics_per_scope):
+            datapoints = [
+                {
+                    "timeUnixNano": str(base_nanos + (i % 3) * 1_000_000_000),
+                    "asDouble": (r * 31 + m * 7 + i) / 10.0,
+                    "attributes": [
+                        _attr("dataSourceInstanceName", f"instance_{i}"),
+                        _attr("wildAlias", f"Instance {i}"),
+                        _attr("datapointId", m * 100 + i),
+                    ],
+                }
+                for i in range(instances)
+            ]
+            metrics.append({
+                "name": f"aws.ec2.metric_{m}",
+                "unit": "percent",
+                "gauge": {"dataPoints": datapoints},
+            })
+
+        resource_metrics.append({
+            "resource": {"attributes": attributes},
+            "scopeMetrics": [{
+                "scope": {"name": "aws.ec2", "version": "1.0", "epoch": "1768646400"},
+                "metrics": metrics,
+            }],
+        })
+
+    return {"resourceMetrics": resource_metrics}
+
+
+def make_bundles(count: int, **kwargs) -> list:
+    """Build count synthetic bundles with distinct seeds."""
+    return [make_bundle(seed=i, **kwargs) for i in range(count)]
+
+
+def _best_of(fn, repeat: int) -> float:
+    """Return the fastest wall-clock time of repeat runs of fn."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_flatten(args) -> None:
+    """Compare the per-row flatten path with the columnar batch engine."""
+    bundles = make_bundles(
+        args.bundles,
+        resources=args.resources,
+        datapoints_per_resource=args.datapoints,
+    )
+    spec = {}
+
+    def per_row_flatten():
+        all_rows = []
+        for bundle in bundles:
+            all_rows.extend(flatten_otlp(bundle, spec))
+        return all_rows
+
+    def per_row_encode():
+        return [row.to_json() for row in per_row_flatten()]
+
+    def columnar_flatten():
+        return flatten_otlp_batch(bundles, spec)
+
+    def columnar_encode():
+        return list(flatten_otlp_batch(bundles, spec).encode())
+
+    row_count = len(per_row_flatten())
+    print(f"bundles={args.bundles} rows={row_count} repeat={args.repeat}")
+    for name, fn in [
+        ("per-row flatten", per_row_flatten),
+        ("columnar flatten", columnar_flatten),
+        ("per-row flatten+encode", per_row_encode),
+        ("columnar flatten+encode", columnar_encode),
+    ]:
+        elapsed = _best_of(fn, args.repeat)
+        print(f"  {name:<28} {elapsed * 1000:9.1f} ms  {row_count / elapsed:12,.0f} rows/s")
+
+
+def bench_decode(args) -> None:
+    """Compare the str-based decode with bytes parsing, for plain, gzip and protobuf values."""
+    import gzip
+    import tracemalloc
+
+    from kafka_decode import decode_kafka_value
+    from otlp_proto import encode_export_request
+
+    bundles = make_bundles(
+        args.bundles, resources=args.resources, datapoints_per_resource=args.datapoints
+    )
+    documents = [json.dumps(bundle).encode("utf-8") for bundle in bundles]
+    encodings = {
+        "plain": [base64.b64encode(doc).decode("ascii") for doc in documents],
+        "gzip": [base64.b64encode(gzip.compress(doc)).decode("ascii") for doc in documents],
+        "proto": [base64.b64encode(encode_export_request(bundle)).decode("ascii") for bundle in bundles],
+    }
+
+    def str_decode(values):
+        # b64decode -> bytes.decode -> json.loads(str): three copies of each payload
+        return [json.loads(base64.b64decode(value).decode("utf-8")) for value in values]
+
+    def bytes_decode(values):
+        return [decode_kafka_value(value) for value in values]
+
+    def peak_bytes(fn, values) -> int:
+        # Peak over a single record, as the handler holds one payload at a time
+        tracemalloc.start()
+        fn(values[:1])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    total_json = sum(len(doc) for doc in documents)
+    print(f"records={args.bundles} json={total_json / 1e6:.1f} MB repeat={args.repeat}")
+    for encoding, values in encodings.items():
+        for name, fn in [("str decode", str_decode), ("bytes decode", bytes_decode)]:
+            if encoding != "plain" and fn is str_decode:
+                continue
+            elapsed = _best_of(lambda: fn(values), args.repeat)
+            print(
+                f"  {encoding:<6} {name:<14} {elapsed * 1000:8.1f} ms "
+                f"{total_json / elapsed / 1e6:8.1f} MB/s  peak/record {peak_bytes(fn, values) / 1e6:6.2f} MB"
+            )
+
+
+def bench_codec(args) -> None:
+    """Compare the JSON codec backends on decode and on decode+flatten+encode."""
+    from codec import get_codec
+    from kafka_decode import decode_kafka_value
+    from spec_loader import SpecLoader
+
+    import flatten
+
+    plan = SpecLoader().get_flatten_plan()
+    with open(Path(__file__).parent.parent / "tests" / "fixtures" / "otlp" / "otlp_bundle_ok.json") as f:
+        fixture = json.load(f)
+    shapes = {
+        "fixture": [fixture] * args.bundles * 100,
+        "synthetic": make_bundles(
+            args.bundles, resources=args.resources, datapoints_per_resource=args.datapoints
+        ),
+    }
+    backends = [get_codec("stdlib")]
+    if get_codec("auto").name != "stdlib":
+        backends.append(get_codec("auto"))
+
+    print(f"repeat={args.repeat} backends={[backend.name for backend in backends]}")
+    for shape, bundles in shapes.items():
+        values = [
+            base64.b64encode(json.dumps(bundle).encode("utf-8")).decode("ascii") for bundle in bundles
+        ]
+        total_json = sum(len(base64.b64decode(value)) for value in values)
+        print(f"  {shape}: records={len(values)} json={total_json / 1e6:.1f} MB")
+        for backend in backends:
+            flatten.CODEC = backend
+
+            def decode():
+                return [decode_kafka_value(value, codec=backend) for value in values]
+
+            def decode_encode():
+                return list(flatten_otlp_batch(decode(), plan).encode())
+
+            decode_s = _best_of(decode, args.repeat)
+            full_s = _best_of(decode_encode, args.repeat)
+            print(
+                f"    {backend.name:<8} decode {decode_s * 1000:8.1f} ms ({total_json / decode_s / 1e6:6.1f} MB/s)"
+                f"   decode+flatten+encode {full_s * 1000:8.1f} ms"
+            )
+        flatten.CODEC = backends[0]
+
+
+def bench_resources(args) -> None:
+    """Compare flatten+encode with and without a warm resource fragment cache."""
+    from resource_cache import ResourceCache
+    from spec_loader import SpecLoader
+
+    plan = SpecLoader().get_flatten_plan()
+    # The same devices every collection interval, one bundle per Kafka record
+    bundle = make_bundle(
+        resources=args.resources,
+        datapoints_per_resource=args.datapoints,
+        resource_properties=args.properties,
+    )
+    bundles = [bundle] * args.bundles
+    cache = ResourceCache()
+
+    def uncached():
+        return [list(flatten_otlp_batch([b], plan).encode()) for b in bundles]
+
+    def cached():
+        return [list(flatten_otlp_batch([b], plan, cache).encode()) for b in bundles]
+
+    assert cached() == uncached()
+    rows = sum(len(batch) for batch in uncached())
+    print(
+        f"bundles={args.bundles} resources={args.resources} properties={args.properties} "
+        f"rows={rows} repeat={args.repeat}"
+    )
+    for name, fn in [("uncached", uncached), ("warm cache", cached)]:
+        elapsed = _best_of(fn, args.repeat)
+        print(f"  {name:<12} {elapsed * 1000:8.1f} ms  {rows / elapsed:12,.0f} rows/s")
+    print(f"  cache: {cache.report()}")
+
+
+def bench_shapes(args) -> None:
+    """Compare columnar flatten with and without shape-specialized attribute extractors."""
+    from flatten import compile_flatten_plan
+    from spec_loader import SpecLoader
+
+    schema = SpecLoader().get_row_event_schema()
+    generic_plan = compile_flatten_plan(schema)
+    generic_plan.attribute_shapes.max_shapes = 0
+    shaped_plan = compile_flatten_plan(schema)
+    bundles = make_bundles(args.bundles, resources=args.resources, datapoints_per_resource=args.datapoints)
+
+    def generic():
+        return flatten_otlp_batch(bundles, generic_plan)
+
+    def shaped():
+        return flatten_otlp_batch(bundles, shaped_plan)
+
+    assert shaped().attributes == generic().attributes
+    assert shaped().instance == generic().instance
+    rows = len(generic())
+    print(f"bundles={args.bundles} rows={rows} repeat={args.repeat}")
+    for name, fn in [("generic", generic), ("shaped", shaped)]:
+        elapsed = _best_of(fn, args.repeat)
+        print(f"  {name:<12} {elapsed * 1000:8.1f} ms  {rows / elapsed:12,.0f} rows/s")
+    shaped_plan.attribute_shapes.reset_stats()
+    shaped()
+    print(f"  shapes: {shaped_plan.attribute_shapes.report()}")
+
+
+def bench_timestamps(args) -> None:
+    """Compare per-datapoint datetime formatting with the per-second RFC3339 cache."""
+    from datetime import datetime, timezone
+    from timestamps import Rfc3339Formatter
+
+    # Datapoints cluster on a few collection timestamps, some with milliseconds
+    base = 1768646400000
+    column = [base + (i % args.distinct) * 60_000 + (i % 7) * 125 for i in range(args.rows)]
+
+    def per_datapoint():
+        return [
+            datetime.fromtimestamp(ts / 1000, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+            for ts in column
+        ]
+
+    def cached():
+        formatter = Rfc3339Formatter()
+        return [formatter.format(ts) for ts in column]
+
+    def batch():
+        return Rfc3339Formatter().format_many(column)
+
+    assert cached() == per_datapoint() == batch()
+    print(f"rows={args.rows} distinct={len(set(column))} repeat={args.repeat}")
+    for name, fn in [("datetime", per_datapoint), ("cached", cached), ("format_many", batch)]:
+        elapsed = _best_of(fn, args.repeat)
+        print(f"  {name:<12} {elapsed * 1000:8.1f} ms  {elapsed / args.rows * 1e9:8.0f} ns/row")
+
+
+def bench_memory(args) -> None:
+    """Trace decode+flatten+encode memory on one large bundle, with and without interning."""
+    import gc
+    import tracemalloc
+
+    from interning import StringInterner
+    from kafka_decode import decode_kafka_value
+    from spec_loader import SpecLoader
+
+    plan = SpecLoader().get_flatten_plan()
+    bundle = make_bundle(resources=args.resources, datapoints_per_resource=args.datapoints)
+    value = base64.b64encode(json.dumps(bundle).encode("utf-8")).decode("ascii")
+    del bundle
+
+    def run(free_bundle: bool, interner):
+        # Returns (peak, bytes the batch keeps once the bundle is gone, row count)
+        bundles = [decode_kafka_value(value)]
+        batch = flatten_otlp_batch(bundles, plan, interner=interner)
+        if free_bundle:
+            bundles.clear()
+        retained = tracemalloc.get_traced_memory()[0]
+        rows = list(batch.encode())
+        return tracemalloc.get_traced_memory()[1], retained, len(rows)
+
+    print(f"resources={args.resources} datapoints={args.datapoints} repeat={args.repeat}")
+    for name, free_bundle, make_interner in [
+        ("bundle held", False, lambda: None),
+        ("bundle freed", True, lambda: None),
+        ("freed + interned", True, StringInterner),
+    ]:
+        gc.collect()
+        tracemalloc.start()
+        peak, retained, rows = run(free_bundle, make_interner())
+        tracemalloc.stop()
+        elapsed = _best_of(lambda: run(free_bundle, make_interner()), args.repeat)
+        print(
+            f"  {name:<18} peak {peak / 1e6:7.1f} MB  before encode {retained / 1e6:7.1f} MB"
+            f"  {elapsed * 1000:8.1f} ms ({rows} rows)"
+        )
+
+
+def bench_validate(args) -> None:
+    """Compare per-call schema lookups with the compiled row and columnar validators."""
+    from spec_loader import SpecLoader
+
+    loader = SpecLoader()
+    plan = loader.get_flatten_plan()
+    validator = loader.get_row_validator()
+    bundles = make_bundles(
+        args.bundles,
+        resources=args.resources,
+        datapoints_per_resource=args.datapoints,
+    )
+    batch = flatten_otlp_batch(bundles, plan)
+    rows = batch.rows()
+
+    def uncompiled():
+        # The schema walk validate_row_event did on every call before the validator was compiled
+        for row in rows:
+            required = loader.get_required_fields()
+            field_types = loader.get_field_types()
+            all(field in row for field in required) and field_types
+
+    print(f"bundles={args.bundles} rows={len(rows)} repeat={args.repeat}")
+    for name, fn in [
+        ("uncompiled per row", uncompiled),
+        ("compiled rows", lambda: validator.check_batch(rows)),
+        ("compiled rows+materialize", lambda: validator.check_batch(batch.rows())),
+        ("compiled columnar", lambda: validator.check_columnar(batch)),
+    ]:
+        elapsed = _best_of(fn, args.repeat)
+        print(f"  {name:<28} {elapsed * 1000:9.1f} ms  {len(rows) / elapsed:12,.0f} rows/s")
+
+
+class StubFirehose:
+    """Local stand-in for the Firehose client that accepts everything after a fixed latency."""
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000.0
+
+    def put_record_batch(self, DeliveryStreamName: str, Records: list) -> dict:
+        time.sleep(self.latency)
+        return {"FailedPutCount": 0}
+
+
+def bench_dispatch(args) -> None:
+    """Compare sequential and bounded-parallel PutRecordBatch dispatch against a stub."""
+    from handler import batch_to_firehose
+
+    rows = [b'{"metric": "bench", "value": 1}\n'] * (args.batches * 500)
+    client = StubFirehose(args.latency_ms)
+
+    print(f"batches={args.batches} latency={args.latency_ms:.0f}ms")
+    baseline = None
+    for max_in_flight in args.in_flight:
+        start = time.perf_counter()
+        batch_to_firehose(rows, "bench", max_in_flight=max_in_flight, firehose_client=client)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"  max_in_flight={max_in_flight:<3} {elapsed * 1000:9.1f} ms  "
+            f"speedup {baseline / elapsed:5.2f}x"
+        )
+
+
+def bench_processes(args) -> None:
+    """Find the bundle count where forked flatten workers start beating in-process flatten."""
+    import handler
+
+    print(f"workers={args.workers} cpus={os.cpu_count()} repeat={args.repeat}")
+    print(f"  {'bundles':>7} {'rows':>7} {'in-process':>11} {'processes':>11} {'speedup':>8}")
+    for count in args.bundle_counts:
+        entries = [
+            (f"bench-0:{i}", base64.b64encode(json.dumps(bundle).encode("utf-8")).decode("ascii"), None)
+            for i, bundle in enumerate(make_bundles(
+                count, resources=args.resources, datapoints_per_resource=args.datapoints
+            ))
+        ]
+        rows = handler._encode_kafka_chunk(entries).count(b"\n") - 1
+
+        in_process = _best_of(lambda: handler._encode_kafka_chunk(entries), args.repeat)
+        forked = _best_of(
+            lambda: list(handler.flatten_in_processes(entries, args.workers)), args.repeat
+        )
+        print(
+            f"  {count:>7} {rows:>7} {in_process * 1000:>9.1f}ms {forked * 1000:>9.1f}ms "
+            f"{in_process / forked:>7.2f}x"
+        )
+
+
+# Runs in a fresh interpreter: times the spec load alone, then the whole handler import
+_COLDSTART_SNIPPET = """
+import time
+start = time.perf_counter()
+from spec_loader import SpecLoader
+SpecLoader().get_flatten_plan()
+spec = time.perf_counter() - start
+import handler
+print(spec, time.perf_counter() - start)
+"""
+
+
+def _cold_import(env: dict) -> tuple:
+    """Time spec loading and the handler import in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-c", _COLDSTART_SNIPPET],
+        cwd=LAMBDA_DIR, env=env, check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return float(output[-2]), float(output[-1])
+
+
+def bench_coldstart(args) -> None:
+    """Compare cold-start import time with and without the prebuilt spec artifact."""
+    from build_spec import build_spec_artifact
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_path = Path(tmp) / "spec_artifact.json"
+        build_spec_artifact(output_path=artifact_path)
+
+        print(f"repeat={args.repeat} (fresh interpreter per run, best kept)")
+        for name, artifact in [("markdown+yaml", Path(tmp) / "missing.json"), ("artifact", artifact_path)]:
+            env = dict(os.environ, SPEC_ARTIFACT_PATH=str(artifact))
+            runs = [_cold_import(env) for _ in range(args.repeat)]
+            spec = min(run[0] for run in runs)
+            total = min(run[1] for run in runs)
+            print(f"  {name:<14} spec load {spec * 1000:7.1f} ms   handler import {total * 1000:7.1f} ms")
+
+
+# Runs in a fresh interpreter under -X importtime: imports the handler as the
+# Lambda init phase does (which also builds the Firehose client)
+_IMPORTTIME_SNIPPET = """
+import time
+start = time.perf_counter()
+import handler
+print(time.perf_counter() - start)
+"""
+
+
+def _parse_importtime(stderr: str) -> list:
+    """Parse -X importtime output into (module, depth, self_us, cumulative_us) tuples."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def bench_importtime(args) -> None:
+    """Profile the handler's init-phase imports and report the heaviest top-level modules."""
+    from build_spec import build_spec_artifact
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_path = Path(tmp) / "spec_artifact.json"
+        build_spec_artifact(output_path=artifact_path)
+        env = dict(
+            os.environ,
+            SPEC_ARTIFACT_PATH=str(artifact_path),
+            AWS_LAMBDA_FUNCTION_NAME="benchmark",
+            AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+        )
+        runs = []
+        for _ in range(args.repeat):
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", _IMPORTTIME_SNIPPET],
+                cwd=LAMBDA_DIR, env=env, check=True, capture_output=True, text=True,
+            )
+            runs.append((float(result.stdout.split()[-1]), _parse_importtime(result.stderr)))
+
+    init_seconds, modules = min(runs, key=lambda run: run[0])
+    # Direct imports of the interpreter and of the handler, heaviest first
+    top_level = sorted(
+        (module for module in modules if module[1] <= 1),
+        key=lambda module: module[3],
+        reverse=True,
+    )[:args.top]
+
+    print(f"repeat={args.repeat} (fresh interpreter per run, fastest kept)")
+    print(f"  handler init {init_seconds * 1000:.1f} ms, {len(modules)} modules imported")
+    print(f"  {'module':<28} {'cumulative':>11} {'self':>9}")
+    for name, _, self_us, cumulative_us in top_level:
+        print(f"  {name:<28} {cumulative_us / 1000:>9.1f}ms {self_us / 1000:>7.1f}ms")
+
+    profile = {
+        "python": sys.version.split()[0],
+        "init_ms": round(init_seconds * 1000, 1),
+        "modules": len(modules),
+        "top_level": [
+            {"module": name, "cumulative_ms": round(cumulative_us / 1000, 1)}
+            for name, _, _, cumulative_us in top_level
+        ],
+    }
+    if args.baseline and Path(args.baseline).exists():
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        baseline_ms = {entry["module"]: entry["cumulative_ms"] for entry in baseline["top_level"]}
+        print(f"  vs baseline {args.baseline} (python {baseline['python']}):")
+        print(
+            f"    init {profile['init_ms'] - baseline['init_ms']:+.1f} ms, "
+            f"modules {profile['modules'] - baseline['modules']:+d}"
+        )
+        # Top-level modules that are new or cost more than in the baseline
+        for entry in profile["top_level"]:
+            previous = baseline_ms.get(entry["module"])
+            if previous is None:
+                print(f"    {entry['module']:<26} new, {entry['cumulative_ms']:.1f} ms")
+            elif entry["cumulative_ms"] - previous >= 1.0:
+                print(f"    {entry['module']:<26} {entry['cumulative_ms'] - previous:+.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+            f.write("\n")
+        print(f"  wrote {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fan-out Lambda hot paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    flatten_parser = subparsers.add_parser("flatten", help="Per-row vs columnar flatten throughput")
+    flatten_parser.add_argument("--bundles", type=int, default=10, help="Bundles per batch")
+    flatten_parser.add_argument("--resources", type=int, default=10, help="Devices per bundle")
+    flatten_parser.add_argument("--datapoints", type=int, default=200, help="Datapoints per device")
+    flatten_parser.add_argument("--repeat", type=int, default=5, help="Runs per path (best is kept)")
+    flatten_parser.set_defaults(func=bench_flatten)
+
+    decode_parser = subparsers.add_parser("decode", help="Kafka value decode cost and peak memory")
+    decode_parser.add_argument("--bundles", type=int, default=10, help="Kafka records")
+    decode_parser.add_argument("--resources", type=int, default=10, help="Devices per bundle")
+    decode_parser.add_argument("--datapoints", type=int, default=200, help="Datapoints per device")
+    decode_parser.add_argument("--repeat", type=int, default=5, help="Runs per path (best is kept)")
+    decode_parser.set_defaults(func=bench_decode)
+
+    codec_parser = subparsers.add_parser("codec", help="stdlib vs orjson JSON codec backends")
+    codec_parser.add_argument("--bundles", type=int, default=10, help="Synthetic Kafka records")
+    codec_parser.add_argument("--resources", type=int, default=10, help="Devices per bundle")
+    codec_parser.add_argument("--datapoints", type=int, default=200, help="Datapoints per device")
+    codec_parser.add_argument("--repeat", type=int, default=5, help="Runs per path (best is kept)")
+    codec_parser.set_defaults(func=bench_codec)
+
+    resources_parser = subparsers.add_parser("resources", help="Warm resource fragment cache vs uncached flatten")
+    resources_parser.add_argument("--bundles", type=int, default=20, help="Kafka records (same devices each)")
+    resources_parser.add_argument("--resources", type=int, default=50, help="Devices per bundle")
+    resources_parser.add_argument("--datapoints", type=int, default=10, help="Datapoints per device")
+    resources_parser.add_argument("--properties", type=int, default=30, help="Extra resource attributes per device")
+    resources_parser.add_argument("--repeat", type=int, default=5, help="Runs per path (best is kept)")
+    resources_parser.set_defaults(func=bench_resources)
+
+    shapes_parser = subparsers.add_parser("shapes", help="Shape-specialized vs generic attribute extraction")
+    shapes_parser.add_argument("--bundles", type=int, default=10, help="Bundles per batch")
+    shapes_parser.add_argument("--resources", type=int, default=10, help="Devices per bundle")
+    shapes_parser.add_argument("--datapoints", type=int, default=200, help="Datapoints per device")
+    shapes_parser.add_argument("--repeat", type=int, default=5, help="Runs per path (best is kept)")
+    shapes_parser.set_defaults(func=bench_shapes)
+
+    timestamps_parser = subparsers.add_parser("timestamps", help="datetime vs cached RFC3339 timestamp formatting")
+    timestamps_parser.add_argument("--rows", type=int, default=100000, help="Timestamps formatted")
+    timestamps_parser.add_argument("--distinct", type=int, default=5, help="Distinct collection seconds")
+    timestamps_parser.add_argument("--repeat", type=int, default=5, help="Runs per path (best is kept)")
+    timestamps_parser.set_defaults(func=bench_timestamps)
+
+    memory_parser = subparsers.add_parser("memory", help="Traced memory of one large bundle, with and without interning")
+    memory_parser.add_argument("--resources", type=int, default=50, help="Devices in the bundle")
+    memory_parser.add_argument("--datapoints", type=int, default=400, help="Datapoints per device")
+    memory_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per variant (best is kept)")
+    memory_parser.set_defaults(func=bench_memory)
+
+    validate_parser = subparsers.add_parser("validate", help="Row validation cost per path")
+    validate_parser.add_argument("--bundles", type=int, default=10, help="Bundles per batch")
+    validate_parser.add_argument("--resources", type=int, default=10, help="Devices per bundle")
+    validate_parser.add_argument("--datapoints", type=int, default=200, help="Datapoints per device")
+    validate_parser.add_argument("--repeat", type=int, default=5, help="Runs per path (best is kept)")
+    validate_parser.set_defaults(func=bench_validate)
+
+    dispatch_parser = subparsers.add_parser(
+        "dispatch", help="Sequential vs parallel PutRecordBatch against a stub with latency"
+    )
+    dispatch_parser.add_argument("--batches", type=int, default=20, help="500-row batches to send")
+    dispatch_parser.add_argument("--latency-ms", type=float, default=50, help="Stub call latency")
+    dispatch_parser.add_argument(
+        "--in-flight", type=int, nargs="+", default=[1, 2, 4, 8], help="max_in_flight values"
+    )
+    dispatch_parser.set_defaults(func=bench_dispatch)
+
+    processes_parser = subparsers.add_parser(
+        "processes", help="Crossover of in-process vs forked flatten by bundle count"
+    )
+    processes_parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    processes_parser.add_argument(
+        "--bundle-counts", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32]
+    )
+    processes_parser.add_argument("--resources", type=int, default=5, help="Devices per bundle")
+    processes_parser.add_argument("--datapoints", type=int, default=200, help="Datapoints per device")
+    processes_parser.add_argument("--repeat", type=int, default=3, help="Runs per path (best is kept)")
+    processes_parser.set_defaults(func=bench_processes)
+
+    coldstart_parser = subparsers.add_parser(
+        "coldstart", help="Handler import time with and without the prebuilt spec artifact"
+    )
+    coldstart_parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per variant")
+    coldstart_parser.set_defaults(func=bench_coldstart)
+
+    importtime_parser = subparsers.add_parser(
+        "importtime", help="-X importtime profile of the handler init phase"
+    )
+    importtime_parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters (fastest kept)")
+    importtime_parser.add_argument("--top", type=int, default=15, help="Top-level modules to list")
+    importtime_parser.add_argument("--output", default=None, help="Write the profile as JSON to this path")
+    importtime_parser.add_argument(
+        "--baseline", default=str(IMPORTTIME_BASELINE),
+        help="Recorded profile to compare against (write a new one with --output)",
+    )
+    importtime_parser.set_defaults(func=bench_importtime)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Description: Compiles docs/kafka_ingest_spec.md into the JSON spec artifact shipped with the Lambda
+# Description: Lets the handler skip Markdown scanning and YAML parsing at cold start
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+LAMBDA_DIR = Path(__file__).parent.parent / "lambda"
+sys.path.insert(0, str(LAMBDA_DIR))
+
+from flatten import compile_flatten_plan  # noqa: E402
+from spec_loader import DEFAULT_ARTIFACT_PATH, SpecLoader  # noqa: E402
+
+
+def build_spec_artifact(spec_path: Path = None, output_path: Path = DEFAULT_ARTIFACT_PATH) -> dict:
+    """
+    Compile the spec and write the artifact as compact JSON.
+
+    Args:
+        spec_path: Path to kafka_ingest_spec.md (default: docs/kafka_ingest_spec.md)
+        output_path: Artifact destination (default: lambda/spec_artifact.json)
+
+    Returns:
+        The artifact that was written
+    """
+    loader = SpecLoader(spec_path=spec_path) if spec_path else SpecLoader(artifact_path="")
+    artifact = loader.build_artifact()
+    # Fail the build, not the Lambda, if the spec cannot be compiled into a plan
+    compile_flatten_plan(artifact["schema"])
+
+    output_path = Path(output_path)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, separators=(",", ":"), sort_keys=True, default=str)
+        f.write("\n")
+    return artifact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the prebuilt spec artifact for the Lambda")
+    parser.add_argument("--spec", default=None, help="Path to kafka_ingest_spec.md (default: docs/kafka_ingest_spec.md)")
+    parser.add_argument("--output", default=str(DEFAULT_ARTIFACT_PATH), help="Artifact path (default: lambda/spec_artifact.json)")
+
+    args = parser.parse_args()
+    artifact = build_spec_artifact(Path(args.spec) if args.spec else None, Path(args.output))
+    schema = artifact["schema"].get("schema", {})
+    print(
+        f"Wrote {args.output}: {schema.get('name')} v{schema.get('version')} "
+        f"({len(artifact['schema'].get('fields', []))} fields, spec sha256 {artifact['spec_sha256'][:12]})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ import boto3
 
 FIXTURE_PATH = Path(__file__).parent.parent / "tests" / "fixtures" / "otlp" / "otlp_bundle_ok.json"
 
+LAMBDA_DIR = Path(__file__).parent.parent / "lambda"
+
+# Content-type header sent with each format, so the Lambda need not sniff the payload
+CONTENT_TYPES = {"json": b"application/json", "protobuf": b"application/x-protobuf"}
+
 
 def load_fixture(fixture_path: str = None) -> dict:
     """Load OTLP fixture JSON from disk."""
@@ -22,12 +27,29 @@ def load_fixture(fixture_path: str = None) -> dict:
         return json.load(f)
 
 
+def serialize_payload(payload: dict, fmt: str = "json") -> bytes:
+    """
+    Serialize an OTLP bundle as a Kafka record value.
+
+    Args:
+        payload: OTLP/JSON bundle
+        fmt: "json" (OTLP/JSON) or "protobuf" (binary ExportMetricsServiceRequest)
+    """
+    if fmt == "protobuf":
+        sys.path.insert(0, str(LAMBDA_DIR))
+        from otlp_proto import encode_export_request
+
+        return encode_export_request(payload)
+    return json.dumps(payload).encode("utf-8")
+
+
 def publish_to_msk(
     bootstrap_servers: str,
     topic: str,
     payload: dict,
     count: int = 1,
     region: str = "us-east-1",
+    fmt: str = "json",
 ):
     """
     Publish OTLP bundles to MSK topic using the kafka-python library.
@@ -58,11 +80,12 @@ def publish_to_msk(
         ssl_certfile=cert_file,
         ssl_keyfile=key_file,
         ssl_cafile=ca_file,
-        value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+        value_serializer=lambda v: serialize_payload(v, fmt),
     )
+    headers = [("content-type", CONTENT_TYPES[fmt])]
 
     for i in range(count):
-        future = producer.send(topic, value=payload)
+        future = producer.send(topic, value=payload, headers=headers)
         result = future.get(timeout=30)
         print(f"[{i+1}/{count}] Sent to {topic} partition={result.partition} offset={result.offset}")
 
@@ -78,17 +101,19 @@ def main():
     parser.add_argument("--fixture", default=None, help="Path to OTLP fixture JSON (default: tests/fixtures/otlp/otlp_bundle_ok.json)")
     parser.add_argument("--count", type=int, default=1, help="Number of messages to publish")
     parser.add_argument("--region", default="us-east-1", help="AWS region")
+    parser.add_argument("--format", choices=sorted(CONTENT_TYPES), default="json", help="Record value encoding")
 
     args = parser.parse_args()
     payload = load_fixture(args.fixture)
 
-    print(f"Publishing to {args.bootstrap_servers} topic={args.topic}")
+    print(f"Publishing to {args.bootstrap_servers} topic={args.topic} format={args.format}")
     publish_to_msk(
         bootstrap_servers=args.bootstrap_servers,
         topic=args.topic,
         payload=payload,
         count=args.count,
         region=args.region,
+        fmt=args.format,
     )
 
 
@@ -0,0 +1,114 @@
+# Description: Re-ingest spilled row events from the S3 error bucket into Firehose
+# Description: Reads gzip NDJSON spill objects in parallel and sends them with the Lambda's batching and retries
+
+import argparse
+import gzip
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+
+LAMBDA_DIR = Path(__file__).parent.parent / "lambda"
+sys.path.insert(0, str(LAMBDA_DIR))
+
+from handler import batch_to_firehose  # noqa: E402
+
+
+def list_spill_objects(s3_client, bucket: str, prefix: str) -> list:
+    """List the keys of all spill objects under prefix, oldest key first."""
+    keys = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(
+            obj["Key"] for obj in page.get("Contents", []) if obj["Key"].endswith(".ndjson.gz")
+        )
+    return sorted(keys)
+
+
+def replay_object(
+    s3_client,
+    firehose_client,
+    bucket: str,
+    key: str,
+    stream_name: str,
+    delete: bool = False,
+) -> dict:
+    """
+    Send the rows of one spill object to Firehose.
+
+    Args:
+        s3_client: boto3 S3 client
+        firehose_client: boto3 Firehose client
+        bucket: Spill bucket name
+        key: Spill object key
+        stream_name: Firehose delivery stream name
+        delete: Delete the object once every row was delivered
+
+    Returns:
+        Summary dict with key, rows, failed_records and deleted
+    """
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    rows = gzip.decompress(body).splitlines(keepends=True)
+
+    result = batch_to_firehose(rows, stream_name, firehose_client=firehose_client)
+    deleted = False
+    if delete and result["failed_records"] == 0 and result["oversized_records"] == 0:
+        s3_client.delete_object(Bucket=bucket, Key=key)
+        deleted = True
+
+    return {
+        "key": key,
+        "rows": len(rows),
+        "failed_records": result["failed_records"] + result["oversized_records"],
+        "deleted": deleted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay spilled row events into Firehose")
+    parser.add_argument("--bucket", required=True, help="Spill (error/backup) bucket name")
+    parser.add_argument("--prefix", default="spill/", help="Key prefix to replay (e.g. spill/<topic-partition>/2026/)")
+    parser.add_argument("--stream", default="lm-datapublisher-delivery", help="Firehose delivery stream name")
+    parser.add_argument("--workers", type=int, default=8, help="Objects replayed concurrently")
+    parser.add_argument("--delete", action="store_true", help="Delete objects that were fully delivered")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the objects that would be replayed")
+    parser.add_argument("--region", default="us-east-1", help="AWS region")
+
+    args = parser.parse_args()
+    s3_client = boto3.client("s3", region_name=args.region)
+    firehose_client = boto3.client("firehose", region_name=args.region)
+
+    keys = list_spill_objects(s3_client, args.bucket, args.prefix)
+    print(f"Found {len(keys)} spill object(s) under s3://{args.bucket}/{args.prefix}")
+    if args.dry_run or not keys:
+        for key in keys:
+            print(f"  {key}")
+        return
+
+    total_rows = 0
+    total_failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(
+                replay_object, s3_client, firehose_client, args.bucket, key, args.stream, args.delete
+            )
+            for key in keys
+        ]
+        for future in futures:
+            summary = future.result()
+            total_rows += summary["rows"]
+            total_failed += summary["failed_records"]
+            status = "deleted" if summary["deleted"] else "kept"
+            print(
+                f"  {summary['key']}: rows={summary['rows']} "
+                f"failed={summary['failed_records']} ({status})"
+            )
+
+    print(f"Replayed {total_rows - total_failed}/{total_rows} row(s) from {len(keys)} object(s)")
+    if total_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()